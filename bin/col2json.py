@@ -1,67 +1,52 @@
 #!/usr/bin/env python2
 
 """
-Convert column-based data into the JSON format used by the Boltzmannizer.
+Convert column-based data into the JSON (or binary) format used by the
+Boltzmannizer.
+
+The data is streamed through a chunk at a time, so arbitrarily large inputs
+are converted in constant memory.
 """
 
 from argparse import ArgumentParser
 import fileinput
+import sys
+
+from boltzmannizer.science.level_files import BinaryLevelWriter, JSONLevelWriter, read_columns
 
 
 # Parse the arguments.
 parser = ArgumentParser()
 parser.add_argument('energies', type=int, help='one-based index of the energies column')
 parser.add_argument('degeneracies', type=int, help='one-based index of the degeneracies column')
+parser.add_argument('files', metavar='file', nargs='*', help='column data (default: standard input)')
+parser.add_argument('--k_B', type=float, default=0.695031, help='Boltzmann constant in units of energy/temperature (default: %(default)s)')
+parser.add_argument('--energy-units', default='cm^-1', help='units of energy (default: %(default)s)')
+parser.add_argument('--temperature-units', default='K', help='units of temperature (default: %(default)s)')
+parser.add_argument('--no-units', action='store_true', help="don't record any units")
+parser.add_argument('--binary', action='store_true', help='write the binary level format (requires --output)')
+parser.add_argument('--output', '-o', help='output file (default: standard output)')
 
 args = parser.parse_args()
 
+if args.binary and args.output is None:
+	parser.error('--binary requires --output')
+
 # Convert to zero-based.
 col_energies = args.energies - 1
 col_degeneracies = args.degeneracies - 1
 
+if args.no_units:
+	units = None
+else:
+	units = {'energy': args.energy_units, 'temperature': args.temperature_units}
 
-# Collect the data.
-energies = []
-degeneracies = []
-
-for line in fileinput.input('-'):
-	cols = line.split()
-
-	if not cols:
-		# Skip empty lines.
-		continue
-
-	e, d = cols[col_energies], cols[col_degeneracies]
-
-	if energies and e == energies[-1]:
-		# Combine degenerate levels.
-		degeneracies[-1] = str(int(degeneracies[-1]) + int(d))
-	else:
-		energies.append(e)
-		degeneracies.append(d)
-
-
-# Output the JSON file.
-#
-# Not using a serializer here to preserve the order and shape of the output.
-# The units are hard-coded for the time being, but it doesn't need to be that
-# way.
-print '''{ "format_version": 1
-, "k_B": 0.695031
-, "units": { "energy": "cm^-1"
-           , "temperature": "K"
-           }
-, "levels": [''',
-
-first = True
-
-for e, d in zip(energies, degeneracies):
-	if not first:
-		print '            ,',
-	else:
-		first = False
 
-	print '[{0}, {1}]'.format(e, d)
+if args.binary:
+	writer = BinaryLevelWriter(args.output, args.k_B, units)
+else:
+	writer = JSONLevelWriter(args.output if args.output is not None else sys.stdout, args.k_B, units)
 
-print '            ]'
-print '}'
+with writer:
+	for energies, degeneracies in read_columns(fileinput.input(args.files or ['-']), col_energies, col_degeneracies):
+		writer.write(energies, degeneracies)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python2
+
+"""
+Convert level files between the JSON and binary formats used by the
+Boltzmannizer.
+"""
+
+from argparse import ArgumentParser
+
+from boltzmannizer.science.level_files import convert, is_binary
+
+
+# Parse the arguments.
+parser = ArgumentParser()
+parser.add_argument('input', help='path to a JSON or binary level file')
+parser.add_argument('output', help='path to the converted level file')
+parser.add_argument('--to', choices=['json', 'binary'], help='output format (default: whichever the input is not)')
+
+args = parser.parse_args()
+
+if args.to is not None:
+	binary = args.to == 'binary'
+else:
+	binary = not is_binary(args.input)
+
+convert(args.input, args.output, binary)
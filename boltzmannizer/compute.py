@@ -0,0 +1,177 @@
+"""
+Evaluate thermodynamic quantities for level files without the GUI.
+
+This module must not import anything from boltzmannizer.gui, so that it
+starts quickly and runs without a display.
+"""
+
+from argparse import ArgumentParser
+import csv
+import sys
+
+import numpy as N
+
+from boltzmannizer.science.batch import DEFAULT_QUANTITIES, evaluate_files, QUANTITIES
+from boltzmannizer.science.decimation import min_max_indices
+
+
+def temperature_grid(linear=None, log=None, explicit=None):
+	"""
+	1D array of temperatures, given exactly one of:
+	  linear: (start, stop, num) for evenly spaced temperatures.
+	  log: (start, stop, num) for logarithmically spaced temperatures, with
+	    start and stop positive.
+	  explicit: Sequence of temperatures.
+	"""
+
+	if sum(x is not None for x in [linear, log, explicit]) != 1:
+		raise ValueError('Exactly one kind of grid must be given')
+
+	if linear is not None:
+		start, stop, num = linear
+
+		return N.linspace(start, stop, int(num))
+	elif log is not None:
+		start, stop, num = log
+
+		if start <= 0 or stop <= 0:
+			raise ValueError('Logarithmic grids must have positive temperatures')
+
+		return N.logspace(N.log10(start), N.log10(stop), int(num))
+	else:
+		return N.array(explicit, dtype=float)
+
+def compute(paths, Ts, quantities=DEFAULT_QUANTITIES, processes=None):
+	"""
+	Evaluate quantities for each of the files at temperatures Ts.
+
+	Returns (values, errors), where values maps each quantity to a
+	(files x temperatures) array, with NaN for files that failed, and errors
+	maps the paths of those files to their exceptions.
+	"""
+
+	values = dict((q, N.repeat(N.nan, len(paths) * len(Ts)).reshape((len(paths), len(Ts)))) for q in quantities)
+	errors = {}
+
+	rows = {}
+
+	for i, path in enumerate(paths):
+		rows.setdefault(path, []).append(i)
+
+	# Each distinct file only needs to be evaluated once.
+	for result in evaluate_files(list(rows), Ts, quantities=quantities, processes=processes):
+		if result.error is not None:
+			errors[result.path] = result.error
+
+			continue
+
+		for q in quantities:
+			values[q][rows[result.path]] = result.values[q]
+
+	return values, errors
+
+def write_csv(f, paths, Ts, quantities, values, errors=None):
+	"""
+	Write a table with a row for each file and temperature, leaving out the
+	files in errors.
+	"""
+
+	if errors is None:
+		errors = {}
+
+	writer = csv.writer(f)
+	writer.writerow(['file', 'T'] + list(quantities))
+
+	for i, path in enumerate(paths):
+		if path in errors:
+			continue
+
+		for j, T in enumerate(Ts):
+			writer.writerow([path, T] + [values[q][i, j] for q in quantities])
+
+def write_npz(path, paths, Ts, quantities, values):
+	"""
+	Write the arrays T, files, and one (files x temperatures) array per
+	quantity.
+	"""
+
+	arrays = dict((q, values[q]) for q in quantities)
+
+	N.savez(path, T=Ts, files=N.array(paths), **arrays)
+
+def main(argv=None):
+	"""
+	Run the command line interface, returning the exit status.
+	"""
+
+	parser = ArgumentParser(prog='boltzmannizer compute',
+			description='Evaluate thermodynamic quantities for level files.')
+	parser.add_argument('files', metavar='file', nargs='+', help='JSON or binary level file')
+
+	grid = parser.add_mutually_exclusive_group(required=True)
+	grid.add_argument('--linear', nargs=3, type=float, metavar=('START', 'STOP', 'NUM'),
+			help='evenly spaced temperatures')
+	grid.add_argument('--log', nargs=3, type=float, metavar=('START', 'STOP', 'NUM'),
+			help='logarithmically spaced temperatures')
+	grid.add_argument('--temperatures', nargs='+', type=float, metavar='T',
+			help='explicit temperatures')
+
+	parser.add_argument('--quantities', nargs='+', choices=QUANTITIES, default=list(DEFAULT_QUANTITIES),
+			help='quantities to evaluate (default: %(default)s)')
+	parser.add_argument('--output', '-o', default='-',
+			help='output file (default: standard output)')
+	parser.add_argument('--format', choices=['csv', 'npz'],
+			help='output format (default: npz for .npz files, otherwise csv)')
+	parser.add_argument('--processes', type=int,
+			help='number of worker processes (default: one per CPU)')
+	parser.add_argument('--decimate', type=int, metavar='BINS',
+			help='only keep the temperatures needed to draw the curves at a width of BINS columns (such as pixels)')
+
+	args = parser.parse_args(argv)
+
+	if args.format is not None:
+		output_format = args.format
+	else:
+		output_format = 'npz' if args.output.endswith('.npz') else 'csv'
+
+	if output_format == 'npz' and args.output == '-':
+		parser.error('NPZ output needs a file')
+
+	try:
+		Ts = temperature_grid(linear=args.linear, log=args.log, explicit=args.temperatures)
+	except ValueError as e:
+		parser.error(str(e))
+
+	if args.decimate is not None:
+		if args.decimate < 1:
+			parser.error('BINS must be positive')
+
+		if N.any(N.diff(Ts) <= 0):
+			parser.error('Decimation needs increasing temperatures')
+
+	values, errors = compute(args.files, Ts, quantities=args.quantities, processes=args.processes)
+
+	if args.decimate is not None:
+		# The same temperatures for every curve, so that the table stays
+		# rectangular.
+		keep = min_max_indices(Ts, N.concatenate([values[q] for q in args.quantities]), args.decimate)
+
+		Ts = Ts[keep]
+		values = dict((q, values[q][:, keep]) for q in args.quantities)
+
+	for path in sorted(errors):
+		print >>sys.stderr, '{0}: {1}'.format(path, errors[path])
+
+	if output_format == 'npz':
+		write_npz(args.output, args.files, Ts, args.quantities, values)
+	elif args.output == '-':
+		write_csv(sys.stdout, args.files, Ts, args.quantities, values, errors)
+	else:
+		with open(args.output, 'wb') as f:
+			write_csv(f, args.files, Ts, args.quantities, values, errors)
+
+	return 1 if errors else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
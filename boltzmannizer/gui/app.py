@@ -4,9 +4,10 @@ from functools import partial
 
 import wx
 
-from boltzmannizer.gui.plot import PlotFrame2DByTemperature, PlotFrame3DPopulation
+from boltzmannizer.gui.plot import PlotFrame2DByTemperature, PlotFrame3DPopulation, PlotFramePopulationMap
 from boltzmannizer.gui.utils import DataPanel
 from boltzmannizer.science.boltzmann_distribution import BoltzmannDistribution
+from boltzmannizer.tools.background import BackgroundRunner
 from boltzmannizer.tools.misc import Reserver
 
 
@@ -34,6 +35,9 @@ class MainFrame(wx.Frame):
 	# Yellow is awful, but we've run out of colors at this point!
 	OVERFLOW_COLOR = 'yellow'
 
+	# Number of files loaded at the same time.
+	LOAD_THREADS = 4
+
 	def __init__(self, paths=None):
 		wx.Frame.__init__(self, None, title='Boltzmannizer', size=(600, 400))
 
@@ -53,6 +57,15 @@ class MainFrame(wx.Frame):
 		self.plot_frames_2D = {}
 		self.plot_frames_3D = {}
 
+		# Files are loaded in the background, with the results handled back on
+		# the UI thread.
+		self.loader = BackgroundRunner(self.LOAD_THREADS, dispatch=wx.CallAfter)
+
+		# Loads in progress, as (task, path, color), and how many have finished
+		# since the last time there were none.
+		self._loads = []
+		self._num_loaded = 0
+
 		# Menu.
 		menuBar = wx.MenuBar()
 
@@ -63,6 +76,10 @@ class MainFrame(wx.Frame):
 		item = menu.Append(wx.ID_OPEN, '&Add data\tCtrl+O')
 		self.Bind(wx.EVT_MENU, self.OnMenuFileOpen, item)
 
+		### Cancel loading.
+		item = menu.Append(wx.ID_ANY, 'Cancel &loading\tEsc')
+		self.Bind(wx.EVT_MENU, self.OnMenuFileCancelLoading, item)
+
 		menuBar.Append(menu, '&File')
 
 		## Edit.
@@ -101,6 +118,10 @@ class MainFrame(wx.Frame):
 		item = menu.Append(wx.ID_ANY, '&Populations\tCtrl+P')
 		self.Bind(wx.EVT_MENU, self.OnMenuPlotPopulations, item)
 
+		### Population map.
+		item = menu.Append(wx.ID_ANY, 'Population &map\tCtrl+M')
+		self.Bind(wx.EVT_MENU, self.OnMenuPlotPopulationMap, item)
+
 		menu.AppendSeparator()
 
 		### Close all.
@@ -111,6 +132,9 @@ class MainFrame(wx.Frame):
 
 		self.SetMenuBar(menuBar)
 
+		# Status bar, for loading progress.
+		self.CreateStatusBar()
+
 		# Frame.
 		frame_box = wx.BoxSizer(wx.VERTICAL)
 
@@ -122,6 +146,10 @@ class MainFrame(wx.Frame):
 			# Clear the color for someone else to use.
 			self.color_reserver.free(bd.color)
 
+			# Don't keep its curves around either.
+			for frame in self.plot_frames_2D.values():
+				frame.forget(bd)
+
 		columns = [
 				('Filename', None),
 				('Levels', 50),
@@ -144,7 +172,7 @@ class MainFrame(wx.Frame):
 			self._load_multiple_data(paths)
 
 	def OnMenuFileOpen(self, evt):
-		wildcard = 'JSON (*.json)|*.json|All files|*'
+		wildcard = 'JSON (*.json)|*.json|Binary (*.bin)|*.bin|All files|*'
 		dialog = wx.FileDialog(self, 'Add data', wildcard=wildcard, style=wx.FD_OPEN|wx.FD_FILE_MUST_EXIST|wx.MULTIPLE)
 
 		if dialog.ShowModal() != wx.ID_OK:
@@ -152,6 +180,9 @@ class MainFrame(wx.Frame):
 
 		self._load_multiple_data(dialog.GetPaths())
 
+	def OnMenuFileCancelLoading(self, evt):
+		self._cancel_loading()
+
 	def OnMenuEditSelectAll(self, evt):
 		self.dp.select_all()
 
@@ -169,43 +200,23 @@ class MainFrame(wx.Frame):
 		self._plot_values_heat_capacity(partial(self._make_plot_2D, 'Heat capacity', 1))
 
 	def OnMenuPlotPopulations(self, evt):
-		for i in self.dp.selected:
-			bd = self.dp.objects[i]
-
-			xlabel = r'$T$'
-			ylabel = r'$E$'
-
-			if bd.units is not None:
-				xlabel += ' / ' + bd.units['temperature']
-
-			if bd.units is not None:
-				ylabel += ' / ' + bd.units['energy']
-
-			plot_frame = PlotFrame3DPopulation('Populations: {0}'.format(bd.filename))
-			plot_frame.plot_data(bd, xlabel=xlabel, ylabel=ylabel, zlabel=r'$P$')
-			plot_frame.Show()
-
-			def remove_frame():
-				if self:
-					try:
-						del self.plot_frames_3D[id(plot_frame)]
-					except KeyError:
-						pass
-
-			plot_frame.close_callback = remove_frame
+		self._plot_populations(PlotFrame3DPopulation, 'Populations')
 
-			self.plot_frames_3D[id(plot_frame)] = plot_frame
+	def OnMenuPlotPopulationMap(self, evt):
+		self._plot_populations(PlotFramePopulationMap, 'Population map')
 
 	def OnMenuPlotCloseAll(self, evt):
 		self._close_all_plot_frames()
 
 	def OnClose(self, evt):
+		self._cancel_loading()
+		self.loader.close()
+
 		self._close_all_plot_frames()
 
 		evt.Skip()
 
 	def _plot_values_energy(self, callback):
-		fs = []
 		bds = []
 
 		units_energy = []
@@ -221,7 +232,6 @@ class MainFrame(wx.Frame):
 				units_energy.append('')
 				units_temperature.append('')
 
-			fs.append(bd.energy)
 			bds.append(bd)
 
 		units_energy = self._combine_units(units_energy)
@@ -237,10 +247,9 @@ class MainFrame(wx.Frame):
 		else:
 			ylabel = r'$U$'
 
-		callback(fs, bds, xlabel=xlabel, ylabel=ylabel)
+		callback('energy', bds, xlabel=xlabel, ylabel=ylabel)
 
 	def _plot_values_entropy(self, callback):
-		fs = []
 		bds = []
 
 		units_energy = []
@@ -256,7 +265,6 @@ class MainFrame(wx.Frame):
 				units_energy.append('')
 				units_temperature.append('')
 
-			fs.append(bd.entropy)
 			bds.append(bd)
 
 		units_energy = self._combine_units(units_energy)
@@ -272,10 +280,9 @@ class MainFrame(wx.Frame):
 		else:
 			ylabel = r'$S$'
 
-		callback(fs, bds, xlabel=xlabel, ylabel=ylabel)
+		callback('entropy', bds, xlabel=xlabel, ylabel=ylabel)
 
 	def _plot_values_heat_capacity(self, callback):
-		fs = []
 		bds = []
 
 		units_energy = []
@@ -291,7 +298,6 @@ class MainFrame(wx.Frame):
 				units_energy.append('')
 				units_temperature.append('')
 
-			fs.append(bd.heat_capacity)
 			bds.append(bd)
 
 		units_energy = self._combine_units(units_energy)
@@ -307,7 +313,7 @@ class MainFrame(wx.Frame):
 		else:
 			ylabel = r'$C_V$'
 
-		callback(fs, bds, xlabel=xlabel, ylabel=ylabel)
+		callback('heat_capacity', bds, xlabel=xlabel, ylabel=ylabel)
 
 	def _make_plot_2D(self, name, min_temp, *args, **kwargs):
 		"""
@@ -330,21 +336,64 @@ class MainFrame(wx.Frame):
 
 		self.plot_frames_2D[name] = plot_frame
 
+	def _plot_populations(self, frame_class, title):
+		"""
+		Make a population plot window of the given kind for each selected
+		dataset.
+		"""
+
+		for i in self.dp.selected:
+			bd = self.dp.objects[i]
+
+			xlabel = r'$T$'
+			ylabel = r'$E$'
+
+			if bd.units is not None:
+				xlabel += ' / ' + bd.units['temperature']
+
+			if bd.units is not None:
+				ylabel += ' / ' + bd.units['energy']
+
+			plot_frame = frame_class('{0}: {1}'.format(title, bd.filename))
+			plot_frame.plot_data(bd, xlabel=xlabel, ylabel=ylabel, zlabel=r'$P$')
+			plot_frame.Show()
+
+			# Bind the frame now, rather than the last one made in the loop.
+			def remove_frame(plot_frame=plot_frame):
+				if self:
+					try:
+						del self.plot_frames_3D[id(plot_frame)]
+					except KeyError:
+						pass
+
+			plot_frame.close_callback = remove_frame
+
+			self.plot_frames_3D[id(plot_frame)] = plot_frame
+
 	def _load_data(self, path):
 		"""
-		Add the data in the file at the given path.
+		Start loading the data in the file at the given path in the background.
 		"""
 
 		color = self.color_reserver.allocate()
 
-		try:
-			bd = BoltzmannDistributionGUI.from_file(color, path)
-		except Exception as exc:
-			dlg = wx.MessageDialog(None, '{0}: {1}'.format(path, exc), 'Error loading file', wx.OK|wx.ICON_EXCLAMATION)
-			dlg.ShowModal()
-			dlg.Destroy()
+		load = [None, path, color]
+		load[0] = self.loader.submit(BoltzmannDistributionGUI.from_file, (color, path),
+				on_success=partial(self._add_data, load), on_error=partial(self._load_failed, load))
 
-			return
+		self._loads.append(load)
+		self._update_status()
+
+	def _load_multiple_data(self, paths):
+		for path in paths:
+			self._load_data(path)
+
+	def _add_data(self, load, bd):
+		"""
+		Add a row for data which has finished loading.
+		"""
+
+		self._finish_load(load)
 
 		# Make k_B more presentable, with units if they exist.
 		k_B = [str(bd.k_B)]
@@ -356,9 +405,53 @@ class MainFrame(wx.Frame):
 
 		index, key = self.dp.AddRow([bd.filename, levels, states, ' '.join(k_B)], bd)
 
-	def _load_multiple_data(self, paths):
-		for path in paths:
-			self._load_data(path)
+	def _load_failed(self, load, exc):
+		_, path, color = load
+
+		self._finish_load(load)
+		self.color_reserver.free(color)
+
+		dlg = wx.MessageDialog(None, '{0}: {1}'.format(path, exc), 'Error loading file', wx.OK|wx.ICON_EXCLAMATION)
+		dlg.ShowModal()
+		dlg.Destroy()
+
+	def _finish_load(self, load):
+		self._loads.remove(load)
+		self._num_loaded += 1
+
+		self._update_status(load[1])
+
+	def _cancel_loading(self):
+		"""
+		Abandon all the files still being loaded.
+		"""
+
+		self.loader.cancel_all()
+
+		for _, path, color in self._loads:
+			self.color_reserver.free(color)
+
+		self._loads = []
+		self._update_status()
+
+	def _update_status(self, last_path=None):
+		"""
+		Show how far along the loading is.
+		"""
+
+		if not self._loads:
+			self._num_loaded = 0
+			self.SetStatusText('')
+
+			return
+
+		total = self._num_loaded + len(self._loads)
+		status = 'Loaded {0} of {1} files'.format(self._num_loaded, total)
+
+		if last_path is not None:
+			status += ' (last: {0})'.format(last_path)
+
+		self.SetStatusText(status + '; Esc to cancel')
 
 	def _redraw_plots(self):
 		for name, frame in self.plot_frames_2D.items():
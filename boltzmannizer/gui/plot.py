@@ -1,26 +1,55 @@
 from __future__ import division
 
-import matplotlib
-matplotlib.use('WXAgg')
-
-from matplotlib.cm import jet
-from matplotlib.collections import PolyCollection
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as Canvas
-
-# Allows us to use the 3D projection.
-from mpl_toolkits.mplot3d import Axes3D
+from functools import partial
 
 import numpy as N
 
 import wx
 from wx.lib.intctrl import IntCtrl
 
+from boltzmannizer.science.decimation import decimate
+from boltzmannizer.science.ensemble import BoltzmannEnsemble
+from boltzmannizer.science.population_map import midpoint_edges, population_map
+from boltzmannizer.science.sampling import adaptive_temperatures
+from boltzmannizer.tools.background import BackgroundRunner
+
+
+# matplotlib is slow to import, so this is put off until the first plot is
+# made (see _import_matplotlib).
+Figure = None
+Canvas = None
+
+
+def _import_matplotlib():
+	"""
+	Import the parts of matplotlib needed by every plot, once.
+	"""
+
+	global Figure, Canvas
+
+	if Figure is not None:
+		return
+
+	import matplotlib
+	matplotlib.use('WXAgg')
+
+	from matplotlib.figure import Figure
+	from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as Canvas
+
+
+class _Superseded(Exception):
+	"""
+	A computation was abandoned because its result is no longer wanted.
+	"""
+
+	pass
+
 
 class PlotPanel2DByTemperature(wx.Panel):
 	DEFAULT_MIN_TEMP = 0
 	DEFAULT_MAX_TEMP = 2000
-	NUM_TEMPS = 200
+	# Most temperatures at which to evaluate each plot.
+	MAX_EVALUATIONS = 200
 
 	def __init__(self, parent, min_temp=None):
 		wx.Panel.__init__(self, parent)
@@ -30,10 +59,28 @@ class PlotPanel2DByTemperature(wx.Panel):
 
 		self.data_cache = None
 
+		# Curves are computed in the background, one plot at a time. Each
+		# request gets a new generation, and only the result of the latest one
+		# is drawn.
+		self.runner = BackgroundRunner(1, dispatch=wx.CallAfter)
+		self._generation = 0
+
+		# Line for each dataset ever plotted (keyed by id), as [line, bd,
+		# (quantity, min_temp, max_temp) that its data is for, full resolution
+		# temperatures, full resolution values]. Lines of unchecked datasets
+		# are hidden rather than removed, so that checking them again is free.
+		#
+		# The lines themselves only have as many points as can be seen at the
+		# width of the axes, and are decimated again when that or the view
+		# changes.
+		self._lines = {}
+		self._labels = (None, None)
+
 		# Panel.
 		panel_box = wx.BoxSizer(wx.VERTICAL)
 
 		## Canvas.
+		_import_matplotlib()
 		self.figure = Figure()
 		self.canvas = Canvas(self, -1, self.figure)
 		self.axes = None
@@ -41,45 +88,190 @@ class PlotPanel2DByTemperature(wx.Panel):
 
 		self.SetSizer(panel_box)
 
-	def plot_data(self, fs, bds, xlabel=None, ylabel=None):
+		self.canvas.mpl_connect('resize_event', self.OnResize)
+
+	def OnResize(self, evt):
+		self._redecimate()
+
+	def OnXLimChanged(self, axes):
+		self._redecimate()
+
+	def plot_data(self, quantity, bds, xlabel=None, ylabel=None):
+		"""
+		Plot a quantity as a function of temperature.
+
+		quantity: Name of a BoltzmannEnsemble method (such as 'energy').
+		bds: BoltzmannDistributions to plot.
+		*label: Axis labels.
+
+		Only what has changed since the last call is redrawn: lines of datasets
+		no longer given are hidden, and only the curves of datasets which are
+		new (or whose curves are for another temperature range) are computed.
+		That happens in the background, and the lines are updated once it's
+		done, unless another plot has been requested in the meantime.
+		"""
+
 		self.data_cache = {
-				'fs': fs,
+				'quantity': quantity,
 				'bds': bds,
 				'xlabel': xlabel,
 				'ylabel': ylabel,
 				}
 
-		if self.axes is not None:
-			self.figure.delaxes(self.axes)
-			self.axes = None
+		if self.axes is None:
+			self.axes = self.figure.add_subplot(111)
+			self.axes.callbacks.connect('xlim_changed', self.OnXLimChanged)
+
+		if (xlabel, ylabel) != self._labels:
+			self._labels = (xlabel, ylabel)
+
+			self.axes.set_xlabel(xlabel if xlabel is not None else '')
+			self.axes.set_ylabel(ylabel if ylabel is not None else '')
+			self.figure.tight_layout()
+
+		data_key = (quantity, self.min_temp, self.max_temp)
+		wanted = set(id(bd) for bd in bds)
+
+		for key, (line, bd, line_data_key, _, _) in self._lines.items():
+			if key not in wanted:
+				if line_data_key != data_key:
+					# Not worth keeping around.
+					line.remove()
+					del self._lines[key]
+				else:
+					line.set_visible(False)
+
+		stale = []
+
+		for bd in bds:
+			try:
+				line, _, line_data_key, _, _ = self._lines[id(bd)]
+			except KeyError:
+				stale.append(bd)
+			else:
+				if line_data_key == data_key:
+					line.set_visible(True)
+				else:
+					stale.append(bd)
+
+		self._update_view()
+
+		# Anything still in flight is out of date, but the stale curves include
+		# whatever it was computing.
+		self._generation += 1
+		self.runner.cancel_all()
+
+		if stale:
+			self.runner.submit(self._compute, (self._generation, quantity, stale, self.min_temp, self.max_temp),
+					on_success=partial(self._update_lines, self._generation, data_key, stale),
+					on_error=self._compute_failed)
+
+	def _compute(self, generation, quantity, bds, min_temp, max_temp):
+		"""
+		Evaluate the curves, on a worker thread.
+		"""
 
-		self.axes = self.figure.add_subplot(111)
+		f = getattr(BoltzmannEnsemble(bds), quantity)
 
-		if xlabel is not None:
-			self.axes.set_xlabel(xlabel)
+		def checked(Ts):
+			# Give up between rounds of refinement once a newer plot has been
+			# requested.
+			if generation != self._generation:
+				raise _Superseded()
 
-		if ylabel is not None:
-			self.axes.set_ylabel(ylabel)
+			return f(Ts)
+
+		# Evaluate all the curves at once, on temperatures placed where they
+		# are most needed.
+		return adaptive_temperatures(checked, min_temp, max_temp, max_evaluations=self.MAX_EVALUATIONS)
+
+	def _update_lines(self, generation, data_key, bds, curves):
+		"""
+		Put computed curves into the lines of their datasets, on the UI thread.
+		"""
+
+		if not self or generation != self._generation:
+			return
+
+		xs, yss = curves
+
+		for ys, bd in zip(yss, bds):
+			try:
+				line = self._lines[id(bd)][0]
+			except KeyError:
+				# The data is filled in along with the view.
+				line, = self.axes.plot([], [], color=bd.color)
+
+				if bd.filename is not None:
+					line.set_label(bd.filename)
+			else:
+				line.set_visible(True)
+
+			self._lines[id(bd)] = [line, bd, data_key, xs, ys]
 
-		do_legend = False
+		self._update_view()
 
-		for f, bd in zip(fs, bds):
-			label, color = bd.filename, bd.color
+	def _update_view(self):
+		"""
+		Fit the axes and legend to the visible lines, and redraw when idle.
+		"""
 
-			if not do_legend and label is not None:
-				do_legend = True
+		# Fit to the whole of each curve, rather than what was in view; fitting
+		# the view then decimates them for it again.
+		num_columns = self._num_columns()
 
-			xs = self._gen_temps()
-			ys = [f(x) for x in xs]
+		for line, _, _, xs, ys in self._lines.values():
+			if line.get_visible():
+				line.set_data(*decimate(xs, ys, num_columns))
 
-			self.axes.plot(xs, ys, label=label, color=color)
+		self.axes.relim(visible_only=True)
+		self.axes.autoscale_view()
 
-		if do_legend:
+		# In the order that the datasets were given.
+		lines = [self._lines[id(bd)][0] for bd in self.data_cache['bds'] if id(bd) in self._lines]
+		# Matplotlib leaves out labels starting with an underscore.
+		labelled = [line for line in lines if line.get_visible() and not line.get_label().startswith('_')]
+
+		if labelled:
 			# Put the legend in the top-right corner, outside the axes.
-			self.axes.legend(bbox_to_anchor=(0, 0, 1, 1), bbox_transform=self.figure.transFigure)
+			self.axes.legend(labelled, [line.get_label() for line in labelled],
+					bbox_to_anchor=(0, 0, 1, 1), bbox_transform=self.figure.transFigure)
+		else:
+			self.axes.legend_ = None
 
-		self.figure.tight_layout()
-		self.canvas.draw()
+		self.canvas.draw_idle()
+
+	def _num_columns(self):
+		"""
+		Width of the axes in pixels.
+		"""
+
+		return max(1, int(self.axes.bbox.width))
+
+	def _redecimate(self):
+		"""
+		Decimate the lines afresh from their full resolution data, for the
+		current view and size.
+		"""
+
+		if self.axes is None or not self._lines:
+			return
+
+		num_columns = self._num_columns()
+		x_range = self.axes.get_xlim()
+
+		for line, _, _, xs, ys in self._lines.values():
+			line.set_data(*decimate(xs, ys, num_columns, x_range=x_range))
+
+		self.canvas.draw_idle()
+
+	def _compute_failed(self, exc):
+		if not self or isinstance(exc, _Superseded):
+			return
+
+		dlg = wx.MessageDialog(None, str(exc), 'Error computing plot', wx.OK|wx.ICON_EXCLAMATION)
+		dlg.ShowModal()
+		dlg.Destroy()
 
 	def plot_cached_data(self):
 		dc = self.data_cache
@@ -87,15 +279,29 @@ class PlotPanel2DByTemperature(wx.Panel):
 		if dc is None:
 			return
 
-		self.plot_data(dc['fs'], dc['bds'], xlabel=dc['xlabel'], ylabel=dc['ylabel'])
+		self.plot_data(dc['quantity'], dc['bds'], xlabel=dc['xlabel'], ylabel=dc['ylabel'])
 
 	def set_max_temp(self, temp):
 		self.max_temp = temp
 
 		self.plot_cached_data()
 
-	def _gen_temps(self):
-		return N.linspace(self.min_temp, self.max_temp, self.NUM_TEMPS)
+	def forget(self, bd):
+		"""
+		Drop everything kept for a dataset, once it's gone for good.
+		"""
+
+		try:
+			line = self._lines.pop(id(bd))[0]
+		except KeyError:
+			return
+
+		line.remove()
+
+		if self.data_cache is not None:
+			self.data_cache['bds'] = [x for x in self.data_cache['bds'] if x is not bd]
+
+		self._update_view()
 
 
 class PlotFrame2DByTemperature(wx.Frame):
@@ -143,6 +349,8 @@ class PlotFrame2DByTemperature(wx.Frame):
 		self.Bind(wx.EVT_CLOSE, self.OnClose)
 
 	def OnClose(self, evt):
+		self.panel.runner.close()
+
 		if self.close_callback is not None:
 			self.close_callback()
 
@@ -164,15 +372,31 @@ class PlotFrame2DByTemperature(wx.Frame):
 	def plot_data(self, *args, **kwargs):
 		self.panel.plot_data(*args, **kwargs)
 
+	def forget(self, bd):
+		self.panel.forget(bd)
+
 
 class PlotPanel3DPopulation(wx.Panel):
+	# Shortest time between redraws while rotating, in milliseconds.
+	REDRAW_INTERVAL = 40
+	# Most levels and temperatures drawn while rotating.
+	PREVIEW_LEVELS = 40
+	PREVIEW_TEMPS = 50
+
 	def __init__(self, parent):
 		wx.Panel.__init__(self, parent)
 
+		# The full plot and a cheaper stand-in for it, shown while rotating.
+		self.poly = None
+		self.preview_poly = None
+
+		self._dragging = False
+
 		# Panel.
 		panel_box = wx.BoxSizer(wx.VERTICAL)
 
 		## Canvas.
+		_import_matplotlib()
 		self.figure = Figure()
 		self.canvas = Canvas(self, -1, self.figure)
 		self.axes = None
@@ -180,15 +404,69 @@ class PlotPanel3DPopulation(wx.Panel):
 
 		self.SetSizer(panel_box)
 
-	def plot_data(self, bd, cm=jet, xlabel=None, ylabel=None, zlabel=None):
+		# Redraw as the user drags, but no more often than REDRAW_INTERVAL.
+		self.redraw_timer = wx.Timer(self)
+		self.Bind(wx.EVT_TIMER, self.OnRedrawTimer, self.redraw_timer)
+
+		# However the window goes, the timer mustn't fire after it.
+		self.Bind(wx.EVT_WINDOW_DESTROY, self.OnDestroy)
+
+		self.canvas.mpl_connect('button_press_event', self.OnMousePress)
+		self.canvas.mpl_connect('motion_notify_event', self.OnMouseMove)
+		self.canvas.mpl_connect('button_release_event', self.OnMouseRelease)
+
+	def OnMousePress(self, evt):
+		if self.axes is None or evt.inaxes is not self.axes:
+			return
+
+		self._dragging = True
+		self._show_preview(True)
+
+	def OnMouseMove(self, evt):
+		if self._dragging and not self.redraw_timer.IsRunning():
+			self.redraw_timer.Start(self.REDRAW_INTERVAL, oneShot=True)
+
+	def OnMouseRelease(self, evt):
+		if not self._dragging:
+			return
+
+		self._dragging = False
+		self.redraw_timer.Stop()
+
+		self._show_preview(False)
+		self.canvas.draw()
+
+	def OnRedrawTimer(self, evt):
+		if self._dragging:
+			self.canvas.draw()
+
+	def OnDestroy(self, evt):
+		# Children being destroyed send this too.
+		if evt.GetEventObject() is self:
+			self.redraw_timer.Stop()
+
+		evt.Skip()
+
+	def _show_preview(self, preview):
+		if self.poly is not None:
+			self.poly.set_visible(not preview)
+			self.preview_poly.set_visible(preview)
+
+	def plot_data(self, bd, cm=None, xlabel=None, ylabel=None, zlabel=None):
 		"""
 		Plot energy level populations by temperature in 3D.
 
 		bd: BoltzmannDistribution.
-		cm: A matplotlib colormap.
+		cm: A matplotlib colormap (jet by default).
 		*label: Axis labels.
 		"""
 
+		# Allows us to use the 3D projection.
+		from mpl_toolkits.mplot3d import Axes3D
+
+		if cm is None:
+			from matplotlib.cm import jet as cm
+
 		if self.axes is not None:
 			self.figure.delaxes(self.axes)
 			self.axes = None
@@ -198,18 +476,10 @@ class PlotPanel3DPopulation(wx.Panel):
 		# Set up the data.
 		xs = self._gen_temps()
 		ys = bd.energies
-		verts = []
 
 		# All the energy level populations at all the temperatures.
-		populations = N.column_stack(bd.ps(x) for x in xs)
+		populations = bd.ps(xs)
 
-		for p in populations:
-			# Add the points on the ends so that there is a bottom edge along
-			# the polygon.
-			points = [(xs[0], 0)] + list(zip(xs, p)) + [(xs[-1], 0)]
-			verts.append(points)
-
-		x_min, x_max = min(xs), max(xs)
 		y_min, y_max = min(ys), max(ys)
 
 		if y_max == y_min:
@@ -217,12 +487,23 @@ class PlotPanel3DPopulation(wx.Panel):
 		else:
 			colors = [cm((ys[i] - y_min) / (y_max - y_min)) for i in bd.levels]
 
-		poly = PolyCollection(verts, facecolors=colors, linewidth=1.0, edgecolor='white')
-		poly.set_alpha(0.7)
+		self.poly = self._make_poly(xs, populations, colors, linewidth=1.0)
+
+		# The preview has a sample of the levels, each with fewer points and no
+		# edges.
+		levels = N.unique(N.linspace(0, len(ys) - 1, min(len(ys), self.PREVIEW_LEVELS)).astype(int))
+		temps = N.unique(N.linspace(0, len(xs) - 1, min(len(xs), self.PREVIEW_TEMPS)).astype(int))
+
+		self.preview_poly = self._make_poly(xs[temps], populations[levels][:, temps],
+				[colors[i] for i in levels], linewidth=0)
+		self.preview_poly.set_visible(False)
 
 		# The directions here look somewhat confused, but that's just due to
 		# the way the polygons are stacked.
-		self.axes.add_collection3d(poly, zs=ys, zdir='y')
+		self.axes.add_collection3d(self.poly, zs=ys, zdir='y')
+		self.axes.add_collection3d(self.preview_poly, zs=N.asarray(ys)[levels], zdir='y')
+
+		x_min, x_max = min(xs), max(xs)
 
 		if x_max == x_min:
 			self.axes.set_xlim3d(x_min - 1, x_max + 1)
@@ -247,24 +528,25 @@ class PlotPanel3DPopulation(wx.Panel):
 
 		self.figure.tight_layout()
 
-		# Make sure that we redraw as the user drags.
-		#
-		# Using a list because we don't have nonlocal here.
-		mouse_down = [False]
+	def _make_poly(self, xs, populations, colors, linewidth):
+		"""
+		Polygons under the population curves of some levels.
+		"""
+
+		from matplotlib.collections import PolyCollection
 
-		def on_press(evt):
-			mouse_down[0] = True
+		verts = []
 
-		def on_move(evt):
-			if mouse_down[0]:
-				self.canvas.draw()
+		for p in populations:
+			# Add the points on the ends so that there is a bottom edge along
+			# the polygon.
+			points = [(xs[0], 0)] + list(zip(xs, p)) + [(xs[-1], 0)]
+			verts.append(points)
 
-		def on_release(evt):
-			mouse_down[0] = False
+		poly = PolyCollection(verts, facecolors=colors, linewidth=linewidth, edgecolor='white')
+		poly.set_alpha(0.7)
 
-		cid = self.canvas.mpl_connect('button_press_event', on_press)
-		cid = self.canvas.mpl_connect('motion_notify_event', on_move)
-		cid = self.canvas.mpl_connect('button_release_event', on_release)
+		return poly
 
 	def _gen_temps(self):
 		return N.linspace(0, 2000, 200)
@@ -298,3 +580,106 @@ class PlotFrame3DPopulation(wx.Frame):
 
 	def plot_data(self, *args, **kwargs):
 		self.panel.plot_data(*args, **kwargs)
+
+
+class PlotPanelPopulationMap(wx.Panel):
+	"""
+	Panel for plotting energy level populations as a heatmap of energy
+	against temperature, which stays fast for thousands of levels.
+	"""
+
+	# Most rows of cells; beyond this, levels are merged.
+	MAX_ROWS = 500
+	NUM_TEMPS = 400
+
+	def __init__(self, parent):
+		wx.Panel.__init__(self, parent)
+
+		# Panel.
+		panel_box = wx.BoxSizer(wx.VERTICAL)
+
+		## Canvas.
+		_import_matplotlib()
+		self.figure = Figure()
+		self.canvas = Canvas(self, -1, self.figure)
+		self.axes = None
+		panel_box.Add(self.canvas, 1, wx.EXPAND)
+
+		self.SetSizer(panel_box)
+
+	def plot_data(self, bd, cm=None, xlabel=None, ylabel=None, zlabel=None):
+		"""
+		Plot energy level populations by temperature as a heatmap.
+
+		bd: BoltzmannDistribution.
+		cm: A matplotlib colormap (jet by default).
+		*label: Axis labels; zlabel is for the populations.
+		"""
+
+		if cm is None:
+			from matplotlib.cm import jet as cm
+
+		# Start afresh, colorbar included.
+		self.figure.clf()
+		self.axes = self.figure.add_subplot(111)
+
+		# All the populations at all the temperatures in one go, reduced to
+		# what can be seen.
+		xs = self._gen_temps()
+		edges, rows, num_dropped = population_map(bd.energies, bd.ps(xs), max_rows=self.MAX_ROWS)
+
+		if len(edges) > 0:
+			mesh = self.axes.pcolormesh(midpoint_edges(xs), edges, rows, cmap=cm, vmin=0, vmax=rows.max(),
+					rasterized=True)
+			colorbar = self.figure.colorbar(mesh, ax=self.axes)
+
+			if zlabel is not None:
+				colorbar.set_label(zlabel)
+
+			self.axes.set_xlim(xs[0], xs[-1])
+			self.axes.set_ylim(edges[0], edges[-1])
+
+		if num_dropped > 0:
+			self.axes.set_title('{0} negligible levels not shown'.format(num_dropped), fontsize='small')
+
+		if xlabel is not None:
+			self.axes.set_xlabel(xlabel)
+
+		if ylabel is not None:
+			self.axes.set_ylabel(ylabel)
+
+		self.figure.tight_layout()
+		self.canvas.draw()
+
+	def _gen_temps(self):
+		return N.linspace(0, 2000, self.NUM_TEMPS)
+
+
+class PlotFramePopulationMap(wx.Frame):
+	"""
+	Frame for plotting Boltzmann distribution populations as a heatmap.
+	"""
+
+	def __init__(self, name, close_callback=None):
+		wx.Frame.__init__(self, None, title=name, size=(600, 400))
+
+		self.close_callback = close_callback
+
+		# Frame.
+		frame_box = wx.BoxSizer(wx.VERTICAL)
+
+		self.panel = PlotPanelPopulationMap(self)
+		frame_box.Add(self.panel, 1, wx.EXPAND)
+
+		self.SetSizerAndFit(frame_box)
+
+		self.Bind(wx.EVT_CLOSE, self.OnClose)
+
+	def OnClose(self, evt):
+		if self.close_callback is not None:
+			self.close_callback()
+
+		evt.Skip()
+
+	def plot_data(self, *args, **kwargs):
+		self.panel.plot_data(*args, **kwargs)
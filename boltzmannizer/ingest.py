@@ -0,0 +1,296 @@
+"""
+Convert many files of column data into level files in parallel, keeping a
+manifest of what was converted.
+
+The manifest (manifest.json in the output directory) records, for each level
+file, where it came from, how it was converted, a summary of the levels, and
+a hash of the content of the source. Files whose content and conversion
+settings haven't changed since the last run are skipped.
+
+This module must not import anything from boltzmannizer.gui, so that it
+starts quickly and runs without a display.
+"""
+
+from argparse import ArgumentParser
+from collections import namedtuple
+import hashlib
+import json
+import os
+from os.path import basename, exists, isdir, join, splitext
+import sys
+
+from boltzmannizer.science.batch import imap_unordered
+from boltzmannizer.science.level_files import BinaryLevelWriter, JSONLevelWriter, read_columns
+
+
+# Outcome of ingesting a single file: entry is the manifest entry for the
+# converted file (None if there was an error), skipped is whether the
+# conversion was unnecessary, and error is the exception which was raised
+# (if any).
+IngestResult = namedtuple('IngestResult', ['path', 'name', 'entry', 'skipped', 'error'])
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_FORMAT_VERSION = 1
+
+# Number of bytes hashed at a time.
+HASH_CHUNK_SIZE = 2 ** 20
+
+# The same defaults as col2json.py.
+DEFAULT_K_B = 0.695031
+DEFAULT_UNITS = {'energy': 'cm^-1', 'temperature': 'K'}
+
+
+def content_hash(path):
+	"""
+	Hash of the content of the file at path, tagged with the algorithm.
+	"""
+
+	h = hashlib.sha256()
+
+	with open(path, 'rb') as f:
+		for data in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+			h.update(data)
+
+	return 'sha256:' + h.hexdigest()
+
+def output_name(path, binary):
+	"""
+	Name of the level file converted from the file at path.
+	"""
+
+	return splitext(basename(path))[0] + ('.bin' if binary else '.json')
+
+def load_manifest(output_dir):
+	"""
+	Entries of the manifest in output_dir, keyed by level file name, or an
+	empty dict if there is no manifest.
+	"""
+
+	path = join(output_dir, MANIFEST_NAME)
+
+	if not exists(path):
+		return {}
+
+	with open(path) as f:
+		data = json.load(f)
+
+	if data.get('format_version') != MANIFEST_FORMAT_VERSION:
+		raise ValueError('Unsupported format version: {0}'.format(data.get('format_version')))
+
+	return data['files']
+
+def save_manifest(output_dir, entries):
+	"""
+	Write the manifest in output_dir, replacing any existing one in a single
+	step.
+	"""
+
+	path = join(output_dir, MANIFEST_NAME)
+	tmp_path = path + '.part'
+
+	with open(tmp_path, 'w') as f:
+		json.dump({'format_version': MANIFEST_FORMAT_VERSION, 'files': entries}, f, indent=2, sort_keys=True)
+		f.write('\n')
+
+	os.rename(tmp_path, path)
+
+def _is_current(entry, digest, settings, out_path):
+	"""
+	Whether the manifest entry describes a conversion of content with the
+	given hash, with the given settings, whose output is still there.
+	"""
+
+	if entry is None or entry.get('hash') != digest or not exists(out_path):
+		return False
+
+	return all(entry.get(key) == value for key, value in settings.iteritems())
+
+def _ingest_file(task):
+	"""
+	Convert a single file, as an IngestResult.
+
+	Any exception is caught and reported rather than raised, so that one bad
+	file doesn't take down the rest of the batch.
+	"""
+
+	path, name, out_path, settings, previous = task
+
+	try:
+		digest = content_hash(path)
+
+		if _is_current(previous, digest, settings, out_path):
+			return IngestResult(path, name, previous, True, None)
+
+		if settings['format'] == 'binary':
+			writer_class = BinaryLevelWriter
+		else:
+			writer_class = JSONLevelWriter
+
+		num_states = 0
+		energy_range = None
+
+		# The writer only puts the level file in place once it's complete, so a
+		# failure doesn't leave a truncated one behind.
+		with open(path) as f:
+			with writer_class(out_path, settings['k_B'], settings['units']) as writer:
+				for energies, degeneracies in read_columns(f, settings['energies_column'],
+						settings['degeneracies_column']):
+					writer.write(energies, degeneracies)
+
+					# Python integers, so that the sum can't overflow.
+					num_states += sum(degeneracies.tolist())
+
+					if energy_range is None:
+						energy_range = [energies[0], energies[-1]]
+					else:
+						energy_range[1] = energies[-1]
+
+		entry = dict(settings)
+		entry.update({
+				'source': path,
+				'hash': digest,
+				'num_levels': writer.num_levels,
+				'num_states': num_states,
+				'energy_range': None if energy_range is None else [float(e) for e in energy_range],
+				})
+
+		return IngestResult(path, name, entry, False, None)
+	except Exception as e:
+		return IngestResult(path, name, None, False, e)
+
+def ingest_files(paths, output_dir, energies_column, degeneracies_column=None, k_B=DEFAULT_K_B,
+		units=DEFAULT_UNITS, binary=False, force=False, processes=None, chunksize=None):
+	"""
+	Convert files of column data (as read by read_columns, with zero-based
+	column indices) into level files in output_dir, in parallel, and update
+	the manifest there.
+
+	Each level file is named after its source, with the extension replaced.
+	Unless force is true, sources whose content and settings match their
+	manifest entries aren't converted again.
+
+	The files are spread over a pool of processes (by default, one per CPU),
+	chunksize files at a time. IngestResults are yielded as they complete, not
+	necessarily in the order of the paths. Errors in converting a file are
+	reported in the result for that file, and its manifest entry is removed.
+	Paths which would be converted to the same file raise a ValueError
+	straight away, before anything is converted.
+	"""
+
+	paths = list(paths)
+	names = [output_name(path, binary) for path in paths]
+
+	if len(set(names)) < len(names):
+		duplicates = sorted(set(name for name in names if names.count(name) > 1))
+
+		raise ValueError('Several files would be converted to: {0}'.format(', '.join(duplicates)))
+
+	if not isdir(output_dir):
+		os.makedirs(output_dir)
+
+	entries = load_manifest(output_dir)
+
+	settings = {
+			'energies_column': energies_column,
+			'degeneracies_column': degeneracies_column,
+			'k_B': k_B,
+			'units': units,
+			'format': 'binary' if binary else 'json',
+			}
+
+	tasks = ((path, name, join(output_dir, name), settings, None if force else entries.get(name))
+			for path, name in zip(paths, names))
+
+	# Not a generator itself, so that the checks above happen on the call.
+	return _record_results(imap_unordered(_ingest_file, tasks, len(paths), processes, chunksize),
+			output_dir, entries)
+
+def _record_results(results, output_dir, entries):
+	"""
+	Pass through IngestResults, updating the manifest entries with them, and
+	save the manifest at the end.
+	"""
+
+	# Whatever has been converted is recorded, even if the rest isn't.
+	try:
+		for result in results:
+			if result.error is None:
+				entries[result.name] = result.entry
+			else:
+				entries.pop(result.name, None)
+
+			yield result
+	finally:
+		save_manifest(output_dir, entries)
+
+def _expand_paths(paths):
+	"""
+	Paths with directories replaced by the (non-hidden) files in them.
+	"""
+
+	result = []
+
+	for path in paths:
+		if isdir(path):
+			result.extend(join(path, name) for name in sorted(os.listdir(path))
+					if not name.startswith('.') and not isdir(join(path, name)))
+		else:
+			result.append(path)
+
+	return result
+
+def main(argv=None):
+	"""
+	Run the command line interface, returning the exit status.
+	"""
+
+	parser = ArgumentParser(prog='boltzmannizer ingest',
+			description='Convert files of column data into level files, in parallel.')
+	parser.add_argument('energies', type=int, help='one-based index of the energies column')
+	parser.add_argument('degeneracies', type=int, help='one-based index of the degeneracies column (0 for none)')
+	parser.add_argument('files', metavar='file', nargs='+', help='column data, or a directory of it')
+	parser.add_argument('--output-dir', '-o', required=True, help='directory for the level files and manifest')
+	parser.add_argument('--k_B', type=float, default=DEFAULT_K_B,
+			help='Boltzmann constant in units of energy/temperature (default: %(default)s)')
+	parser.add_argument('--energy-units', default=DEFAULT_UNITS['energy'], help='units of energy (default: %(default)s)')
+	parser.add_argument('--temperature-units', default=DEFAULT_UNITS['temperature'],
+			help='units of temperature (default: %(default)s)')
+	parser.add_argument('--no-units', action='store_true', help="don't record any units")
+	parser.add_argument('--binary', action='store_true', help='write the binary level format')
+	parser.add_argument('--force', action='store_true', help='convert files even if they are unchanged')
+	parser.add_argument('--processes', type=int, help='number of worker processes (default: one per CPU)')
+
+	args = parser.parse_args(argv)
+
+	if args.energies < 1 or args.degeneracies < 0:
+		parser.error('Invalid column index')
+
+	if args.no_units:
+		units = None
+	else:
+		units = {'energy': args.energy_units, 'temperature': args.temperature_units}
+
+	try:
+		results = ingest_files(_expand_paths(args.files), args.output_dir, args.energies - 1,
+				args.degeneracies - 1 if args.degeneracies > 0 else None, k_B=args.k_B, units=units,
+				binary=args.binary, force=args.force, processes=args.processes)
+	except ValueError as e:
+		parser.error(str(e))
+
+	results = list(results)
+
+	errors = sorted((result.path, result.error) for result in results if result.error is not None)
+
+	for path, error in errors:
+		print >>sys.stderr, '{0}: {1}'.format(path, error)
+
+	num_skipped = sum(result.skipped for result in results)
+
+	print >>sys.stderr, 'Converted {0}, skipped {1} unchanged, failed {2}.'.format(
+			len(results) - num_skipped - len(errors), num_skipped, len(errors))
+
+	return 1 if errors else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,106 @@
+from collections import namedtuple
+from itertools import imap
+from multiprocessing import cpu_count, Pool
+
+import numpy as N
+
+from boltzmannizer.science.boltzmann_distribution import BoltzmannDistribution
+
+
+# Outcome of evaluating a single file: either values (a dict from quantity
+# names to arrays shaped like the temperatures) or error (the exception which
+# was raised) is None.
+BatchResult = namedtuple('BatchResult', ['path', 'values', 'error'])
+
+# Names of the BoltzmannDistribution methods which can be evaluated.
+QUANTITIES = ('log_Z', 'Z', 'energy', 'entropy', 'heat_capacity')
+DEFAULT_QUANTITIES = ('energy', 'entropy', 'heat_capacity')
+
+
+def imap_unordered(function, tasks, num_tasks, processes=None, chunksize=None):
+	"""
+	Apply function to each of num_tasks tasks over a pool of processes (by
+	default, one per CPU), chunksize tasks at a time, yielding the results as
+	they complete.
+
+	With a single process, everything happens in this one, in order.
+	"""
+
+	if processes is None:
+		processes = cpu_count()
+
+	processes = max(1, min(processes, num_tasks))
+
+	if chunksize is None:
+		# A few chunks per process, to even out the load.
+		chunksize = max(1, num_tasks // (4 * processes))
+
+	if processes == 1:
+		for result in imap(function, tasks):
+			yield result
+
+		return
+
+	pool = Pool(processes)
+
+	try:
+		for result in pool.imap_unordered(function, tasks, chunksize):
+			yield result
+
+		pool.close()
+	finally:
+		# Anything left over is no longer wanted.
+		pool.terminate()
+		pool.join()
+
+def _evaluate_file(task):
+	"""
+	Load and evaluate a single file, as a BatchResult.
+
+	Any exception is caught and reported rather than raised, so that one bad
+	file doesn't take down the rest of the batch.
+	"""
+
+	path, Ts, quantities, load_kwargs = task
+
+	try:
+		bd = BoltzmannDistribution.from_file(path, **load_kwargs)
+
+		# All the quantities come from the same pass over the levels.
+		bd.moments(Ts)
+
+		return BatchResult(path, dict((q, getattr(bd, q)(Ts)) for q in quantities), None)
+	except Exception as e:
+		return BatchResult(path, None, e)
+
+def evaluate_files(paths, T, quantities=DEFAULT_QUANTITIES, processes=None, chunksize=None, **load_kwargs):
+	"""
+	Evaluate quantities at temperature T (a scalar or an array) for many level
+	files, in parallel.
+
+	quantities are names of BoltzmannDistribution methods (such as 'energy').
+	Any further keyword arguments are passed on to
+	BoltzmannDistribution.from_file.
+
+	The files are spread over a pool of processes (by default, one per CPU),
+	chunksize files at a time. BatchResults are yielded as they complete, not
+	necessarily in the order of the paths. Errors in loading or evaluating a
+	file (such as InvalidFormat) are reported in the result for that file.
+	Quantities not in QUANTITIES raise a ValueError straight away, before any
+	file is touched.
+
+	With a single process, everything happens in this one.
+	"""
+
+	paths = list(paths)
+	Ts = N.asarray(T, dtype=float)
+	quantities = list(quantities)
+
+	for q in quantities:
+		if q not in QUANTITIES:
+			raise ValueError('Unknown quantity: {0}'.format(q))
+
+	tasks = ((path, Ts, quantities, load_kwargs) for path in paths)
+
+	# Not a generator itself, so that the checks above happen on the call.
+	return imap_unordered(_evaluate_file, tasks, len(paths), processes, chunksize)
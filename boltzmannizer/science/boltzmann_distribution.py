@@ -1,116 +1,195 @@
 from __future__ import division
 
-from json import load
-from math import exp, log
+from math import log
 from os.path import basename, splitext
 
 import numpy as N
 
-from boltzmannizer.tools.misc import memoized
+from boltzmannizer.science.canonicalization import bin_levels, canonicalize_levels, NonIncreasingEnergies
+from boltzmannizer.science.level_files import InvalidFormat, is_binary, read_binary, read_json
+from boltzmannizer.science.moments import log_weights, MOMENTS_DTYPE, TEMPERATURE_BLOCK, thermodynamic_moments
+from boltzmannizer.tools.cache import cached_method, ResultCache
 
 
-class InvalidFormat(Exception): pass
+def as_temperatures(T):
+	"""
+	Flatten T (a scalar or an array) into a 1D array of temperatures.
+
+	The original shape is also returned, so that results can be given back in
+	the same shape as the input.
+	"""
+
+	Ts = N.asarray(T, dtype=float)
+
+	return Ts.ravel(), Ts.shape
+
+def shaped(values, shape):
+	"""
+	Reshape a 1D array of per-temperature values into the given shape (as
+	returned by as_temperatures), which yields a scalar for scalar
+	temperatures.
+	"""
+
+	return values.reshape(shape)[()]
+
+def _log_degeneracies(degeneracies):
+	"""
+	Natural logarithms of an array of degeneracies.
+
+	Integers too large for floating point numbers (which NumPy stores as Python
+	objects) are handled exactly.
+	"""
 
-class NonIncreasingEnergies(Exception): pass
+	if degeneracies.dtype == object:
+		return N.array([log(d) for d in degeneracies], dtype=float)
+
+	with N.errstate(divide='ignore'):
+		return N.log(degeneracies.astype(float))
+
+def _log_sum_exp(xs):
+	"""
+	Numerically stable $\\ln \\sum_i e^{x_i}$ over the first axis of xs.
+
+	Columns containing nothing but $-\\infty$ (or nothing at all) give
+	$-\\infty$.
+	"""
+
+	shift = N.max(xs, axis=0, initial=-N.inf)
+	# Any finite shift will do for empty columns.
+	shift[~N.isfinite(shift)] = 0
+
+	with N.errstate(divide='ignore'):
+		return shift + N.log(N.exp(xs - shift).sum(axis=0))
 
 
 class BoltzmannDistribution(object):
 	"""
 	Utilities for working with a Boltzmann distribution of discrete levels of
 	known energy and degeneracy.
+
+	All the evaluation happens in log space, with the energies shifted by the
+	ground state energy, so the full range of temperatures is covered without
+	underflow or overflow. At low temperature, levels too high in energy to
+	contribute are left out altogether.
+
+	All the quantities which depend on temperature accept either a scalar
+	temperature or an array of temperatures. Arrays are evaluated in bulk, with
+	the levels broadcast against the temperatures.
 	"""
 
-	def __init__(self, k_B, energies, degeneracies, units=None, filename=None):
+	# Upper bound on the number of elements in any (levels x temperatures)
+	# intermediate array, to keep memory use in check for large arrays of
+	# temperatures.
+	MAX_BLOCK_ELEMENTS = 2 ** 22
+
+	# Number of levels per chunk for memory-mapped files.
+	DEFAULT_CHUNK_SIZE = 2 ** 16
+
+	# Upper bound on the neglected weight of levels truncated at low
+	# temperature, relative to the partition function (see _cutoffs).
+	TRUNCATION_TOLERANCE = 1e-18
+
+	def __init__(self, k_B, energies, degeneracies, units=None, filename=None, chunk_size=None,
+			sort=False, merge_tolerance=None):
 		"""
 		k_B should be the Boltzmann constant in units of energy/temperature,
 		matching the units for the energies and temperatures.
 
 		Energies are assumed to be in strictly increasing order. If this is
-		found not to be the case, a NonIncreasingEnergies exception is raised.
+		found not to be the case, a NonIncreasingEnergies exception is raised,
+		unless sort or merge_tolerance allow the levels to be put in order (see
+		canonicalize_levels). What was changed is kept in canonicalization.
 
 		If the units are specified, they must be in the form of a dict
 		containing the keys 'energy' and 'temperature'. These values are used
 		for display only.
+
+		If chunk_size is given, the levels are evaluated out of core: the
+		energies and degeneracies are used as given without being copied (so
+		they may be memory-mapped arrays, see numpy.memmap), and every
+		reduction over the levels works through chunk_size levels at a time.
+		Peak memory use is then bounded by the chunk size rather than by the
+		number of levels.
 		"""
 
 		# The results are cached, so these values should not be modified.
 		# Read-only properties are provided.
+		self._result_cache = ResultCache()
 		self._k_B = k_B
-		self._energies = N.array(energies)
-		self._degeneracies = N.array(degeneracies)
+		self._chunk_size = chunk_size
+
+		if chunk_size is None:
+			energies = N.array(energies)
+			degeneracies = N.array(degeneracies)
+		else:
+			energies = N.asarray(energies)
+			degeneracies = N.asarray(degeneracies)
 
 		if self._k_B <= 0:
 			raise ValueError('k_B must be positive')
 
-		if len(self._energies) != len(self._degeneracies):
+		if chunk_size is not None and chunk_size < 1:
+			raise ValueError('chunk_size must be positive')
+
+		if len(energies) != len(degeneracies):
 			raise ValueError("Number of energies doesn't match number of degeneracies")
 
 		self.units = units
 		self.filename = filename
 
 		# Enforce order.
-		for i in xrange(len(self._energies) - 1):
-			if self._energies[i] >= self._energies[i+1]:
-				raise NonIncreasingEnergies('{0} >= {1}'.format(self._energies[i], self._energies[i+1]))
+		self._energies, self._degeneracies, self.canonicalization = canonicalize_levels(
+				energies, degeneracies, sort=sort, merge_tolerance=merge_tolerance,
+				chunk_size=chunk_size)
+
+		# Everything is evaluated in log space relative to the ground state, so
+		# that nothing underflows at low temperature or overflows for large
+		# degeneracies.
+		self._ground_energy = self._energies[0] if len(self._energies) > 0 else 0
+
+		if chunk_size is None:
+			self._log_degeneracies = _log_degeneracies(self._degeneracies)
+			self._shifted_energies = self._energies - self._ground_energy
+		else:
+			# Worked out a chunk at a time instead.
+			self._log_degeneracies = None
+			self._shifted_energies = None
+
+		# For truncating the levels at low temperature.
+		self._tail_stride, self._log_tail_degeneracies = self._tails()
 
 	@classmethod
-	def from_file(cls, path):
+	def from_file(cls, path, chunk_size=None, sort=False, merge_tolerance=None):
 		"""
-		Load a Boltzmann distribution from a JSON file.
+		Load a Boltzmann distribution from a JSON or binary level file.
 
 		Any exceptions that might happen due to reading or parsing the file are
 		passed through.
 
 		In addition, an InvalidFormat exception may be raised if the contents
 		of the file do not make sense.
-		"""
 
-		with open(path) as f:
-			data = load(f)
+		The columns of binary files are memory-mapped and evaluated out of
+		core, with DEFAULT_CHUNK_SIZE levels per chunk unless chunk_size is
+		given.
 
-		try:
-			format_version = data['format_version']
-		except KeyError:
-			raise InvalidFormat('No format_version specified')
+		sort and merge_tolerance are passed on to the constructor.
+		"""
+
+		if is_binary(path):
+			data = read_binary(path)
 
-		if format_version != 1:
-			raise InvalidFormat('Unable to parse file with format_version: {0}'.format(format_version))
+			if chunk_size is None:
+				chunk_size = cls.DEFAULT_CHUNK_SIZE
+		else:
+			data = read_json(path)
 
 		# Make the filename more presentable by dropping the dirname and extension.
 		filename = splitext(basename(path))[0]
 
-		try:
-			k_B = data['k_B']
-			levels = data['levels']
-		except KeyError as exc:
-			raise InvalidFormat('Missing data: {0}'.format(exc))
-
-		try:
-			units = data['units']
-
-			assert 'energy' in units
-			assert 'temperature' in units
-		except:
-			# Units would be nice to have, but don't complain if something's
-			# wrong.
-			units = None
-
-		energies = []
-		degeneracies = []
-
-		for i, level in enumerate(levels):
-			try:
-				energies.append(level[0])
-			except IndexError:
-				raise InvalidFormat('Missing energy in level {0}'.format(i))
-
-			try:
-				degeneracies.append(level[1])
-			except IndexError:
-				# Default degeneracy is 1.
-				degeneracies.append(1)
-
-		return cls(k_B, energies, degeneracies, units=units, filename=filename)
+		return cls(data.k_B, data.energies, data.degeneracies, units=data.units,
+				filename=filename, chunk_size=chunk_size, sort=sort,
+				merge_tolerance=merge_tolerance)
 
 	@property
 	def k_B(self):
@@ -136,11 +215,95 @@ class BoltzmannDistribution(object):
 	def num_levels(self):
 		"""
 		Number of levels and number of states.
+
+		The number of states is an integer unless some of the degeneracies
+		aren't.
+		"""
+
+		num_states = self.degeneracies.sum()
+
+		if len(self.degeneracies) == 0 or self.degeneracies.dtype.kind in 'iub':
+			num_states = int(num_states)
+
+		return len(self.degeneracies), num_states
+
+	def invalidate_cache(self, *names):
+		"""
+		Drop cached results, either for the named methods only or for
+		everything.
+		"""
+
+		self._result_cache.invalidate(*names)
+
+	@property
+	def log_degeneracies(self):
+		"""
+		Natural logarithms of the degeneracies.
+
+		These are finite even for degeneracies too large to be represented as
+		floating point numbers. For out-of-core evaluation, they are computed
+		anew on each access.
 		"""
 
-		return len(self.degeneracies), sum(self.degeneracies)
+		if self._log_degeneracies is None:
+			return _log_degeneracies(self._degeneracies)
 
-	@memoized
+		return self._log_degeneracies
+
+	@property
+	def chunk_size(self):
+		"""
+		Number of levels per chunk for out-of-core evaluation, or None if the
+		levels are evaluated in memory.
+		"""
+
+		return self._chunk_size
+
+	@property
+	def ground_energy(self):
+		"""
+		Energy of the lowest level, or 0 if there are no levels.
+		"""
+
+		return self._ground_energy
+
+	def coarse_grained(self, T_min, tolerance=1e-6):
+		"""
+		Approximation of this distribution by one with the levels binned by
+		energy, each bin becoming a single level with the total degeneracy and
+		mean energy of the levels in it.
+
+		The bin width w is chosen so that at all temperatures T >= T_min, to
+		leading order in $\\beta w$, the relative error in Z and the errors in
+		U (relative to $k_B T$) and in C_V (relative to $k_B$) are within
+		tolerance. Replacing the levels in a bin by their mean loses their
+		variance of at most $w^2 / 4$, which gives errors of at most
+		$(\\beta w)^2 / 8$ in $\\ln Z$ and $(\\beta w)^2 / 4$ in the others, so
+
+		$w = k_B T_{min} \\sqrt{2 \\epsilon}$
+
+		The entropy is not covered by this: it is the entropy of the
+		distribution over levels, and merging levels loses the entropy of
+		mixing within each bin. The entropy of the result is lower, by up to
+		$k_B \\ln n$ where n is the largest number of levels merged into one,
+		whatever the tolerance. Use it for the entropy only if that's
+		acceptable.
+
+		The levels of the result are in memory.
+		"""
+
+		if T_min <= 0:
+			raise ValueError('T_min must be positive')
+
+		if tolerance <= 0:
+			raise ValueError('tolerance must be positive')
+
+		width = self.k_B * T_min * (2 * tolerance) ** 0.5
+		energies, degeneracies = bin_levels(self.energies, self.degeneracies, self.ground_energy, width, self.chunk_size)
+
+		return BoltzmannDistribution(self.k_B, energies, degeneracies, units=self.units, filename=self.filename)
+
+	@cached_method
 	def beta(self, T):
 		"""
 		Value of beta for the given temperature.
@@ -152,17 +315,77 @@ class BoltzmannDistribution(object):
 
 		return 1 / (self.k_B * T)
 
-	@memoized
+	@cached_method
 	def b_factors(self, T):
 		"""
 		Boltzmann factors of all the levels at temperature T.
 
 		$g_i e^{-\\beta E_i}$
+
+		If T is an array, the result has an extra leading axis for the levels.
+		"""
+
+		Ts, shape = as_temperatures(T)
+
+		with N.errstate(over='ignore'):
+			result = N.exp(self._log_weights(Ts) - self._beta_ground_energy(Ts))
+
+		return result.reshape(self.energies.shape + shape)
+
+	@cached_method
+	def moments(self, T):
+		"""
+		Thermodynamic quantities at temperature T, all computed in a single
+		pass over the levels.
+
+		The result is a record with the fields:
+		  log_Z: Natural logarithm of the partition function.
+		  Z: Partition function.
+		  U: Internal energy.
+		  E_sq: Expectation value of the square of the energy.
+		  var: Variance of the energy, $\\langle (\\Delta E)^2 \\rangle$.
+		  cov_E_log_g: Covariance of the energy and the log-degeneracy,
+		    $\\langle \\Delta E \\Delta \\ln g \\rangle$.
+		  S: Gibbs entropy.
+		  C_V: Heat capacity.
+
+		If T is an array, the result is an array of records of the same shape.
 		"""
 
-		return self.degeneracies * N.exp(-self.beta(T) * self.energies)
+		Ts, shape = as_temperatures(T)
+
+		if self.chunk_size is None:
+			temperature_step = min(len(Ts), TEMPERATURE_BLOCK)
+			chunk_size = self.MAX_BLOCK_ELEMENTS // max(1, temperature_step)
+		else:
+			chunk_size = self.chunk_size
+			temperature_step = self.MAX_BLOCK_ELEMENTS // chunk_size
+
+		# Evaluate in order of temperature, so that the blocks at low
+		# temperature need only a few levels.
+		order = N.argsort(Ts, kind='mergesort')
 
-	@memoized
+		result = N.empty(len(Ts), dtype=MOMENTS_DTYPE)
+		result[order] = thermodynamic_moments(self.k_B, self.ground_energy,
+				lambda block: self._level_chunks(chunk_size, self._cutoffs(block).max()),
+				Ts[order], temperature_step)
+
+		return shaped(result, shape)
+
+	@cached_method
+	def log_Z(self, T):
+		"""
+		Natural logarithm of the partition function for some temperature.
+
+		$\\ln Z = -\\beta E_0 + \\ln \\sum_{i=1}^n e^{\\ln g_i - \\beta (E_i - E_0)}$
+
+		Evaluated in log space, so it remains finite where Z itself would
+		underflow or overflow.
+		"""
+
+		return self._moment(T, 'log_Z')
+
+	@cached_method
 	def Z(self, T):
 		"""
 		Value of the partition function for some temperature.
@@ -170,32 +393,27 @@ class BoltzmannDistribution(object):
 		$Z = \\sum_{i=1}^n g_i e^{-\\beta E_i}$
 		"""
 
-		return self.b_factors(T).sum()
+		return self._moment(T, 'Z')
 
-	@memoized
+	@cached_method
 	def ps(self, T):
 		"""
 		Probabilities of occupying the levels at temperature T.
 
 		$p_i = \\frac{1}{Z} g_i e^{-\\beta E_i}$
+
+		If T is an array, the result has an extra leading axis for the levels.
 		"""
 
-		if T == 0:
-			# Treat the zero-temperature case explicitly, assuming that
-			# everything is in the ground state.
-			return self._ground_state_ps
-		else:
-			Z = self.Z(T)
+		Ts, shape = as_temperatures(T)
+		result = N.empty((len(self.energies), len(Ts)))
 
-			if Z == 0.0:
-				# If Z is zero, also assume that we're in the ground state,
-				# because we're probably here due to rounding error at very low
-				# temperature.
-				return self._ground_state_ps
+		for block in self._blocks(len(Ts)):
+			result[:, block] = N.exp(self._log_ps(Ts[block]))
 
-			return self.b_factors(T) / Z
+		return result.reshape(self.energies.shape + shape)
 
-	@memoized
+	@cached_method
 	def energy(self, T):
 		"""
 		Internal energy at temperature T.
@@ -203,9 +421,9 @@ class BoltzmannDistribution(object):
 		$U = \\langle E \\rangle = \\frac{1}{Z} \\sum_{i=1}^n E_i g_i e^{-\\beta E_i}$
 		"""
 
-		return (self.energies * self.ps(T)).sum()
+		return self._moment(T, 'U')
 
-	@memoized
+	@cached_method
 	def entropy(self, T):
 		"""
 		Gibbs entropy at temperature T.
@@ -215,13 +433,9 @@ class BoltzmannDistribution(object):
 		Has the same units as k_B.
 		"""
 
-		ps_all = self.ps(T)
-		# By convention, 0 log 0 = 0, so we can drop those.
-		ps = ps_all[ps_all.nonzero()]
-
-		return -self.k_B * (ps * N.log(ps)).sum()
+		return self._moment(T, 'S')
 
-	@memoized
+	@cached_method
 	def heat_capacity(self, T):
 		"""
 		Heat capacity (at constant volume) at temperature T.
@@ -230,19 +444,14 @@ class BoltzmannDistribution(object):
 
 		Has the same units as k_B.
 
-		Temperature is assumed to be positive.
+		The variance is accumulated directly, rather than as
+		$\\langle E^2 \\rangle - \\langle E \\rangle^2$, so there is no
+		catastrophic cancellation. At zero temperature, this is 0.
 		"""
 
-		return self.beta(T) * (self._energy_sq(T) - self.energy(T) * self.energy(T)) / T
+		return self._moment(T, 'C_V')
 
-	@property
-	def _ground_state_ps(self):
-		result = N.zeros(self.num_levels[0])
-		result[0] = 1.0
-
-		return result
-
-	@memoized
+	@cached_method
 	def _energy_sq(self, T):
 		"""
 		Expectation value of the square of the energy at temperature T.
@@ -253,4 +462,296 @@ class BoltzmannDistribution(object):
 		be the square of the expectation value of the energy instead.
 		"""
 
-		return (self.energies ** 2 * self.ps(T)).sum()
+		return self._moment(T, 'E_sq')
+
+	def _moment(self, T, name):
+		"""
+		A single field of the moments at temperature T, copied so that caching it
+		doesn't keep the others alive.
+		"""
+
+		return self.moments(T)[name].copy()
+
+	def temperature_for_energy(self, U, rtol=1e-12, max_iterations=100):
+		"""
+		Temperature at which the internal energy is U, which may be an array of
+		targets.
+
+		U(T) increases monotonically from the ground state energy at zero
+		temperature, with $\\frac{dU}{dT} = C_V$, so each target is bracketed
+		and then found by Newton's method, falling back on bisection whenever a
+		step would leave the bracket. All the targets are updated together in
+		a single pass over the levels per iteration.
+
+		Targets equal to the limit at infinite temperature give infinity, and
+		targets out of range give NaN.
+		"""
+
+		return self._temperature_for('U', U, rtol, max_iterations)
+
+	def temperature_for_entropy(self, S, rtol=1e-12, max_iterations=100):
+		"""
+		Temperature at which the entropy is S, which may be an array of
+		targets.
+
+		As for temperature_for_energy. Since the entropy is that of the
+		distribution over the levels rather than over the individual states,
+		$\\frac{dS}{dT} = \\frac{C_V}{T}$ only when all the degeneracies are
+		equal; the covariance of the energy and the log-degeneracy accounts for
+		the difference. With unequal degeneracies, S(T) need not be monotonic:
+		some temperature with the given entropy is found, and targets beyond the
+		limits at zero and infinite temperature give NaN even if they are
+		reached in between.
+		"""
+
+		return self._temperature_for('S', S, rtol, max_iterations)
+
+	def _temperature_for(self, name, targets, rtol, max_iterations):
+		"""
+		Invert the field name of moments, which should increase with
+		temperature.
+
+		The iterations are on $\\beta$ rather than T, and on the logarithm of
+		the excess over the zero temperature limit, $\\ln (Q - Q_0)$, which is
+		close to linear in $\\beta$ at both low and high temperature.
+		"""
+
+		targets, shape = as_temperatures(targets)
+		result = N.repeat(N.nan, len(targets))
+
+		low, high = self.moments(N.array([0, N.inf]))[name]
+
+		result[targets == low] = 0
+		result[targets == high] = N.inf
+
+		indices = N.flatnonzero((targets > low) & (targets < high))
+
+		if len(indices) == 0:
+			return shaped(result, shape)
+
+		log_excesses = N.log(targets[indices] - low)
+
+		# Start where k_B T spans the levels. The brackets have the target
+		# between them, with the upper end infinite until one is found.
+		spread = self.energies[-1] - self.ground_energy
+		betas = N.repeat(1 / spread if spread > 0 else 1, len(indices))
+		lows = N.zeros(len(indices))
+		highs = N.repeat(N.inf, len(indices))
+
+		pending = N.arange(len(indices))
+
+		for _ in xrange(max_iterations):
+			if len(pending) == 0:
+				break
+
+			evaluated = betas[pending]
+			moments = self.moments(1 / (self.k_B * evaluated))
+
+			with N.errstate(divide='ignore', invalid='ignore'):
+				excesses = moments[name] - low
+				residuals = N.log(excesses) - log_excesses[pending]
+
+				# $\\frac{dU}{d\\beta} = -\\langle (\\Delta E)^2 \\rangle$ and
+				# $\\frac{dS}{d\\beta} = k_B (\\langle \\Delta E \\Delta \\ln g \\rangle - \\beta \\langle (\\Delta E)^2 \\rangle)$.
+				if name == 'S':
+					slopes = self.k_B * (moments['cov_E_log_g'] - evaluated * moments['var']) / excesses
+				else:
+					slopes = -moments['var'] / excesses
+
+				steps = evaluated - residuals / slopes
+
+			# Larger $\\beta$ means a smaller value.
+			above = residuals > 0
+			lows[pending[above]] = evaluated[above]
+			highs[pending[~above]] = evaluated[~above]
+
+			bracket_lows, bracket_highs = lows[pending], highs[pending]
+
+			# Fall back on bisection, geometrically since the interesting values
+			# of $\\beta$ range over many orders of magnitude, or on expanding
+			# the bracket while it is open.
+			with N.errstate(invalid='ignore'):
+				fallbacks = N.where(N.isinf(bracket_highs), 16 * bracket_lows,
+						N.where(bracket_lows > 0, N.sqrt(bracket_lows * bracket_highs), bracket_highs / 16))
+
+			inside = (steps > bracket_lows) & (steps < bracket_highs)
+
+			# Converged values stay as they were evaluated.
+			done = ((residuals == 0) | (abs(steps - evaluated) <= rtol * evaluated)
+					| (bracket_highs - bracket_lows <= rtol * N.where(N.isinf(bracket_highs), 0, bracket_highs)))
+			betas[pending] = N.where(done, evaluated, N.where(inside, steps, fallbacks))
+
+			pending = pending[~done]
+
+		result[indices] = 1 / (self.k_B * betas)
+
+		return shaped(result, shape)
+
+	def _blocks(self, num_temps):
+		"""
+		Slices which split num_temps temperatures into blocks, so that no
+		(levels x temperatures) intermediate array has more than
+		MAX_BLOCK_ELEMENTS elements.
+
+		For out-of-core evaluation, the levels in question are only those in a
+		single chunk.
+		"""
+
+		num_levels = len(self.energies) if self.chunk_size is None else self.chunk_size
+		step = max(1, self.MAX_BLOCK_ELEMENTS // max(1, num_levels))
+
+		for start in xrange(0, num_temps, step):
+			yield slice(start, start + step)
+
+	def _level_slices(self, size=None, stop=None):
+		"""
+		Slices of consecutive chunks of at most size levels, covering the
+		first stop levels (or all of them).
+
+		If size is not given, the chunk size for out-of-core evaluation is
+		used, or otherwise all the levels are in one chunk.
+		"""
+
+		if size is None:
+			size = self.chunk_size if self.chunk_size is not None else max(1, len(self.energies))
+
+		if stop is None:
+			stop = len(self.energies)
+
+		for start in xrange(0, stop, size):
+			yield slice(start, min(start + size, stop))
+
+	def _level_chunks(self, size=None, stop=None):
+		"""
+		Iterator over (slice, shifted energies, log-degeneracies) for the
+		chunks given by _level_slices.
+		"""
+
+		for chunk in self._level_slices(size, stop):
+			if self.chunk_size is None:
+				yield chunk, self._shifted_energies[chunk], self._log_degeneracies[chunk]
+			else:
+				shifted_energies = N.asarray(self._energies[chunk], dtype=float) - self.ground_energy
+				log_degeneracies = _log_degeneracies(N.asarray(self._degeneracies[chunk]))
+
+				yield chunk, shifted_energies, log_degeneracies
+
+	def _tails(self):
+		"""
+		Number of levels between the places where the levels may be truncated,
+		along with the natural logarithm of the total degeneracy from each of
+		those places on.
+
+		In memory, the levels may be truncated anywhere; out of core, only
+		between chunks.
+		"""
+
+		if self.chunk_size is None:
+			stride = 1
+			log_degeneracies = self._log_degeneracies
+		else:
+			stride = self.chunk_size
+			log_degeneracies = N.array([N.logaddexp.reduce(lgs) for _, _, lgs in self._level_chunks()])
+
+		return stride, N.logaddexp.accumulate(log_degeneracies[::-1])[::-1]
+
+	def _cutoffs(self, Ts):
+		"""
+		Number of leading levels which contribute at each of a 1D array of
+		temperatures, found by binary search on the energies.
+
+		Because the energies increase, the weight of the levels from k on,
+		relative to the partition function, is at most
+
+		$\\frac{1}{g_0} e^{-\\beta (E_k - E_0)} \\sum_{i \\ge k} g_i$
+
+		The levels are truncated where this bound, multiplied by
+		$(\\beta (E_{max} - E_0))^2$ to cover the first two moments of the energy,
+		falls below TRUNCATION_TOLERANCE. Nothing is truncated at NaN
+		temperatures, so that they give NaN.
+		"""
+
+		num_tails = len(self._log_tail_degeneracies)
+
+		if num_tails == 0:
+			return N.zeros(len(Ts), dtype=int)
+
+		with N.errstate(divide='ignore', invalid='ignore', over='ignore'):
+			betas = 1 / (self.k_B * Ts)
+			spread = self.energies[-1] - self.ground_energy
+			log_tolerance = N.log(self.TRUNCATION_TOLERANCE) - 2 * N.log(N.maximum(1, betas * spread))
+
+		log_g_0 = _log_degeneracies(N.asarray(self.degeneracies[:1]))[0]
+		# Only the energies looked at are read.
+		tail_energies = self.energies[::self._tail_stride]
+
+		# Smallest index of a tail that can be dropped, or num_tails if none
+		# can.
+		lows = N.zeros(len(Ts), dtype=int)
+		highs = N.repeat(num_tails, len(Ts))
+
+		while (lows < highs).any():
+			mids = (lows + highs) // 2
+			searching = lows < highs
+			candidates = N.minimum(mids, num_tails - 1)
+			excitations = N.asarray(tail_energies[candidates], dtype=float) - self.ground_energy
+
+			with N.errstate(invalid='ignore'):
+				bounds = -betas * excitations + self._log_tail_degeneracies[candidates] - log_g_0
+
+				# At zero temperature, everything but the ground state goes.
+				negligible = ~(bounds > log_tolerance) & (excitations > 0) & ~N.isnan(Ts)
+
+			highs = N.where(searching & negligible, mids, highs)
+			lows = N.where(searching & ~negligible, mids + 1, lows)
+
+		return N.minimum(lows * self._tail_stride, len(self.energies))
+
+	def _beta_ground_energy(self, Ts):
+		"""
+		$\\beta E_0$ for a 1D array of temperatures.
+		"""
+
+		if self.ground_energy == 0:
+			# Avoid 0 * inf at zero temperature.
+			return N.zeros(len(Ts))
+
+		with N.errstate(divide='ignore'):
+			return self.ground_energy / (self.k_B * Ts)
+
+	def _log_weights(self, Ts):
+		"""
+		Logarithms of the Boltzmann factors relative to the ground state for a
+		1D array of temperatures, as a (levels x temperatures) array.
+		"""
+
+		result = N.empty((len(self.energies), len(Ts)))
+
+		# Levels past the cutoff have no weight to speak of.
+		cutoff = self._cutoffs(Ts).max() if len(Ts) > 0 else 0
+		result[cutoff:] = -N.inf
+
+		for chunk, shifted_energies, log_degeneracies in self._level_chunks(stop=cutoff):
+			result[chunk] = log_weights(self.k_B, shifted_energies, log_degeneracies, Ts)
+
+		return result
+
+	def _log_ps(self, Ts):
+		"""
+		Logarithms of the probabilities of occupying the levels for a 1D array
+		of temperatures, as a (levels x temperatures) array.
+		"""
+
+		result = self._log_weights(Ts)
+
+		# Normalize in chunks, so that there are no other full-size
+		# intermediate arrays.
+		log_Z_shifted = N.repeat(-N.inf, len(Ts))
+
+		for chunk in self._level_slices():
+			log_Z_shifted = N.logaddexp(log_Z_shifted, _log_sum_exp(result[chunk]))
+
+		for chunk in self._level_slices():
+			result[chunk] -= log_Z_shifted
+
+		return result
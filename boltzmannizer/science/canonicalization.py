@@ -0,0 +1,230 @@
+from __future__ import division
+
+from collections import namedtuple
+
+import numpy as N
+
+
+class NonIncreasingEnergies(Exception): pass
+
+
+class CanonicalizationReport(namedtuple('CanonicalizationReport', ['num_input', 'num_moved', 'num_merged', 'max_spread'])):
+	"""
+	What canonicalize_levels changed:
+	  num_input: Number of levels given.
+	  num_moved: Number of levels which ended up in a different position when
+	    sorting.
+	  num_merged: Number of levels removed by being merged into others.
+	  max_spread: Largest difference in energy between levels merged together.
+	"""
+
+	@property
+	def changed(self):
+		return self.num_moved > 0 or self.num_merged > 0
+
+	def __str__(self):
+		if not self.changed:
+			return 'Levels unchanged'
+
+		parts = []
+
+		if self.num_moved > 0:
+			parts.append('sorted {0} levels'.format(self.num_moved))
+
+		if self.num_merged > 0:
+			parts.append('merged {0} levels into neighbours (largest spread {1:g})'.format(self.num_merged, self.max_spread))
+
+		result = '; '.join(parts)
+
+		return result[0].upper() + result[1:]
+
+
+def _first_gap_at_most(energies, threshold, chunk_size):
+	"""
+	Index i of the first pair of neighbouring energies with
+	energies[i+1] - energies[i] <= threshold, or None if there is none.
+
+	The energies are scanned chunk_size at a time, so they may be
+	memory-mapped.
+	"""
+
+	step = chunk_size if chunk_size is not None else max(1, len(energies))
+
+	for start in xrange(0, len(energies) - 1, step):
+		# Overlap by one, so that the boundaries between chunks are checked.
+		chunk = N.asarray(energies[start:start + step + 1])
+		bad = N.flatnonzero(chunk[1:] - chunk[:-1] <= threshold)
+
+		if len(bad) > 0:
+			return start + bad[0]
+
+	return None
+
+def _merge_runs(energies, degeneracies, starts):
+	"""
+	Merge runs of sorted levels, each beginning at one of starts, into single
+	levels with the sum of the degeneracies and the mean of the energies
+	weighted by degeneracy.
+
+	Returns (energies, degeneracies, largest spread of energies in a run).
+	"""
+
+	ends = N.concatenate([starts[1:], [len(energies)]])
+	merged_degeneracies = N.add.reduceat(degeneracies, starts)
+
+	# Weight by fractions of the total degeneracy rather than by the
+	# degeneracies themselves, which may be too large to multiply by.
+	with N.errstate(divide='ignore', invalid='ignore'):
+		fractions = N.asarray(degeneracies / N.repeat(merged_degeneracies, ends - starts), dtype=float)
+
+	merged_energies = N.add.reduceat(energies * fractions, starts)
+
+	# Single levels and runs of equal energies keep their energies exactly, as
+	# do runs without any degeneracy to weight by.
+	keep = (energies[ends - 1] == energies[starts]) | (merged_degeneracies == 0)
+	merged_energies[keep] = energies[starts[keep]]
+
+	max_spread = N.max(energies[ends - 1] - energies[starts], initial=0)
+
+	return merged_energies, merged_degeneracies, float(max_spread)
+
+def _anchored_runs(energies, starts, tolerance):
+	"""
+	Starts of runs of sorted levels, splitting the clusters beginning at
+	starts so that no level is more than tolerance above the first level of
+	its run.
+
+	Only clusters which are too wide are split, greedily from their first
+	level.
+	"""
+
+	ends = N.concatenate([starts[1:], [len(energies)]])
+	wide = N.flatnonzero(energies[ends - 1] - energies[starts] > tolerance)
+
+	if len(wide) == 0:
+		return starts
+
+	extra = []
+
+	for start, end in zip(starts[wide], ends[wide]):
+		while True:
+			start += N.searchsorted(energies[start:end], energies[start] + tolerance, side='right')
+
+			if start >= end:
+				break
+
+			extra.append(start)
+
+	return N.union1d(starts, extra)
+
+def _raise_at(energies, i):
+	raise NonIncreasingEnergies('{0} >= {1}'.format(energies[i], energies[i+1]))
+
+def canonicalize_levels(energies, degeneracies, sort=False, merge_tolerance=None, chunk_size=None):
+	"""
+	Bring levels into canonical form, with the energies strictly increasing.
+
+	Unless sort is true, energies out of order cause a NonIncreasingEnergies
+	exception to be raised; otherwise, the levels are sorted by energy (stably,
+	so levels of equal energy keep their order).
+
+	Unless merge_tolerance is given, equal energies cause a
+	NonIncreasingEnergies exception to be raised; otherwise, runs of levels
+	no more than merge_tolerance above the first level of the run are merged
+	into a single level. Each run starts at the first level not in the
+	previous one, so no run spans more than merge_tolerance, however closely
+	spaced the levels are. The merged level has the sum of the degeneracies,
+	and the mean of the energies weighted by degeneracy. A tolerance of 0
+	merges only equal energies.
+
+	Returns (energies, degeneracies, report), where report is a
+	CanonicalizationReport. Levels which are already canonical are returned as
+	given, without being copied, after a check which works through chunk_size
+	levels at a time (or all of them at once); otherwise, the result is in
+	memory.
+	"""
+
+	energies = N.asarray(energies)
+	degeneracies = N.asarray(degeneracies)
+	num_input = len(energies)
+
+	threshold = 0 if merge_tolerance is None else max(0, merge_tolerance)
+	i = _first_gap_at_most(energies, threshold, chunk_size)
+
+	if i is None:
+		return energies, degeneracies, CanonicalizationReport(num_input, 0, 0, 0.0)
+
+	if not sort and (merge_tolerance is None or energies[i+1] < energies[i]):
+		_raise_at(energies, i)
+
+	energies = N.array(energies)
+	degeneracies = N.array(degeneracies)
+	num_moved = 0
+
+	gaps = N.diff(energies)
+	descending = gaps < 0
+
+	if descending.any():
+		if not sort:
+			_raise_at(energies, N.flatnonzero(descending)[0])
+
+		order = N.argsort(energies, kind='mergesort')
+		num_moved = N.count_nonzero(order != N.arange(num_input))
+
+		energies = energies[order]
+		degeneracies = degeneracies[order]
+		gaps = N.diff(energies)
+
+	close = gaps <= threshold
+
+	if not close.any():
+		return energies, degeneracies, CanonicalizationReport(num_input, num_moved, 0, 0.0)
+
+	if merge_tolerance is None:
+		_raise_at(energies, N.flatnonzero(close)[0])
+
+	# Each cluster of close levels starts after a gap that isn't close, and is
+	# split into runs from there.
+	starts = _anchored_runs(energies, N.flatnonzero(N.concatenate([[True], ~close])), threshold)
+	merged_energies, merged_degeneracies, max_spread = _merge_runs(energies, degeneracies, starts)
+
+	return (merged_energies, merged_degeneracies,
+			CanonicalizationReport(num_input, num_moved, num_input - len(starts), max_spread))
+
+def bin_levels(energies, degeneracies, origin, width, chunk_size=None):
+	"""
+	Merge sorted levels which fall into the same bin of the given width, with
+	bins starting at origin, into single levels with the sum of the
+	degeneracies and the mean of the energies weighted by degeneracy.
+
+	The levels are read chunk_size at a time (or all at once), so they may be
+	memory-mapped; the result is in memory.
+
+	Returns (energies, degeneracies).
+	"""
+
+	energies = N.asarray(energies)
+	degeneracies = N.asarray(degeneracies)
+
+	step = chunk_size if chunk_size is not None else max(1, len(energies))
+
+	pieces = []
+
+	for start in xrange(0, len(energies), step):
+		chunk_energies = N.asarray(energies[start:start + step], dtype=float)
+		chunk_degeneracies = N.asarray(degeneracies[start:start + step])
+
+		bins = N.floor((chunk_energies - origin) / width)
+		starts = N.flatnonzero(N.concatenate([[True], bins[1:] != bins[:-1]]))
+
+		merged_energies, merged_degeneracies, _ = _merge_runs(chunk_energies, chunk_degeneracies, starts)
+		pieces.append((bins[starts], merged_energies, merged_degeneracies))
+
+	if len(pieces) <= 1:
+		return (pieces[0][1], pieces[0][2]) if pieces else (energies[:0].astype(float), degeneracies[:0])
+
+	# Bins may straddle the boundaries between chunks.
+	bins, energies, degeneracies = [N.concatenate(xs) for xs in zip(*pieces)]
+	starts = N.flatnonzero(N.concatenate([[True], bins[1:] != bins[:-1]]))
+
+	return _merge_runs(energies, degeneracies, starts)[:2]
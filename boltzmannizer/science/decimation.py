@@ -0,0 +1,98 @@
+from __future__ import division
+
+import numpy as N
+
+
+def _extreme_positions(ys, starts):
+	"""
+	Positions of the smallest and largest values in each of the runs of ys
+	beginning at starts, ignoring NaN unless a run has nothing else.
+	"""
+
+	ends = N.concatenate([starts[1:], [len(ys)]])
+	runs = N.repeat(N.arange(len(starts)), ends - starts)
+
+	nan = N.isnan(ys)
+
+	# Sorting by value within each run puts the extremes at its ends.
+	lowest = N.lexsort((N.where(nan, N.inf, ys), runs))[starts]
+	highest = N.lexsort((N.where(nan, -N.inf, ys), runs))[ends - 1]
+
+	return lowest, highest
+
+def min_max_indices(xs, ys, num_bins, x_range=None):
+	"""
+	Indices of the points of one or more curves needed to draw them at a
+	resolution of num_bins columns (such as pixels) without visible change.
+
+	xs: Increasing positions of the points, shared by the curves.
+	ys: Values of the curves, either 1D or (curves x points).
+	num_bins: Number of equal ranges of x to divide the view into.
+	x_range: (low, high) range of x in view, or the whole of xs by default.
+
+	Within each range, the points with the smallest and largest values of
+	every curve are kept, as are the first and last points in view, and the
+	nearest point beyond the view on either side, so that lines still leave
+	the view in the right direction. Around each run of NaN, the last point
+	before it, its first NaN and the first point after it are kept too, so
+	that gaps in the curves stay gaps of the same width.
+
+	Returns the sorted indices, which are all of them if there are few
+	enough points already.
+	"""
+
+	xs = N.asarray(xs, dtype=float)
+
+	if len(xs) == 0:
+		return N.zeros(0, dtype=int)
+
+	ys = N.asarray(ys, dtype=float).reshape((-1, len(xs)))
+
+	if x_range is None:
+		if len(xs) <= 2 * num_bins + 2:
+			return N.arange(len(xs))
+
+		low, high = xs[0], xs[-1]
+	else:
+		low, high = x_range
+
+	first, last = N.searchsorted(xs, low, side='left'), N.searchsorted(xs, high, side='right')
+
+	# The nearest points beyond the view, if there are any.
+	pieces = [[i for i in (first - 1, last) if 0 <= i < len(xs)]]
+
+	if last - first <= 2 * num_bins + 2 or high <= low:
+		pieces.append(N.arange(first, last))
+	else:
+		# The top of the view belongs to the last range.
+		bins = N.minimum(N.floor((xs[first:last] - low) / (high - low) * num_bins), num_bins - 1)
+		starts = N.flatnonzero(N.concatenate([[True], bins[1:] != bins[:-1]]))
+
+		for curve in ys:
+			pieces.extend(first + p for p in _extreme_positions(curve[first:last], starts))
+
+		pieces.append([first, last - 1])
+
+		for curve in ys:
+			nan = N.isnan(curve[first:last])
+			previous_nan = N.concatenate([[False], nan[:-1]])
+
+			gap_starts = N.flatnonzero(nan & ~previous_nan)
+			gap_ends = N.flatnonzero(~nan & previous_nan)
+
+			pieces.append(first + N.concatenate([gap_starts[gap_starts > 0] - 1, gap_starts, gap_ends]))
+
+	return N.unique(N.concatenate(pieces).astype(int))
+
+def decimate(xs, ys, num_bins, x_range=None):
+	"""
+	Reduce one or more curves to the points given by min_max_indices.
+
+	Returns (xs, ys) with only those points.
+	"""
+
+	xs = N.asarray(xs)
+	ys = N.asarray(ys)
+	indices = min_max_indices(xs, ys, num_bins, x_range)
+
+	return xs[indices], ys[..., indices]
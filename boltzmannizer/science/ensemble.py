@@ -0,0 +1,288 @@
+from __future__ import division
+
+import numpy as N
+
+from boltzmannizer.science.boltzmann_distribution import as_temperatures
+from boltzmannizer.science.moments import log_weights, MOMENTS_DTYPE, PartialMoments
+from boltzmannizer.tools.cache import cached_method, ResultCache
+
+
+class _Pack(object):
+	"""
+	Levels of some members of an ensemble, concatenated into flat arrays with
+	offsets marking where each member starts (as in compressed sparse row
+	storage), so that reductions over the levels of each member are
+	segmented.
+	"""
+
+	def __init__(self, members):
+		"""
+		members: Non-empty BoltzmannDistributions, evaluated in memory.
+		"""
+
+		counts = N.array([len(bd.energies) for bd in members], dtype=int)
+
+		self.num_levels = counts.sum()
+		self.k_Bs = N.array([bd.k_B for bd in members], dtype=float)[:, N.newaxis]
+		self.ground_energies = N.array([bd.ground_energy for bd in members], dtype=float)[:, N.newaxis]
+
+		self.shifted_energies = N.concatenate([bd.energies - bd.ground_energy for bd in members])
+		self.log_degeneracies = N.concatenate([bd.log_degeneracies for bd in members])
+
+		self.starts = N.concatenate([[0], N.cumsum(counts)[:-1]]).astype(int)
+		# Index of the segment containing each level.
+		self.segments = N.repeat(N.arange(len(members)), counts)
+
+		# Energies in units of temperature, so that the same value of 1/T
+		# applies to all the members, whatever their k_B.
+		self.scaled_energies = self.shifted_energies / N.repeat(self.k_Bs[:, 0], counts)
+
+	def blocks(self, num_temps, max_elements):
+		"""
+		Slices which split num_temps temperatures into blocks, so that no
+		(levels x temperatures) intermediate array has more than max_elements
+		elements.
+		"""
+
+		step = max(1, max_elements // max(1, self.num_levels))
+
+		for start in xrange(0, num_temps, step):
+			yield slice(start, start + step)
+
+	def log_weights(self, Ts):
+		return log_weights(1, self.scaled_energies, self.log_degeneracies, Ts)
+
+	def segment_shift(self, ws):
+		result = N.maximum.reduceat(ws, self.starts, axis=0)
+		# Any finite shift will do when there's no weight at all.
+		result[~N.isfinite(result)] = 0
+
+		return result
+
+	def ps(self, Ts):
+		"""
+		Probabilities of occupying the levels for a 1D array of temperatures,
+		as a (levels x temperatures) array.
+		"""
+
+		ws = self.log_weights(Ts)
+		shift = self.segment_shift(ws)
+
+		xs = N.exp(ws - shift[self.segments])
+		log_Z_shifted = shift + N.log(N.add.reduceat(xs, self.starts, axis=0))
+
+		return N.exp(ws - log_Z_shifted[self.segments])
+
+	def partial_moments(self, Ts):
+		"""
+		PartialMoments of all the members for a 1D array of temperatures, as
+		(members x temperatures) arrays.
+		"""
+
+		ws = self.log_weights(Ts)
+		shift = self.segment_shift(ws)
+
+		xs = N.exp(ws - shift[self.segments])
+		weight = N.add.reduceat(xs, self.starts, axis=0)
+
+		# There is always some weight, because every segment has a ground
+		# state with a finite log-weight.
+		mean = N.add.reduceat(xs * self.shifted_energies[:, N.newaxis], self.starts, axis=0) / weight
+		mean_log_g = N.add.reduceat(xs * self.log_degeneracies[:, N.newaxis], self.starts, axis=0) / weight
+
+		deviations = self.shifted_energies[:, N.newaxis] - mean[self.segments]
+		weighted = xs * deviations
+		m2 = N.add.reduceat(weighted * deviations, self.starts, axis=0)
+		c2 = N.add.reduceat(weighted * (self.log_degeneracies[:, N.newaxis] - mean_log_g[self.segments]), self.starts, axis=0)
+
+		return PartialMoments(shift, weight, mean, m2, mean_log_g, c2)
+
+
+class BoltzmannEnsemble(object):
+	"""
+	Many Boltzmann distributions grouped together, so that their quantities
+	can be evaluated for all of them at once on a shared set of temperatures.
+
+	Small members are packed together (see _Pack) in groups of at most
+	MAX_BLOCK_ELEMENTS levels, and each group is evaluated in a single pass.
+	Members with more levels than that, or which are evaluated out of core,
+	are evaluated on their own by BoltzmannDistribution.moments, which works
+	through their levels in chunks and truncates them at low temperature. So
+	no intermediate array has more than MAX_BLOCK_ELEMENTS elements, beyond
+	what the members themselves allow.
+
+	All the quantities which depend on temperature accept either a scalar
+	temperature or an array of temperatures, and give results with an extra
+	leading axis for the members.
+	"""
+
+	# Upper bound on the number of elements in any (levels x temperatures)
+	# intermediate array for the packed members, and on the number of levels
+	# in a packed member.
+	MAX_BLOCK_ELEMENTS = 2 ** 22
+
+	def __init__(self, distributions):
+		"""
+		distributions: Sequence of BoltzmannDistributions.
+		"""
+
+		self._result_cache = ResultCache()
+
+		self._members = list(distributions)
+
+		self._counts = N.array([len(bd.energies) for bd in self._members], dtype=int)
+		self._offsets = N.concatenate([[0], N.cumsum(self._counts)]).astype(int)
+
+		# Worked out on first use (see _groups).
+		self._grouping = None
+
+	def __len__(self):
+		return len(self._members)
+
+	@property
+	def members(self):
+		return self._members
+
+	@property
+	def offsets(self):
+		"""
+		Offsets of the levels of each member in the concatenation of all their
+		levels, with one extra entry for the total number of levels.
+		"""
+
+		return self._offsets
+
+	@cached_method
+	def moments(self, T):
+		"""
+		Thermodynamic quantities of all the members at temperature T, as in
+		BoltzmannDistribution.moments.
+		"""
+
+		Ts, shape = as_temperatures(T)
+		result = N.empty((len(self), len(Ts)), dtype=MOMENTS_DTYPE)
+
+		packs, separate, empty = self._groups()
+
+		result[empty] = PartialMoments.empty(len(Ts)).finish(1, 0, Ts)
+
+		for indices, pack in packs:
+			for block in pack.blocks(len(Ts), self.MAX_BLOCK_ELEMENTS):
+				result[indices, block] = pack.partial_moments(Ts[block]).finish(pack.k_Bs, pack.ground_energies,
+						Ts[block])
+
+		for i in separate:
+			result[i] = self._members[i].moments(Ts)
+
+		return result.reshape((len(self),) + shape)
+
+	@cached_method
+	def log_Z(self, T):
+		"""
+		Natural logarithm of the partition function of each member.
+		"""
+
+		return self.moments(T)['log_Z']
+
+	@cached_method
+	def Z(self, T):
+		"""
+		Partition function of each member.
+		"""
+
+		return self.moments(T)['Z']
+
+	@cached_method
+	def energy(self, T):
+		"""
+		Internal energy of each member.
+		"""
+
+		return self.moments(T)['U']
+
+	@cached_method
+	def entropy(self, T):
+		"""
+		Gibbs entropy of each member.
+		"""
+
+		return self.moments(T)['S']
+
+	@cached_method
+	def heat_capacity(self, T):
+		"""
+		Heat capacity of each member.
+		"""
+
+		return self.moments(T)['C_V']
+
+	def ps(self, T):
+		"""
+		Probabilities of occupying the levels at temperature T, as a list with
+		one array per member in the same form as BoltzmannDistribution.ps.
+		"""
+
+		Ts, shape = as_temperatures(T)
+		result = [None] * len(self)
+
+		packs, separate, empty = self._groups()
+
+		for i in empty:
+			result[i] = N.zeros((0,) + shape)
+
+		for indices, pack in packs:
+			ps = N.empty((pack.num_levels, len(Ts)))
+
+			for block in pack.blocks(len(Ts), self.MAX_BLOCK_ELEMENTS):
+				ps[:, block] = pack.ps(Ts[block])
+
+			for i, start, count in zip(indices, pack.starts, self._counts[indices]):
+				result[i] = ps[start:start + count].reshape((count,) + shape)
+
+		for i in separate:
+			result[i] = self._members[i].ps(T)
+
+		return result
+
+	def _groups(self):
+		"""
+		The members split up for evaluation, as (packs, separate, empty), where
+		packs is a list of (indices of members, _Pack), separate has the
+		indices of the members evaluated on their own, and empty those of the
+		members without any levels.
+		"""
+
+		if self._grouping is not None:
+			return self._grouping
+
+		packs = []
+		separate = []
+		empty = []
+
+		# Consecutive members are packed until the next would make the pack too
+		# big.
+		pending = []
+		num_pending = 0
+
+		def flush():
+			if pending:
+				packs.append((N.array(pending, dtype=int), _Pack([self._members[i] for i in pending])))
+
+		for i, (bd, count) in enumerate(zip(self._members, self._counts)):
+			if count == 0:
+				empty.append(i)
+			elif bd.chunk_size is not None or count > self.MAX_BLOCK_ELEMENTS:
+				separate.append(i)
+			else:
+				if num_pending + count > self.MAX_BLOCK_ELEMENTS:
+					flush()
+					pending, num_pending = [], 0
+
+				pending.append(i)
+				num_pending += count
+
+		flush()
+
+		self._grouping = packs, separate, N.array(empty, dtype=int)
+
+		return self._grouping
@@ -0,0 +1,855 @@
+from __future__ import division
+
+from collections import namedtuple
+from itertools import islice
+from json import dumps, JSONDecoder, loads
+import os
+from os.path import abspath, dirname
+import re
+from struct import pack, unpack
+from tempfile import TemporaryFile
+
+import numpy as N
+
+from boltzmannizer.science.canonicalization import canonicalize_levels
+
+
+class InvalidFormat(Exception): pass
+
+
+# Contents of a level file.
+LevelData = namedtuple('LevelData', ['k_B', 'energies', 'degeneracies', 'units'])
+
+
+# Binary level files start with these bytes, followed by the length of the
+# header as a little-endian 64-bit integer, the header itself as JSON, and
+# finally the raw columns.
+BINARY_MAGIC = b'BOLTZLVL'
+# The columns start at multiples of this many bytes.
+BINARY_ALIGNMENT = 64
+
+# Number of levels written at a time.
+WRITE_CHUNK_SIZE = 2 ** 16
+
+
+def _clean_units(units):
+	"""
+	Units would be nice to have, but don't complain if something's wrong.
+	"""
+
+	try:
+		assert 'energy' in units
+		assert 'temperature' in units
+	except:
+		return None
+
+	return units
+
+def _check_format_version(data):
+	try:
+		format_version = data['format_version']
+	except KeyError:
+		raise InvalidFormat('No format_version specified')
+
+	if format_version != 1:
+		raise InvalidFormat('Unable to parse file with format_version: {0}'.format(format_version))
+
+def _partial_path(path):
+	"""
+	Where a level file is written before it's complete.
+	"""
+
+	return path + '.part'
+
+def _aligned(offset):
+	return -(-offset // BINARY_ALIGNMENT) * BINARY_ALIGNMENT
+
+
+def is_binary(path):
+	"""
+	Whether the file at path is a binary level file.
+	"""
+
+	with open(path, 'rb') as f:
+		return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+def read_levels(path):
+	"""
+	Read a level file in either format.
+	"""
+
+	if is_binary(path):
+		return read_binary(path)
+	else:
+		return read_json(path)
+
+def read_json(path):
+	"""
+	Read a JSON level file.
+
+	The levels are parsed incrementally into NumPy arrays as the file is read,
+	so memory use is bounded by the size of the arrays themselves, not the
+	size of the file.
+
+	Any exceptions that might happen due to reading or parsing the file are
+	passed through.
+
+	In addition, an InvalidFormat exception may be raised if the contents of
+	the file do not make sense.
+	"""
+
+	data = {}
+	energies = degeneracies = None
+
+	with open(path) as f:
+		stream = _JSONStream(f)
+
+		stream.expect('{')
+
+		if stream.peek() == '}':
+			stream.expect('}')
+		else:
+			while True:
+				key = stream.value()
+				stream.expect(':')
+
+				if key == 'levels':
+					energies, degeneracies = _read_json_levels(stream)
+				else:
+					data[key] = stream.value()
+
+				if stream.expect(',}') == '}':
+					break
+
+		if stream.peek() != '':
+			raise ValueError('Extra data after the top-level object')
+
+	_check_format_version(data)
+
+	try:
+		k_B = data['k_B']
+	except KeyError as exc:
+		raise InvalidFormat('Missing data: {0}'.format(exc))
+
+	if energies is None:
+		raise InvalidFormat('Missing data: {0!r}'.format(u'levels'))
+
+	return LevelData(k_B, energies, degeneracies, _clean_units(data.get('units')))
+
+def _read_json_levels(stream):
+	"""
+	Read the array of levels from stream into arrays of energies and
+	degeneracies.
+	"""
+
+	energies = _GrowableArray(float)
+	degeneracies = _GrowableArray(int)
+
+	stream.expect('[')
+
+	if stream.peek() == ']':
+		stream.expect(']')
+	else:
+		i = 0
+
+		while True:
+			levels = stream.elements() or [stream.value()]
+
+			if all(isinstance(level, list) and len(level) == 2 for level in levels):
+				# The common case, which can be handled in bulk.
+				level_energies, level_degeneracies = zip(*levels)
+
+				energies.extend(level_energies)
+				degeneracies.extend(level_degeneracies)
+			else:
+				for j, level in enumerate(levels, start=i):
+					try:
+						energies.extend([level[0]])
+					except IndexError:
+						raise InvalidFormat('Missing energy in level {0}'.format(j))
+					except (KeyError, TypeError):
+						raise InvalidFormat('Level {0} is not a list'.format(j))
+
+					try:
+						degeneracies.extend([level[1]])
+					except IndexError:
+						# Default degeneracy is 1.
+						degeneracies.extend([1])
+
+			i += len(levels)
+
+			if stream.expect(',]') == ']':
+				break
+
+	return energies.finish(), degeneracies.finish()
+
+
+class _GrowableArray(object):
+	"""
+	NumPy array which can be extended, doubling its capacity as needed.
+
+	Integer arrays are promoted to floating point as soon as a float is
+	added, and to Python objects if an integer is too large for them.
+	"""
+
+	def __init__(self, dtype, capacity=1024):
+		self._data = N.empty(capacity, dtype=dtype)
+		self._size = 0
+
+	def extend(self, values):
+		values = N.array(values)
+
+		if values.dtype.kind not in 'iufbO':
+			raise ValueError('Not a number: {0!r}'.format(values[0]))
+
+		if self._data.dtype.kind == 'i' and values.dtype.kind in 'fO':
+			self._data = self._data.astype(values.dtype)
+
+		size = self._size + len(values)
+
+		if size > len(self._data):
+			data = N.empty(max(size, 2 * len(self._data)), dtype=self._data.dtype)
+			data[:self._size] = self._data[:self._size]
+			self._data = data
+
+		self._data[self._size:size] = values
+		self._size = size
+
+	def finish(self):
+		"""
+		The values, trimmed to size.
+		"""
+
+		result = self._data
+		result.resize(self._size, refcheck=False)
+
+		return result
+
+
+class _JSONStream(object):
+	"""
+	Incremental reader for a JSON document in a text file, which only keeps a
+	small window of the file in memory.
+	"""
+
+	WHITESPACE = re.compile(r'[ \t\n\r]*')
+	BRACKETS = re.compile(r'[\[\]]')
+	# Characters which can follow a complete value.
+	DELIMITERS = frozenset(' \t\n\r,:]}')
+	# Values longer than this many characters are not supported, so that a
+	# malformed file doesn't get read entirely into memory.
+	MAX_VALUE_SIZE = 2 ** 24
+
+	# Number of characters read from the file at a time.
+	READ_SIZE = 2 ** 16
+
+	def __init__(self, f):
+		self._f = f
+		self._buf = ''
+		self._pos = 0
+		self._eof = False
+		self._scan = JSONDecoder().scan_once
+		# Buffer in which elements() last found nothing to decode, so that it
+		# isn't searched again until more of the file is read.
+		self._exhausted = None
+
+	def peek(self):
+		"""
+		Next non-whitespace character, without consuming it, or '' at the end
+		of the document.
+		"""
+
+		while True:
+			self._pos = self.WHITESPACE.match(self._buf, self._pos).end()
+
+			if self._pos < len(self._buf) or not self._fill():
+				return self._buf[self._pos:self._pos + 1]
+
+	def expect(self, chars):
+		"""
+		Consume the next non-whitespace character, which must be one of chars,
+		and return it.
+		"""
+
+		c = self.peek()
+
+		if c == '' or c not in chars:
+			raise ValueError('Expected one of {0!r} but found {1!r}'.format(list(chars), c))
+
+		self._pos += 1
+
+		return c
+
+	def value(self):
+		"""
+		Decode the next JSON value.
+		"""
+
+		self.peek()
+
+		while True:
+			try:
+				result, end = self._scan(self._buf, self._pos)
+			except StopIteration:
+				if not self._refill():
+					raise ValueError('Expected a value at character {0} of the window'.format(self._pos))
+
+				continue
+			except ValueError:
+				# Possibly just cut short by the end of the buffer.
+				if not self._refill():
+					raise
+
+				continue
+
+			# A value running up to the end of the buffer (such as a number) may
+			# have been cut short, so only trust it once it's followed by
+			# something that can't continue it.
+			if self._buf[end:end + 1] in self.DELIMITERS or not self._refill():
+				self._pos = end
+
+				return result
+
+	def elements(self):
+		"""
+		Decode a run of consecutive elements of an array whose elements are
+		flat arrays (such as the levels), starting at the current position,
+		which must be at the start of an element.
+
+		Only the elements which are entirely in the buffer are decoded, all
+		in one go, and the position is left just after the last of them. If
+		that doesn't work out, nothing is consumed and an empty list is
+		returned.
+		"""
+
+		if self._buf is self._exhausted:
+			return []
+
+		end = len(self._buf)
+
+		# The last closing bracket in the buffer normally ends an element, but
+		# it might end the enclosing array, so try the one before it too.
+		for _ in xrange(2):
+			end = self._buf.rfind(']', self._pos, end)
+
+			if end < 0:
+				break
+
+			try:
+				result = loads('[' + self._buf[self._pos:end + 1] + ']')
+			except ValueError:
+				continue
+
+			self._pos = end + 1
+
+			return result
+
+		# Whatever follows the enclosing array has brackets of its own, so find
+		# the end of the last element by keeping track of the depth instead.
+		end = self._pos
+		depth = 0
+
+		for match in self.BRACKETS.finditer(self._buf, self._pos):
+			if match.group() == '[':
+				depth += 1
+			else:
+				depth -= 1
+
+				if depth < 0:
+					break
+				elif depth == 0:
+					end = match.end()
+
+		if end > self._pos:
+			try:
+				result = loads('[' + self._buf[self._pos:end] + ']')
+			except ValueError:
+				pass
+			else:
+				self._pos = end
+
+				return result
+
+		self._exhausted = self._buf
+
+		return []
+
+	def _refill(self):
+		"""
+		Read more of the file after a failed decode, unless the pending value is
+		already too long to plausibly be incomplete.
+		"""
+
+		if len(self._buf) - self._pos > self.MAX_VALUE_SIZE:
+			return False
+
+		return self._fill()
+
+	def _fill(self):
+		"""
+		Read more of the file into the buffer, dropping what has already been
+		consumed. Returns False at the end of the file.
+		"""
+
+		if self._eof:
+			return False
+
+		data = self._f.read(self.READ_SIZE)
+
+		if not data:
+			self._eof = True
+
+			return False
+
+		self._buf = self._buf[self._pos:] + data
+		self._pos = 0
+
+		return True
+
+def read_binary(path):
+	"""
+	Read a binary level file.
+
+	The columns are memory-mapped read-only, so nothing is copied until it's
+	accessed.
+
+	An InvalidFormat exception is raised if the header is malformed, or if the
+	file is too short for the columns it describes.
+	"""
+
+	with open(path, 'rb') as f:
+		if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+			raise InvalidFormat('Not a binary level file')
+
+		try:
+			header_length, = unpack('<Q', f.read(8))
+			header = loads(f.read(header_length).decode('utf-8'))
+		except Exception as exc:
+			raise InvalidFormat('Unreadable header: {0}'.format(exc))
+
+	_check_format_version(header)
+
+	try:
+		k_B = header['k_B']
+		num_levels = header['num_levels']
+		columns = header['columns']
+	except KeyError as exc:
+		raise InvalidFormat('Missing data: {0}'.format(exc))
+
+	file_size = os.path.getsize(path)
+
+	def column(name):
+		try:
+			dtype = N.dtype(str(columns[name]['dtype']))
+			offset = columns[name]['offset']
+		except (KeyError, TypeError) as exc:
+			raise InvalidFormat('Bad column {0}: {1}'.format(name, exc))
+
+		if num_levels == 0:
+			# Can't map nothing.
+			return N.zeros(0, dtype=dtype)
+
+		if offset + num_levels * dtype.itemsize > file_size:
+			raise InvalidFormat('Truncated column {0}'.format(name))
+
+		return N.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(num_levels,))
+
+	return LevelData(k_B, column('energies'), column('degeneracies'), _clean_units(header.get('units')))
+
+def _binary_header(k_B, units, num_levels, energies_dtype, degeneracies_dtype, energies_offset):
+	"""
+	Header of a binary level file, as bytes.
+	"""
+
+	header = {
+			'format_version': 1,
+			'k_B': k_B,
+			'units': units,
+			'num_levels': num_levels,
+			'columns': {
+				'energies': {
+					'dtype': energies_dtype.str,
+					'offset': energies_offset,
+					},
+				'degeneracies': {
+					'dtype': degeneracies_dtype.str,
+					'offset': _aligned(energies_offset + num_levels * energies_dtype.itemsize),
+					},
+				},
+			}
+
+	return dumps(header, sort_keys=True).encode('utf-8')
+
+def _degeneracies_dtype(degeneracies):
+	"""
+	Type in which degeneracies are stored in binary level files.
+	"""
+
+	if degeneracies.dtype.kind in 'iub':
+		return N.dtype('<i8')
+	elif degeneracies.dtype.kind == 'f':
+		return N.dtype('<f8')
+	else:
+		raise ValueError('Degeneracies must be stored as numbers, not {0}'.format(degeneracies.dtype))
+
+def write_binary(path, k_B, energies, degeneracies, units=None):
+	"""
+	Write a binary level file.
+
+	The columns are written a chunk at a time, so energies and degeneracies
+	may themselves be memory-mapped.
+	"""
+
+	energies = N.asarray(energies)
+	degeneracies = N.asarray(degeneracies)
+	num_levels = len(energies)
+
+	if len(degeneracies) != num_levels:
+		raise ValueError("Number of energies doesn't match number of degeneracies")
+
+	degeneracies_dtype = _degeneracies_dtype(degeneracies)
+	energies_dtype = N.dtype('<f8')
+
+	# The header contains the offsets, which depend on the length of the
+	# header. Growing the offset only makes the header longer when the offset
+	# gains digits, so this settles almost immediately.
+	energies_offset = BINARY_ALIGNMENT
+
+	while True:
+		header = _binary_header(k_B, units, num_levels, energies_dtype, degeneracies_dtype, energies_offset)
+		start = _aligned(len(BINARY_MAGIC) + 8 + len(header))
+
+		if start <= energies_offset:
+			break
+
+		energies_offset = start
+
+	degeneracies_offset = _aligned(energies_offset + num_levels * energies_dtype.itemsize)
+
+	with open(path, 'wb') as f:
+		f.write(BINARY_MAGIC)
+		f.write(pack('<Q', len(header)))
+		f.write(header)
+
+		for offset, column, dtype in [(energies_offset, energies, energies_dtype), (degeneracies_offset, degeneracies, degeneracies_dtype)]:
+			f.write(b'\0' * (offset - f.tell()))
+
+			for start in xrange(0, num_levels, WRITE_CHUNK_SIZE):
+				f.write(N.asarray(column[start:start + WRITE_CHUNK_SIZE]).astype(dtype).tobytes())
+
+def write_json(path, k_B, energies, degeneracies, units=None):
+	"""
+	Write a JSON level file, laid out in the same way as by col2json.py.
+
+	The levels are written a chunk at a time, so energies and degeneracies
+	may be memory-mapped.
+	"""
+
+	energies = N.asarray(energies)
+	degeneracies = N.asarray(degeneracies)
+
+	if len(energies) != len(degeneracies):
+		raise ValueError("Number of energies doesn't match number of degeneracies")
+
+	with JSONLevelWriter(path, k_B, units) as writer:
+		for start in xrange(0, len(energies), WRITE_CHUNK_SIZE):
+			chunk = slice(start, start + WRITE_CHUNK_SIZE)
+
+			writer.write(energies[chunk], degeneracies[chunk])
+
+
+class JSONLevelWriter(object):
+	"""
+	Writer for JSON level files which takes the levels a chunk at a time, so
+	that they never need to all be in memory.
+
+	f may be a path or an open file (which is left open). A path is only
+	written to once the writer is closed; until then, the levels go to a
+	temporary file alongside it.
+
+	Used as a context manager, the writer is closed on success, and aborted if
+	an exception is raised.
+	"""
+
+	def __init__(self, f, k_B, units=None):
+		if hasattr(f, 'write'):
+			self._f = f
+			self._path = None
+		else:
+			self._path = f
+			self._f = open(_partial_path(f), 'w')
+
+		self.num_levels = 0
+
+		self._f.write('{{ "format_version": 1\n, "k_B": {0}\n'.format(dumps(k_B)))
+
+		if units is not None:
+			self._f.write(', "units": {{ "energy": {0}\n           , "temperature": {1}\n           }}\n'.format(
+					dumps(units['energy']), dumps(units['temperature'])))
+
+		self._f.write(', "levels": [')
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.close()
+		else:
+			self.abort()
+
+	def write(self, energies, degeneracies):
+		"""
+		Append some levels.
+		"""
+
+		lines = []
+
+		for e, d in zip(N.asarray(energies).tolist(), N.asarray(degeneracies).tolist()):
+			lines.append('[{0}, {1}]\n'.format(dumps(e), dumps(d)))
+
+		if not lines:
+			return
+
+		if self.num_levels == 0:
+			lines[0] = ' ' + lines[0]
+		else:
+			lines[0] = '            , ' + lines[0]
+
+		self._f.write('            , '.join(lines))
+		self.num_levels += len(lines)
+
+	def close(self):
+		if self._f is None:
+			return
+
+		if self.num_levels == 0:
+			self._f.write('\n')
+
+		self._f.write('            ]\n}\n')
+
+		if self._path is not None:
+			self._f.close()
+			os.rename(_partial_path(self._path), self._path)
+
+		self._f = None
+
+	def abort(self):
+		"""
+		Stop writing without finishing the file. A path is left untouched; an
+		open file is left with an incomplete (and so invalid) document.
+		"""
+
+		if self._f is None:
+			return
+
+		if self._path is not None:
+			self._f.close()
+			os.remove(_partial_path(self._path))
+
+		self._f = None
+
+
+class BinaryLevelWriter(object):
+	"""
+	Writer for binary level files which takes the levels a chunk at a time, so
+	that they never need to all be in memory.
+
+	The energies go straight into a temporary file alongside path, after
+	space reserved for the header, which is filled in once the number of
+	levels is known. The degeneracies are kept in another temporary file until
+	then. The result only replaces path once the writer is closed.
+
+	Used as a context manager, the writer is closed on success, and aborted if
+	an exception is raised.
+	"""
+
+	# Largest number of levels that the reserved header space allows for.
+	MAX_LEVELS = 10 ** 15
+
+	def __init__(self, path, k_B, units=None):
+		self._path = path
+		self._k_B = k_B
+		self._units = units
+
+		self.num_levels = 0
+		self._degeneracies_dtype = None
+
+		# Enough room for the header with the longest numbers it could have.
+		self._header_size = len(_binary_header(k_B, units, self.MAX_LEVELS, N.dtype('<f8'), N.dtype('<f8'),
+				self.MAX_LEVELS))
+		self._energies_offset = _aligned(len(BINARY_MAGIC) + 8 + self._header_size)
+
+		self._f = open(_partial_path(path), 'wb')
+		self._f.write(b'\0' * self._energies_offset)
+		self._degeneracies_f = TemporaryFile(dir=dirname(abspath(path)))
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.close()
+		else:
+			self.abort()
+
+	def write(self, energies, degeneracies):
+		"""
+		Append some levels.
+		"""
+
+		energies = N.asarray(energies)
+		degeneracies = N.asarray(degeneracies)
+
+		if len(energies) != len(degeneracies):
+			raise ValueError("Number of energies doesn't match number of degeneracies")
+
+		if len(energies) == 0:
+			return
+
+		if self.num_levels + len(energies) > self.MAX_LEVELS:
+			raise ValueError('Too many levels')
+
+		dtype = _degeneracies_dtype(degeneracies)
+
+		if self._degeneracies_dtype is None:
+			self._degeneracies_dtype = dtype
+		elif self._degeneracies_dtype != dtype and dtype.kind == 'f':
+			self._promote_degeneracies()
+
+		self._f.write(energies.astype('<f8').tobytes())
+		self._degeneracies_f.write(degeneracies.astype(self._degeneracies_dtype).tobytes())
+		self.num_levels += len(energies)
+
+	def close(self):
+		if self._f is None:
+			return
+
+		degeneracies_dtype = self._degeneracies_dtype or N.dtype('<i8')
+		header = _binary_header(self._k_B, self._units, self.num_levels, N.dtype('<f8'), degeneracies_dtype,
+				self._energies_offset)
+
+		# Copy over the degeneracies.
+		self._f.write(b'\0' * (_aligned(self._f.tell()) - self._f.tell()))
+		self._degeneracies_f.seek(0)
+
+		while True:
+			data = self._degeneracies_f.read(WRITE_CHUNK_SIZE * degeneracies_dtype.itemsize)
+
+			if not data:
+				break
+
+			self._f.write(data)
+
+		# Padding the header with whitespace leaves it valid JSON.
+		self._f.seek(0)
+		self._f.write(BINARY_MAGIC)
+		self._f.write(pack('<Q', self._header_size))
+		self._f.write(header + b' ' * (self._header_size - len(header)))
+
+		self._f.close()
+		self._degeneracies_f.close()
+		self._f = None
+
+		os.rename(_partial_path(self._path), self._path)
+
+	def abort(self):
+		"""
+		Stop writing, leaving path untouched.
+		"""
+
+		if self._f is None:
+			return
+
+		self._f.close()
+		self._degeneracies_f.close()
+		self._f = None
+
+		os.remove(_partial_path(self._path))
+
+	def _promote_degeneracies(self):
+		"""
+		Switch the stored degeneracies from integers to floating point.
+		"""
+
+		f = TemporaryFile(dir=dirname(abspath(self._path)))
+		self._degeneracies_f.seek(0)
+
+		while True:
+			data = self._degeneracies_f.read(WRITE_CHUNK_SIZE * self._degeneracies_dtype.itemsize)
+
+			if not data:
+				break
+
+			f.write(N.frombuffer(data, dtype=self._degeneracies_dtype).astype('<f8').tobytes())
+
+		self._degeneracies_f.close()
+		self._degeneracies_f = f
+		self._degeneracies_dtype = N.dtype('<f8')
+
+
+def read_columns(lines, energies_column, degeneracies_column=None, chunk_size=WRITE_CHUNK_SIZE):
+	"""
+	Read levels from lines of whitespace-separated columns, such as the output
+	of electronic structure codes, chunk_size lines at a time.
+
+	The columns are given as zero-based indices; without a degeneracies
+	column, every degeneracy is 1. Empty lines are skipped.
+
+	Consecutive levels with numerically equal energies are merged, summing
+	their degeneracies, including across chunks. The energies must otherwise
+	be increasing, or NonIncreasingEnergies is raised.
+
+	Yields (energies, degeneracies) for consecutive chunks of levels.
+	"""
+
+	# The last level read can't be passed on until it's known that the next
+	# one doesn't have the same energy.
+	held_energies = N.zeros(0)
+	held_degeneracies = N.zeros(0, dtype=int)
+
+	lines = iter(lines)
+
+	while True:
+		chunk = list(islice(lines, chunk_size))
+
+		if not chunk:
+			break
+
+		rows = [line.split() for line in chunk]
+		rows = [row for row in rows if row]
+
+		if not rows:
+			continue
+
+		energies = N.array([row[energies_column] for row in rows], dtype=float)
+
+		if degeneracies_column is None:
+			degeneracies = N.ones(len(rows), dtype=int)
+		else:
+			# Python integers, in case they're too large for NumPy.
+			degeneracies = N.array([int(row[degeneracies_column]) for row in rows])
+
+		energies, degeneracies, _ = canonicalize_levels(N.concatenate([held_energies, energies]),
+				N.concatenate([held_degeneracies, degeneracies]), merge_tolerance=0)
+
+		held_energies, held_degeneracies = energies[-1:], degeneracies[-1:]
+
+		if len(energies) > 1:
+			yield energies[:-1], degeneracies[:-1]
+
+	if len(held_energies) > 0:
+		yield held_energies, held_degeneracies
+
+def convert(in_path, out_path, binary):
+	"""
+	Convert the level file at in_path (in either format) to a binary or JSON
+	level file at out_path.
+	"""
+
+	data = read_levels(in_path)
+
+	if binary:
+		write_binary(out_path, *data)
+	else:
+		write_json(out_path, *data)
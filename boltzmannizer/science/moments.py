@@ -0,0 +1,225 @@
+from __future__ import division
+
+import numpy as N
+
+
+# Fields of the records produced by thermodynamic_moments.
+MOMENTS_DTYPE = N.dtype([
+		('log_Z', float),
+		('Z', float),
+		('U', float),
+		('E_sq', float),
+		('var', float),
+		('cov_E_log_g', float),
+		('S', float),
+		('C_V', float),
+		])
+
+# Number of temperatures evaluated together against each chunk of levels.
+TEMPERATURE_BLOCK = 256
+
+
+def log_weights(k_B, shifted_energies, log_degeneracies, Ts):
+	"""
+	Logarithms of the Boltzmann factors relative to the ground state for a 1D
+	array of temperatures, as a (levels x temperatures) array.
+
+	$\\ln g_i - \\beta (E_i - E_0)$
+
+	At zero temperature, this is $\\ln g_0$ for the ground state and
+	$-\\infty$ for everything else.
+	"""
+
+	with N.errstate(divide='ignore', invalid='ignore'):
+		result = -N.outer(shifted_energies, 1 / (k_B * Ts))
+
+	# The ground state has no shifted energy, which would give 0 * inf at zero
+	# temperature.
+	result[shifted_energies == 0] = 0
+	result += log_degeneracies[:, N.newaxis]
+
+	return result
+
+
+class PartialMoments(object):
+	"""
+	Weighted moments of the shifted energies over some subset of the levels,
+	for a 1D array of temperatures.
+
+	Partial moments of disjoint subsets of levels can be merged, so the
+	moments of all the levels can be accumulated in a single pass over chunks
+	of them. The variance is kept centered throughout, so there is no
+	cancellation between $\\langle E^2 \\rangle$ and $\\langle E \\rangle^2$.
+
+	The total weight is stored relative to $e^{shift}$ to stay in range.
+	"""
+
+	__slots__ = ['shift', 'weight', 'mean', 'm2', 'mean_log_g', 'c2']
+
+	def __init__(self, shift, weight, mean, m2, mean_log_g, c2):
+		self.shift = shift
+		self.weight = weight
+		# Weighted mean of the shifted energies.
+		self.mean = mean
+		# Weighted sum of squared deviations from the mean, relative to
+		# $e^{shift}$ like the weight.
+		self.m2 = m2
+		# Weighted mean of the log-degeneracies.
+		self.mean_log_g = mean_log_g
+		# Weighted sum of products of deviations of the shifted energies and
+		# log-degeneracies from their means, scaled like m2.
+		self.c2 = c2
+
+	@classmethod
+	def empty(cls, num_temps):
+		zeros = N.zeros(num_temps)
+
+		return cls(N.repeat(-N.inf, num_temps), zeros, zeros, zeros, zeros, zeros)
+
+	@classmethod
+	def from_levels(cls, k_B, shifted_energies, log_degeneracies, Ts):
+		"""
+		Partial moments of the given levels.
+		"""
+
+		ws = log_weights(k_B, shifted_energies, log_degeneracies, Ts)
+
+		shift = N.max(ws, axis=0, initial=-N.inf)
+		# Any finite shift will do when there's no weight at all.
+		shift[~N.isfinite(shift)] = 0
+
+		xs = N.exp(ws - shift)
+		weight = xs.sum(axis=0)
+		# NaN weights (from NaN temperatures) carry on as NaN.
+		nonzero = weight != 0
+
+		with N.errstate(divide='ignore', invalid='ignore'):
+			mean = N.where(nonzero, N.dot(shifted_energies, xs) / weight, 0)
+			mean_log_g = N.where(nonzero, N.dot(log_degeneracies, xs) / weight, 0)
+
+		deviations = shifted_energies[:, N.newaxis] - mean
+		weighted = xs * deviations
+		m2 = (weighted * deviations).sum(axis=0)
+		c2 = (weighted * (log_degeneracies[:, N.newaxis] - mean_log_g)).sum(axis=0)
+
+		return cls(shift, weight, mean, m2, mean_log_g, c2)
+
+	def merge(self, other):
+		"""
+		Partial moments of the union of the levels of self and other.
+		"""
+
+		shift = N.maximum(self.shift, other.shift)
+		scale_a = N.exp(self.shift - shift)
+		scale_b = N.exp(other.shift - shift)
+
+		weight_a = self.weight * scale_a
+		weight_b = other.weight * scale_b
+		weight = weight_a + weight_b
+
+		with N.errstate(divide='ignore', invalid='ignore'):
+			frac_b = N.where(weight != 0, weight_b / weight, 0)
+
+		delta = other.mean - self.mean
+		delta_log_g = other.mean_log_g - self.mean_log_g
+
+		mean = self.mean + delta * frac_b
+		m2 = self.m2 * scale_a + other.m2 * scale_b + delta * delta * weight_a * frac_b
+		mean_log_g = self.mean_log_g + delta_log_g * frac_b
+		c2 = self.c2 * scale_a + other.c2 * scale_b + delta * delta_log_g * weight_a * frac_b
+
+		return PartialMoments(shift, weight, mean, m2, mean_log_g, c2)
+
+	def finish(self, k_B, ground_energy, Ts):
+		"""
+		Thermodynamic quantities for the levels, as an array of records of
+		MOMENTS_DTYPE.
+
+		The parameters need only broadcast against the moments, so several
+		sets of levels can be finished at once.
+		"""
+
+		result = N.empty(self.weight.shape, dtype=MOMENTS_DTYPE)
+
+		with N.errstate(divide='ignore', invalid='ignore', over='ignore'):
+			beta = 1 / (k_B * Ts)
+			log_Z_shifted = self.shift + N.log(self.weight)
+			var = self.m2 / self.weight
+
+			# Avoid 0 * inf at zero temperature.
+			beta_E_0 = N.where(ground_energy == 0, 0, beta * ground_energy)
+			beta_mean = N.where(self.mean == 0, 0, beta * self.mean)
+
+			result['log_Z'] = log_Z_shifted - beta_E_0
+			result['Z'] = N.exp(result['log_Z'])
+			result['U'] = ground_energy + self.mean
+			result['var'] = var
+			result['cov_E_log_g'] = self.c2 / self.weight
+			result['E_sq'] = result['U'] * result['U'] + var
+			# $-\sum_i p_i \ln p_i = \ln Z - \langle \ln g - \beta (E - E_0) \rangle$
+			result['S'] = k_B * (log_Z_shifted - self.mean_log_g + beta_mean)
+			result['C_V'] = N.where(var == 0, 0, k_B * (beta * N.sqrt(var)) ** 2)
+
+		# Nothing to average over.
+		empty = self.weight == 0
+
+		for name in ['U', 'E_sq', 'var', 'cov_E_log_g', 'S', 'C_V']:
+			result[name][empty] = N.nan
+
+		return result
+
+
+def merge_pairwise(partials, num_temps):
+	"""
+	Merge an iterable of PartialMoments over consecutive chunks of levels.
+
+	The merges are arranged in a balanced binary tree, so rounding error grows
+	only with the logarithm of the number of chunks, and no more than that many
+	PartialMoments are alive at once.
+	"""
+
+	# Pairs of (partial moments, number of chunks they cover), with the counts
+	# strictly decreasing.
+	stack = []
+
+	for partial in partials:
+		count = 1
+
+		while stack and stack[-1][1] == count:
+			partial = stack.pop()[0].merge(partial)
+			count *= 2
+
+		stack.append((partial, count))
+
+	result = PartialMoments.empty(num_temps)
+
+	for partial, _ in stack:
+		result = result.merge(partial)
+
+	return result
+
+
+def thermodynamic_moments(k_B, ground_energy, chunks, Ts, temperature_step):
+	"""
+	Thermodynamic quantities for a 1D array of temperatures, as an array of
+	records of MOMENTS_DTYPE.
+
+	chunks should be a function returning an iterator over
+	(slice, shifted energies, log-degeneracies) for consecutive chunks of
+	levels, which together cover all the levels that contribute at the
+	temperatures it is given. It is called once per block of temperature_step
+	temperatures, with the temperatures in the block.
+	"""
+
+	result = N.empty(len(Ts), dtype=MOMENTS_DTYPE)
+	temperature_step = max(1, temperature_step)
+
+	for start in xrange(0, len(Ts), temperature_step):
+		block = slice(start, start + temperature_step)
+
+		partials = (PartialMoments.from_levels(k_B, shifted_energies, log_degeneracies, Ts[block])
+				for _, shifted_energies, log_degeneracies in chunks(Ts[block]))
+
+		result[block] = merge_pairwise(partials, len(Ts[block])).finish(k_B, ground_energy, Ts[block])
+
+	return result
@@ -0,0 +1,67 @@
+from __future__ import division
+
+import numpy as N
+
+
+def midpoint_edges(xs):
+	"""
+	Edges of cells centred on the sorted values xs, meeting halfway between
+	neighbours. The outer cells are as wide on the outside as on the inside.
+	"""
+
+	xs = N.asarray(xs, dtype=float)
+
+	if len(xs) == 1:
+		return N.array([xs[0] - 0.5, xs[0] + 0.5])
+
+	mids = (xs[1:] + xs[:-1]) / 2
+
+	return N.concatenate([[2 * xs[0] - mids[0]], mids, [2 * xs[-1] - mids[-1]]])
+
+def population_map(energies, populations, max_rows=500, tolerance=1e-6):
+	"""
+	Reduce level populations over a range of temperatures to a grid of cells
+	for drawing as a heatmap of energy against temperature.
+
+	energies: Sorted energies of the levels.
+	populations: (levels x temperatures) array of populations, as given by
+	  BoltzmannDistribution.ps.
+	max_rows: Most rows of cells.
+	tolerance: Levels whose population never exceeds this are dropped.
+
+	When there are no more than max_rows levels left, each gets a row of its
+	own, centred on its energy. Otherwise, the energy range of the remaining
+	levels is split into max_rows equal rows, and each row has the total
+	population of the levels in it.
+
+	Returns (edges, rows, num_dropped), where edges are the max_rows + 1 (or
+	fewer) energies bounding the rows, and rows is a (rows x temperatures)
+	array.
+	"""
+
+	energies = N.asarray(energies, dtype=float)
+	populations = N.asarray(populations, dtype=float).reshape((len(energies), -1))
+
+	keep = populations.max(axis=1, initial=0) > tolerance
+	num_dropped = len(energies) - N.count_nonzero(keep)
+
+	energies = energies[keep]
+	populations = populations[keep]
+
+	if len(energies) == 0:
+		return N.zeros(0), N.zeros((0, populations.shape[1])), num_dropped
+
+	if len(energies) <= max_rows:
+		return midpoint_edges(energies), populations, num_dropped
+
+	edges = N.linspace(energies[0], energies[-1], max_rows + 1)
+	# The top edge belongs to the last row.
+	rows = N.minimum(N.searchsorted(edges, energies, side='right') - 1, max_rows - 1)
+
+	# The levels are sorted, so each row's levels are consecutive.
+	starts = N.flatnonzero(N.concatenate([[True], rows[1:] != rows[:-1]]))
+
+	result = N.zeros((max_rows, populations.shape[1]))
+	result[rows[starts]] = N.add.reduceat(populations, starts, axis=0)
+
+	return edges, result, num_dropped
@@ -0,0 +1,116 @@
+from __future__ import division
+
+import numpy as N
+
+
+def _curves(values, num_temps):
+	"""
+	Values of a function of temperature as a (curves x temperatures) array.
+	"""
+
+	return N.asarray(values, dtype=float).reshape((-1, num_temps))
+
+def _bounds(curves):
+	"""
+	Smallest and largest finite value of each curve.
+	"""
+
+	finite = N.isfinite(curves)
+
+	return N.where(finite, curves, N.inf).min(axis=1), N.where(finite, curves, -N.inf).max(axis=1)
+
+def _relative_errors(errors, scale):
+	"""
+	Largest error over all the curves for each temperature, relative to the
+	scale of each curve. Undefined values count as no error.
+	"""
+
+	with N.errstate(invalid='ignore'):
+		result = N.abs(errors) / scale[:, N.newaxis]
+
+	result[~N.isfinite(result)] = 0
+
+	return result.max(axis=0, initial=0)
+
+def adaptive_temperatures(f, T_min, T_max, max_evaluations=200, num_initial=33, tolerance=1e-3):
+	"""
+	Sample one or more curves over [T_min, T_max] on a shared grid of
+	temperatures, refined where linear interpolation between the samples is
+	poor.
+
+	f should take a 1D array of temperatures, and give the values of the curves
+	at them, with the temperatures along the last axis (so a
+	BoltzmannEnsemble method is suitable).
+
+	The grid starts out with num_initial evenly spaced temperatures. Each round,
+	the midpoints of the intervals still to be refined are evaluated together in
+	a single call to f, and an interval is split further if the value at its
+	midpoint differs from the linear interpolation by more than tolerance,
+	relative to the range of values of each curve. When there are more
+	intervals to refine than evaluations left, those with the largest errors go
+	first. No more than max_evaluations temperatures are evaluated.
+
+	Returns (Ts, values), where Ts is sorted and values is the result of f in
+	the same order.
+	"""
+
+	num_initial = max(2, min(num_initial, max_evaluations))
+
+	Ts = N.linspace(T_min, T_max, num_initial)
+	values = N.asarray(f(Ts), dtype=float)
+	curves = _curves(values, len(Ts))
+
+	all_Ts = [Ts]
+	all_curves = [curves]
+	num_evaluations = len(Ts)
+
+	lows, highs = _bounds(curves)
+
+	# Intervals should not become arbitrarily narrow near discontinuities.
+	min_width = abs(T_max - T_min) * 2 ** -30
+
+	# Intervals still to be refined, along with the values at their ends and
+	# how badly they need it. The first priorities come from the second
+	# differences around each interval.
+	lefts, rights = Ts[:-1], Ts[1:]
+	left_curves, right_curves = curves[:, :-1], curves[:, 1:]
+
+	scale = N.where(highs > lows, highs - lows, 1)
+	second = N.zeros(len(Ts))
+	second[1:-1] = _relative_errors(curves[:, 1:-1] - (curves[:, :-2] + curves[:, 2:]) / 2, scale)
+	priorities = N.maximum(second[:-1], second[1:])
+
+	while len(lefts) > 0 and num_evaluations < max_evaluations:
+		count = max_evaluations - num_evaluations
+
+		if count < len(lefts):
+			best = N.argsort(-priorities, kind='mergesort')[:count]
+
+			lefts, rights = lefts[best], rights[best]
+			left_curves, right_curves = left_curves[:, best], right_curves[:, best]
+
+		mids = (lefts + rights) / 2
+		mid_curves = _curves(f(mids), len(mids))
+		num_evaluations += len(mids)
+
+		all_Ts.append(mids)
+		all_curves.append(mid_curves)
+
+		mid_lows, mid_highs = _bounds(mid_curves)
+		lows, highs = N.minimum(lows, mid_lows), N.maximum(highs, mid_highs)
+
+		scale = N.where(highs > lows, highs - lows, 1)
+		errors = _relative_errors(mid_curves - (left_curves + right_curves) / 2, scale)
+
+		refine = (errors > tolerance) & (rights - lefts > 2 * min_width)
+
+		lefts, rights = N.concatenate([lefts[refine], mids[refine]]), N.concatenate([mids[refine], rights[refine]])
+		left_curves = N.concatenate([left_curves[:, refine], mid_curves[:, refine]], axis=1)
+		right_curves = N.concatenate([mid_curves[:, refine], right_curves[:, refine]], axis=1)
+		# Halving an interval should roughly quarter the error.
+		priorities = N.tile(errors[refine] / 4, 2)
+
+	Ts = N.concatenate(all_Ts)
+	order = N.argsort(Ts, kind='mergesort')
+
+	return Ts[order], N.concatenate(all_curves, axis=1)[:, order].reshape(values.shape[:-1] + (len(Ts),))
@@ -0,0 +1,197 @@
+from __future__ import division
+
+import json
+
+import numpy as N
+
+from boltzmannizer.science.boltzmann_distribution import as_temperatures, shaped
+
+
+class ChebyshevSurrogate(object):
+	"""
+	Piecewise Chebyshev interpolant of a function of temperature, for cheap
+	evaluation at arbitrary temperatures.
+
+	The interval covered is split into pieces, each with a polynomial of the
+	same degree in the Chebyshev basis. Evaluation costs only a search for the
+	piece and a Clenshaw recurrence, independently of how expensive the
+	original function was, and is vectorized over arrays of temperatures.
+	Temperatures outside the interval give NaN.
+	"""
+
+	FORMAT_VERSION = 1
+
+	# Number of trailing coefficients whose magnitudes estimate the error of
+	# each piece.
+	NUM_TAIL_COEFFICIENTS = 3
+
+	def __init__(self, breakpoints, coefficients, errors):
+		"""
+		breakpoints: Increasing temperatures bounding the pieces.
+		coefficients: (pieces x terms) array of Chebyshev coefficients, each
+		  row for the corresponding piece mapped onto [-1, 1].
+		errors: Estimated absolute error of each piece.
+		"""
+
+		self._breakpoints = N.array(breakpoints, dtype=float)
+		self._coefficients = N.array(coefficients, dtype=float).reshape((len(self._breakpoints) - 1, -1))
+		self._errors = N.array(errors, dtype=float)
+
+		if len(self._errors) != len(self._coefficients):
+			raise ValueError("Number of errors doesn't match number of pieces")
+
+	@classmethod
+	def fit(cls, f, T_min, T_max, rtol=1e-8, degree=24, max_pieces=1024):
+		"""
+		Fit a surrogate of f over [T_min, T_max].
+
+		f should take a 1D array of temperatures and give the values at them
+		(as do the methods of BoltzmannDistribution). All the pieces being
+		fitted at the same time are evaluated in a single call.
+
+		Pieces are bisected until the estimated error of each is within rtol
+		relative to the largest magnitude of f seen over the interval, or until
+		there would be more than max_pieces pieces.
+		"""
+
+		num_terms = degree + 1
+		ks = N.arange(num_terms)
+		# Chebyshev points of the first kind on [-1, 1].
+		angles = N.pi * (ks + 0.5) / num_terms
+		nodes = N.cos(angles)
+		# Values at the nodes to coefficients, by a discrete cosine transform.
+		transform = 2 / num_terms * N.cos(N.outer(ks, angles))
+		transform[0] /= 2
+
+		lefts, rights = N.array([T_min], dtype=float), N.array([T_max], dtype=float)
+		min_width = (T_max - T_min) * 2 ** -40
+
+		pieces = []
+		scale = 0
+
+		while len(lefts) > 0:
+			half_widths = (rights - lefts) / 2
+			Ts = (lefts + half_widths)[:, N.newaxis] + half_widths[:, N.newaxis] * nodes
+			values = N.asarray(f(Ts.ravel()), dtype=float).reshape(Ts.shape)
+
+			finite = N.isfinite(values)
+
+			if finite.any():
+				scale = max(scale, N.abs(values[finite]).max())
+
+			coefficients = values.dot(transform.T)
+			errors = N.abs(coefficients[:, -cls.NUM_TAIL_COEFFICIENTS:]).sum(axis=1)
+
+			# Undefined values won't improve with bisection.
+			done = ~(errors > rtol * scale) | (half_widths < min_width)
+
+			if len(pieces) + N.count_nonzero(done) + 2 * N.count_nonzero(~done) > max_pieces:
+				done[:] = True
+
+			pieces.extend(zip(lefts[done], rights[done], coefficients[done], errors[done]))
+
+			mids = (lefts + rights)[~done] / 2
+			lefts, rights = N.concatenate([lefts[~done], mids]), N.concatenate([mids, rights[~done]])
+
+		pieces.sort(key=lambda piece: piece[0])
+
+		breakpoints = [piece[0] for piece in pieces] + [T_max]
+
+		return cls(breakpoints, [piece[2] for piece in pieces], [piece[3] for piece in pieces])
+
+	@classmethod
+	def from_dict(cls, data):
+		"""
+		Rebuild a surrogate from the output of to_dict.
+		"""
+
+		if data.get('format_version') != cls.FORMAT_VERSION:
+			raise ValueError('Unsupported format version: {0}'.format(data.get('format_version')))
+
+		return cls(data['breakpoints'], data['coefficients'], data['errors'])
+
+	@classmethod
+	def load(cls, path):
+		"""
+		Load a surrogate from a JSON file written by save.
+		"""
+
+		with open(path) as f:
+			return cls.from_dict(json.load(f))
+
+	def to_dict(self):
+		"""
+		Plain representation of the surrogate, suitable for JSON.
+		"""
+
+		return {
+				'format_version': self.FORMAT_VERSION,
+				'breakpoints': self._breakpoints.tolist(),
+				'coefficients': self._coefficients.tolist(),
+				'errors': self._errors.tolist(),
+				}
+
+	def save(self, path):
+		"""
+		Write the surrogate to a JSON file.
+		"""
+
+		with open(path, 'w') as f:
+			json.dump(self.to_dict(), f)
+
+	@property
+	def breakpoints(self):
+		return self._breakpoints
+
+	@property
+	def coefficients(self):
+		return self._coefficients
+
+	@property
+	def errors(self):
+		"""
+		Estimated absolute error of each piece.
+		"""
+
+		return self._errors
+
+	@property
+	def max_error(self):
+		"""
+		Estimated absolute error over the whole interval.
+		"""
+
+		return self._errors.max()
+
+	@property
+	def domain(self):
+		return self._breakpoints[0], self._breakpoints[-1]
+
+	def __len__(self):
+		return len(self._coefficients)
+
+	def __call__(self, T):
+		"""
+		Value of the surrogate at temperature T, which may be an array.
+		"""
+
+		Ts, shape = as_temperatures(T)
+
+		pieces = N.searchsorted(self._breakpoints, Ts, side='right') - 1
+		# The upper end of the interval belongs to the last piece.
+		pieces = N.clip(pieces, 0, len(self) - 1)
+
+		lefts, rights = self._breakpoints[pieces], self._breakpoints[pieces + 1]
+		xs = (2 * Ts - lefts - rights) / (rights - lefts)
+
+		# Clenshaw recurrence.
+		b1 = N.zeros(len(Ts))
+		b2 = N.zeros(len(Ts))
+
+		for k in xrange(self._coefficients.shape[1] - 1, 0, -1):
+			b1, b2 = 2 * xs * b1 - b2 + self._coefficients[pieces, k], b1
+
+		result = xs * b1 - b2 + self._coefficients[pieces, 0]
+		result[(Ts < self._breakpoints[0]) | (Ts > self._breakpoints[-1]) | N.isnan(Ts)] = N.nan
+
+		return shaped(result, shape)
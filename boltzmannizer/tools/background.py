@@ -0,0 +1,134 @@
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+
+
+def _call(f, *args):
+	f(*args)
+
+
+class BackgroundTask(object):
+	"""
+	Handle on a function submitted to a BackgroundRunner.
+	"""
+
+	def __init__(self, function, args, on_success, on_error):
+		self.function = function
+		self.args = args
+		self.on_success = on_success
+		self.on_error = on_error
+
+		self.cancelled = False
+		self.done = False
+
+	def cancel(self):
+		"""
+		Make sure that neither callback is called.
+
+		A task that hasn't started yet won't be run at all; one that is already
+		running finishes, but its outcome is discarded.
+		"""
+
+		self.cancelled = True
+
+
+class BackgroundRunner(object):
+	"""
+	Run functions on a pool of worker threads, handing each outcome to a
+	callback.
+
+	The callbacks are called through dispatch, which is given a function and
+	its arguments; for a GUI, this should be something like wx.CallAfter, so
+	that the callbacks run on the UI thread. By default, they run on whichever
+	worker thread finished the task.
+	"""
+
+	def __init__(self, num_threads=None, dispatch=_call):
+		if num_threads is None:
+			num_threads = cpu_count()
+
+		self._dispatch = dispatch
+		self._pool = ThreadPool(num_threads)
+
+		# Tasks which have been neither finished nor cancelled.
+		self._pending = []
+		self._lock = Lock()
+
+	@property
+	def num_pending(self):
+		with self._lock:
+			return len(self._pending)
+
+	def submit(self, function, args=(), on_success=None, on_error=None):
+		"""
+		Call function(*args) in the background, then on_success(result) or
+		on_error(exception) through dispatch.
+
+		Returns a BackgroundTask.
+		"""
+
+		task = BackgroundTask(function, args, on_success, on_error)
+
+		with self._lock:
+			self._pending.append(task)
+
+		self._pool.apply_async(self._run, (task,))
+
+		return task
+
+	def cancel_all(self):
+		"""
+		Cancel all the pending tasks.
+		"""
+
+		with self._lock:
+			for task in self._pending:
+				task.cancel()
+
+			self._pending = []
+
+	def close(self):
+		"""
+		Cancel all the pending tasks and stop the worker threads once they are
+		done with whatever they are running.
+		"""
+
+		self.cancel_all()
+		self._pool.close()
+
+	def _discard(self, task):
+		with self._lock:
+			try:
+				self._pending.remove(task)
+			except ValueError:
+				pass
+
+	def _run(self, task):
+		if task.cancelled:
+			self._discard(task)
+
+			return
+
+		try:
+			result = task.function(*task.args)
+		except Exception as e:
+			callback, value = task.on_error, e
+		else:
+			callback, value = task.on_success, result
+
+		if task.cancelled:
+			self._discard(task)
+		else:
+			self._dispatch(self._finish, task, callback, value)
+
+	def _finish(self, task, callback, value):
+		self._discard(task)
+
+		# The task may have been cancelled while this was being dispatched.
+		if task.cancelled:
+			return
+
+		task.done = True
+
+		if callback is not None:
+			callback(value)
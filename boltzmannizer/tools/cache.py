@@ -0,0 +1,272 @@
+from collections import OrderedDict
+from functools import wraps
+from sys import getsizeof
+from threading import RLock
+from weakref import ref
+
+import numpy as N
+
+
+def _sizeof(value):
+	"""
+	Approximate memory footprint of a cached value (or key) in bytes.
+	"""
+
+	if isinstance(value, type):
+		# Shared, such as N.ndarray in the keys of arrays.
+		return 0
+
+	if isinstance(value, N.ndarray):
+		# A view keeps the whole of the array it looks into alive.
+		while isinstance(value.base, N.ndarray):
+			value = value.base
+
+	try:
+		# NumPy arrays and scalars. Arrays which own their data already
+		# include it in getsizeof, but views don't.
+		return max(getsizeof(value), value.nbytes)
+	except AttributeError:
+		pass
+
+	if isinstance(value, (tuple, frozenset)):
+		return getsizeof(value) + sum(_sizeof(v) for v in value)
+
+	return getsizeof(value)
+
+
+def _hashable(arg):
+	"""
+	Stand-in for arg which can be used in a cache key. NumPy arrays are keyed
+	on their contents.
+	"""
+
+	if isinstance(arg, N.ndarray):
+		return (N.ndarray, arg.dtype.str, arg.shape, arg.tobytes())
+
+	return arg
+
+
+class CacheBudget(object):
+	"""
+	Byte budget shared by any number of ResultCaches.
+
+	When the total size of the cached values exceeds the budget, values are
+	evicted from the caches in least-recently-used order, regardless of which
+	cache they belong to.
+	"""
+
+	def __init__(self, max_bytes):
+		self._max_bytes = max_bytes
+		self._lock = RLock()
+
+		# Sizes of all the cached values, keyed by (cache id, key), from least
+		# to most recently used.
+		self._entries = OrderedDict()
+		# Weak references to the caches, keyed by cache id.
+		self._caches = {}
+		# Caches which have been garbage collected, but whose entries haven't
+		# yet been removed. Weak reference callbacks may run at any time, so
+		# they only append to this list.
+		self._dead = []
+
+		self.num_bytes = 0
+
+	@property
+	def max_bytes(self):
+		return self._max_bytes
+
+	@max_bytes.setter
+	def max_bytes(self, value):
+		with self._lock:
+			self._max_bytes = value
+			self._evict()
+
+	@property
+	def num_entries(self):
+		with self._lock:
+			self._purge()
+
+			return len(self._entries)
+
+	def clear(self):
+		"""
+		Evict everything from all the caches.
+		"""
+
+		with self._lock:
+			for cache_id in list(self._caches):
+				cache = self._caches[cache_id]()
+
+				if cache is not None:
+					cache.invalidate()
+
+	def _register(self, cache):
+		cache_id = id(cache)
+		dead = self._dead
+
+		def forget(_):
+			dead.append(cache_id)
+
+		with self._lock:
+			self._purge()
+			self._caches[cache_id] = ref(cache, forget)
+
+	def _add(self, cache, key, num_bytes):
+		"""
+		Account for a new value, evicting older ones as necessary.
+
+		Returns False if the value can't fit in the budget at all.
+		"""
+
+		if num_bytes > self._max_bytes:
+			return False
+
+		with self._lock:
+			self._purge()
+
+			self._entries[id(cache), key] = num_bytes
+			self.num_bytes += num_bytes
+
+			self._evict()
+
+		return True
+
+	def _touch(self, cache, key):
+		with self._lock:
+			entry = id(cache), key
+			self._entries[entry] = self._entries.pop(entry)
+
+	def _remove(self, cache, key):
+		with self._lock:
+			self.num_bytes -= self._entries.pop((id(cache), key))
+
+	def _evict(self):
+		while self.num_bytes > self._max_bytes and self._entries:
+			(cache_id, key), num_bytes = self._entries.popitem(last=False)
+			self.num_bytes -= num_bytes
+
+			cache = self._caches[cache_id]()
+
+			if cache is not None:
+				cache._evicted(key)
+
+	def _purge(self):
+		"""
+		Drop the entries of all the caches that no longer exist.
+		"""
+
+		while self._dead:
+			cache_id = self._dead.pop()
+
+			del self._caches[cache_id]
+
+			for entry in [e for e in self._entries if e[0] == cache_id]:
+				self.num_bytes -= self._entries.pop(entry)
+
+
+# Shared by all caches that don't ask for anything else.
+default_budget = CacheBudget(2 ** 28)
+
+
+def set_cache_budget(max_bytes):
+	"""
+	Set the size of the default budget in bytes, evicting as necessary.
+	"""
+
+	default_budget.max_bytes = max_bytes
+
+
+class ResultCache(object):
+	"""
+	Cache of results belonging to a single object.
+
+	The cache should be owned by the object whose results it holds, so that
+	the results are freed along with that object. The sizes of the values are
+	accounted against a CacheBudget, which may evict them at any time.
+	"""
+
+	def __init__(self, budget=None):
+		self._budget = budget if budget is not None else default_budget
+		self._values = {}
+
+		self._budget._register(self)
+
+	def __len__(self):
+		return len(self._values)
+
+	def __contains__(self, key):
+		return key in self._values
+
+	def __getitem__(self, key):
+		with self._budget._lock:
+			result = self._values[key]
+			self._budget._touch(self, key)
+
+		return result
+
+	def __setitem__(self, key, value):
+		with self._budget._lock:
+			if key in self._values:
+				self._budget._remove(self, key)
+				del self._values[key]
+
+			# Store the value first, since adding it might evict it right
+			# away.
+			self._values[key] = value
+
+			if not self._budget._add(self, key, _sizeof(key) + _sizeof(value)):
+				del self._values[key]
+
+	def invalidate(self, *names):
+		"""
+		Drop cached values.
+
+		If any names are given, only the values for those methods are dropped
+		(see cached_method); otherwise, everything is.
+		"""
+
+		with self._budget._lock:
+			for key in list(self._values):
+				if not names or key[0] in names:
+					self._budget._remove(self, key)
+					del self._values[key]
+
+	def _evicted(self, key):
+		del self._values[key]
+
+
+def cached_method(f):
+	"""
+	Decorator which caches the results of a method in a ResultCache owned by
+	the instance, created on first use as the _result_cache attribute.
+
+	NumPy array arguments are keyed on their contents. Calls with other
+	unhashable arguments are passed through without being cached.
+	"""
+
+	name = f.__name__
+
+	@wraps(f)
+	def wrapper(self, *args, **kwargs):
+		try:
+			cache = self._result_cache
+		except AttributeError:
+			cache = self._result_cache = ResultCache()
+
+		key = (name, tuple(_hashable(arg) for arg in args),
+				frozenset((k, _hashable(v)) for k, v in kwargs.items()))
+
+		try:
+			return cache[key]
+		except KeyError:
+			pass
+		except TypeError:
+			# Can't hash the key, so there's nothing to look up or store.
+			return f(self, *args, **kwargs)
+
+		result = f(self, *args, **kwargs)
+		cache[key] = result
+
+		return result
+
+	return wrapper
@@ -37,6 +37,7 @@ setup(
 	scripts=[
 		'bin/boltzmannizer',
 		'bin/col2json.py',
+		'bin/levelconv.py',
 	],
 	test_suite='nose.collector',
 )
@@ -0,0 +1,72 @@
+from nose.tools import eq_
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest2 import main, TestCase
+
+import numpy as N
+from numpy.testing import assert_array_almost_equal
+
+from boltzmannizer.science.batch import evaluate_files
+from boltzmannizer.science.boltzmann_distribution import BoltzmannDistribution, InvalidFormat
+from boltzmannizer.science.level_files import write_binary
+
+
+TEST_DATA = join('tests', 'data')
+
+
+class EvaluateFilesTest(TestCase):
+	def setUp(self):
+		self.tmp_dir = mkdtemp()
+
+	def tearDown(self):
+		rmtree(self.tmp_dir)
+
+	def testBatch(self):
+		"""
+		Good files give values and bad files give errors, in any order.
+		"""
+
+		good_json = join(TEST_DATA, 'test1.json')
+		good_binary = join(self.tmp_dir, 'levels.bin')
+		bad = join(self.tmp_dir, 'bad.json')
+		missing = join(self.tmp_dir, 'missing.json')
+
+		write_binary(good_binary, 0.5, N.arange(10), N.arange(1, 11))
+
+		with open(bad, 'w') as f:
+			f.write('{"format_version": 1, "k_B": 1}')
+
+		paths = [good_json, bad, good_binary, missing] * 3
+		Ts = N.array([[1, 10], [100, 1000]])
+
+		for processes in [1, 2]:
+			results = list(evaluate_files(paths, Ts, quantities=['energy', 'Z'], processes=processes))
+
+			eq_(sorted(r.path for r in results), sorted(paths))
+
+			for result in results:
+				if result.path in [good_json, good_binary]:
+					self.assertIsNone(result.error)
+					eq_(sorted(result.values), ['Z', 'energy'])
+
+					bd = BoltzmannDistribution.from_file(result.path)
+
+					assert_array_almost_equal(result.values['energy'], bd.energy(Ts))
+					assert_array_almost_equal(result.values['Z'], bd.Z(Ts))
+				else:
+					self.assertIsNone(result.values)
+
+					if result.path == bad:
+						self.assertIsInstance(result.error, InvalidFormat)
+					else:
+						self.assertIsInstance(result.error, IOError)
+
+		# Rejected on the call, before any file is loaded.
+		for quantity in ['nonsense', 'from_file', 'coarse_grained']:
+			with self.assertRaises(ValueError):
+				evaluate_files(paths, Ts, quantities=[quantity])
+
+
+if __name__ == '__main__':
+	main()
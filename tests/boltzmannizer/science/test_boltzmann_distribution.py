@@ -1,10 +1,17 @@
+from __future__ import division
+
+from math import exp, log
 from nose.tools import assert_almost_equal, eq_
 from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
 from unittest2 import main, TestCase
 
+import numpy as N
 from numpy.testing import assert_array_almost_equal, assert_array_equal
 
 from boltzmannizer.science.boltzmann_distribution import BoltzmannDistribution, NonIncreasingEnergies
+from boltzmannizer.science.canonicalization import bin_levels
 
 
 TEST_DATA = join('tests', 'data')
@@ -23,6 +30,7 @@ class BoltzmannDistributionTest(TestCase):
 		assert_array_equal(bd.energies, [])
 		assert_array_equal(bd.degeneracies, [])
 		eq_(bd.num_levels, (0, 0))
+		self.assertIsInstance(bd.num_levels[1], int)
 
 		eq_(bd.Z(123), 0)
 
@@ -72,6 +80,137 @@ class BoltzmannDistributionTest(TestCase):
 		with self.assertRaises(AttributeError):
 			bd.degeneracies = [5]
 
+	def testArrays(self):
+		"""
+		Arrays of temperatures give the same values as scalars.
+		"""
+
+		bd = BoltzmannDistribution(0.5, [1, 2, 3], [3, 2, 1])
+
+		Ts = N.array([0, 0.5, 2, 7.5, 100])
+
+		assert_array_almost_equal(bd.Z(Ts[1:]), [bd.Z(T) for T in Ts[1:]])
+		assert_array_almost_equal(bd.ps(Ts), N.column_stack([bd.ps(T) for T in Ts]))
+		assert_array_almost_equal(bd.energy(Ts), [bd.energy(T) for T in Ts])
+		assert_array_almost_equal(bd.entropy(Ts), [bd.entropy(T) for T in Ts])
+		assert_array_almost_equal(bd.heat_capacity(Ts[1:]), [bd.heat_capacity(T) for T in Ts[1:]])
+
+		# The shape of the input is preserved.
+		eq_(bd.energy(Ts.reshape(5, 1)).shape, (5, 1))
+		eq_(bd.ps(Ts.reshape(5, 1)).shape, (3, 5, 1))
+
+		# Small blocks give the same answer as one big block.
+		bd.MAX_BLOCK_ELEMENTS = 4
+		assert_array_almost_equal(bd.ps(Ts), N.column_stack([bd.ps(T) for T in Ts]))
+		assert_array_almost_equal(bd.entropy(Ts), [bd.entropy(T) for T in Ts])
+
+	def testArraysGroundState(self):
+		"""
+		Zero temperature and vanishing Z are handled for each temperature
+		separately.
+		"""
+
+		bd = BoltzmannDistribution(1, [1000, 2000], [1, 1])
+
+		ps = bd.ps(N.array([0, 1, 1000]))
+
+		# At T = 1, Z underflows, but the probabilities don't care.
+		assert_array_equal(ps[:, :2], [[1, 1], [0, 0]])
+		assert_array_almost_equal(ps[:, 2], [0.731058578630005, 0.268941421369995])
+
+	def testLogSpace(self):
+		"""
+		Quantities stay accurate where the Boltzmann factors themselves
+		underflow or overflow.
+		"""
+
+		# Z underflows at T = 1, but the populations are still resolvable.
+		bd = BoltzmannDistribution(1, [1000, 1010], [1, 1])
+
+		assert_almost_equal(bd.log_Z(1), -1000 + log(1 + exp(-10)))
+		eq_(bd.Z(1), 0)
+		assert_array_almost_equal(bd.ps(1) / [1, exp(-10)], [1 / (1 + exp(-10))] * 2)
+		assert_almost_equal(bd.energy(1), 1000 + 10 * exp(-10) / (1 + exp(-10)))
+
+		# Combinatorial degeneracies are far beyond floating point range.
+		bd = BoltzmannDistribution(1, [0, 1], [1, 10 ** 400])
+
+		assert_almost_equal(bd.log_degeneracies[1], 400 * log(10))
+		eq_(bd.num_levels, (2, 10 ** 400 + 1))
+		assert_almost_equal(bd.log_Z(1), 400 * log(10) - 1)
+		assert_array_almost_equal(bd.ps(N.array([0, 1])), [[1, 0], [0, 1]])
+		assert_almost_equal(bd.energy(1), 1)
+
+	def testInvalidateCache(self):
+		"""
+		Cached results can be dropped.
+		"""
+
+		bd = BoltzmannDistribution(0.5, [1, 2, 3], [3, 2, 1])
+
+		bd.energy(2)
+		bd.entropy(2)
+
+		bd.invalidate_cache('energy')
+
+		eq_(sorted(key[0] for key in bd._result_cache._values if key[0] in ['energy', 'entropy']), ['entropy'])
+
+		bd.invalidate_cache()
+
+		eq_(len(bd._result_cache), 0)
+		assert_almost_equal(bd.energy(2), 1.259985783287049)
+
+		# Each quantity is kept on its own, not as a view of all the moments.
+		self.assertIsNone(bd.energy(N.array([1, 2])).base)
+
+	def testOutOfCore(self):
+		"""
+		Memory-mapped levels evaluated in chunks agree with the in-memory
+		evaluation.
+		"""
+
+		energies = N.cumsum(N.linspace(0.5, 3, 50)) + 1000
+		degeneracies = N.arange(1, 51)
+
+		tmp_dir = mkdtemp()
+
+		try:
+			path_E = join(tmp_dir, 'energies')
+			path_g = join(tmp_dir, 'degeneracies')
+
+			N.memmap(path_E, dtype=float, mode='w+', shape=energies.shape)[:] = energies
+			N.memmap(path_g, dtype=int, mode='w+', shape=degeneracies.shape)[:] = degeneracies
+
+			mapped_E = N.memmap(path_E, dtype=float, mode='r')
+			mapped_g = N.memmap(path_g, dtype=int, mode='r')
+
+			bd = BoltzmannDistribution(2, energies, degeneracies)
+			Ts = N.array([0, 1, 10, 100, 1e4])
+
+			for chunk_size in [1, 7, 50, 1000]:
+				bd_mapped = BoltzmannDistribution(2, mapped_E, mapped_g, chunk_size=chunk_size)
+				bd_mapped.MAX_BLOCK_ELEMENTS = 20
+
+				# No copies were made.
+				self.assertTrue(N.may_share_memory(bd_mapped.energies, mapped_E))
+
+				assert_array_almost_equal(bd_mapped.log_Z(Ts), bd.log_Z(Ts))
+				assert_array_almost_equal(bd_mapped.energy(Ts), bd.energy(Ts))
+				assert_array_almost_equal(bd_mapped.entropy(Ts), bd.entropy(Ts))
+				assert_array_almost_equal(bd_mapped.heat_capacity(Ts), bd.heat_capacity(Ts))
+				assert_array_almost_equal(bd_mapped.ps(Ts), bd.ps(Ts))
+				eq_(bd_mapped.num_levels, bd.num_levels)
+
+			del bd_mapped, mapped_E, mapped_g
+		finally:
+			rmtree(tmp_dir)
+
+		with self.assertRaises(NonIncreasingEnergies):
+			BoltzmannDistribution(1, [1, 2, 3, 4, 4, 5], [1] * 6, chunk_size=4)
+
+		with self.assertRaises(ValueError):
+			BoltzmannDistribution(1, [1, 2], [1, 1], chunk_size=0)
+
 	def testOutOfOrder(self):
 		"""
 		Verify that levels are checked upon creation.
@@ -86,6 +225,134 @@ class BoltzmannDistributionTest(TestCase):
 		with self.assertRaises(NonIncreasingEnergies):
 			BoltzmannDistribution(1, [1, 2, 3, 4, 5, 4], [1] * 6)
 
+	def testCanonicalize(self):
+		"""
+		Levels can be put in order on creation.
+		"""
+
+		bd = BoltzmannDistribution(1, [3, 1, 2, 1], [1, 2, 1, 3], sort=True, merge_tolerance=0)
+
+		eq_(bd.energies.tolist(), [1, 2, 3])
+		eq_(bd.degeneracies.tolist(), [5, 1, 1])
+		eq_(bd.canonicalization.num_merged, 1)
+		assert_almost_equal(bd.Z(2), 5 * exp(-1 / 2) + exp(-2 / 2) + exp(-3 / 2))
+
+		bd = BoltzmannDistribution(1, [1, 2], [1, 1], sort=True)
+
+		self.assertFalse(bd.canonicalization.changed)
+
+	def testTruncation(self):
+		"""
+		Levels which can't contribute at low temperature are left out, without
+		changing the results.
+		"""
+
+		N.random.seed(0)
+
+		energies = N.cumsum(N.random.uniform(1, 10, 1000))
+		degeneracies = N.random.randint(1, 10, 1000)
+		Ts = N.array([50, 0, 1, 5, N.inf, 1000])
+
+		for chunk_size in [None, 64]:
+			bd = BoltzmannDistribution(1, energies, degeneracies, chunk_size=chunk_size)
+			bd_full = BoltzmannDistribution(1, energies, degeneracies, chunk_size=chunk_size)
+			bd_full.TRUNCATION_TOLERANCE = 0
+
+			cutoffs = bd._cutoffs(N.array([0, 1, 5, 50, 1000, N.inf]))
+
+			eq_(cutoffs[0], 1 if chunk_size is None else 64)
+			self.assertLess(cutoffs[2], 100)
+			self.assertTrue((N.diff(cutoffs) >= 0).all())
+			eq_(cutoffs[-1], 1000)
+			eq_(bd_full._cutoffs(N.array([1])).tolist(), [1000])
+
+			for name in ['log_Z', 'U', 'S', 'C_V']:
+				assert_array_almost_equal(bd.moments(Ts)[name], bd_full.moments(Ts)[name], decimal=12)
+
+			assert_array_almost_equal(bd.ps(Ts), bd_full.ps(Ts), decimal=15)
+
+	def testNaNTemperature(self):
+		"""
+		Truncation doesn't hide NaN temperatures.
+		"""
+
+		energies = N.arange(1000.)
+		degeneracies = N.ones(1000, dtype=int)
+
+		for chunk_size in [None, 64]:
+			bd = BoltzmannDistribution(1, energies, degeneracies, chunk_size=chunk_size)
+
+			eq_(bd._cutoffs(N.array([N.nan, 0])).tolist(), [1000, 1 if chunk_size is None else 64])
+
+			for name in ['log_Z', 'U', 'S', 'C_V']:
+				values = bd.moments(N.array([N.nan, 1]))[name]
+
+				self.assertTrue(N.isnan(values[0]))
+				self.assertFalse(N.isnan(values[1]))
+
+			self.assertTrue(N.isnan(bd.energy(N.nan)))
+			self.assertTrue(N.isnan(bd.ps(N.nan)).all())
+
+	def testCoarseGrained(self):
+		"""
+		Binned levels keep the errors within tolerance above T_min.
+		"""
+
+		N.random.seed(0)
+
+		energies = N.unique(N.random.uniform(0, 100, 10 ** 5))
+		bd = BoltzmannDistribution(0.5, energies, N.random.randint(1, 5, len(energies)))
+		Ts = N.linspace(10, 500, 20)
+
+		for tolerance in [1e-3, 1e-5]:
+			coarse = bd.coarse_grained(10, tolerance)
+
+			self.assertLess(len(coarse.energies), len(bd.energies) // 10)
+			eq_(coarse.num_levels[1], bd.num_levels[1])
+
+			self.assertLess(abs(coarse.log_Z(Ts) - bd.log_Z(Ts)).max(), tolerance)
+			self.assertLess((abs(coarse.energy(Ts) - bd.energy(Ts)) / (0.5 * Ts)).max(), tolerance)
+			self.assertLess((abs(coarse.heat_capacity(Ts) - bd.heat_capacity(Ts)) / 0.5).max(), tolerance)
+
+			# The entropy of mixing within each bin is lost.
+			_, counts = bin_levels(bd.energies, N.ones(len(bd.energies)), bd.ground_energy,
+					0.5 * 10 * (2 * tolerance) ** 0.5)
+			lost = bd.entropy(Ts) - coarse.entropy(Ts)
+
+			self.assertGreater(lost.min(), -0.5 * 3 * tolerance)
+			self.assertLess(lost.max(), 0.5 * (log(counts.max()) + 3 * tolerance))
+			self.assertGreater(lost.max(), 0.5 * 3 * tolerance)
+
+		with self.assertRaises(ValueError):
+			bd.coarse_grained(0)
+
+	def testInverse(self):
+		"""
+		Temperatures are recovered from energies and entropies.
+		"""
+
+		N.random.seed(0)
+
+		bd = BoltzmannDistribution(0.7, 100 + N.cumsum(N.random.uniform(1, 50, 100)), N.random.randint(1, 5, 100))
+		Ts = N.exp(N.random.uniform(log(5), log(1e5), 200)).reshape((10, 20))
+
+		assert_array_almost_equal(bd.temperature_for_energy(bd.energy(Ts)) / Ts, N.ones(Ts.shape), decimal=9)
+
+		# The entropy of the levels is only sure to be monotonic with equal
+		# degeneracies.
+		bd_equal = BoltzmannDistribution(0.7, bd.energies, N.repeat(3, 100))
+
+		assert_array_almost_equal(bd_equal.temperature_for_entropy(bd_equal.entropy(Ts)) / Ts, N.ones(Ts.shape), decimal=9)
+		# Unequal degeneracies are fine where it is.
+		assert_array_almost_equal(bd.temperature_for_entropy(bd.entropy(Ts[Ts < 1e3])), Ts[Ts < 1e3])
+
+		assert_almost_equal(bd.temperature_for_energy(bd.energy(300)), 300)
+
+		limits = bd.temperature_for_energy([bd.ground_energy, bd.moments(N.inf)['U'], bd.ground_energy - 1, 1e9])
+
+		eq_(limits[:2].tolist(), [0, N.inf])
+		self.assertTrue(N.isnan(limits[2:]).all())
+
 	def testFromFile(self):
 		"""
 		Load from a file.
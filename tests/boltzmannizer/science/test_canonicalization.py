@@ -0,0 +1,123 @@
+from nose.tools import assert_almost_equal, eq_
+from unittest2 import main, TestCase
+
+import numpy as N
+from numpy.testing import assert_array_almost_equal
+
+from boltzmannizer.science.canonicalization import bin_levels, canonicalize_levels, NonIncreasingEnergies
+
+
+class CanonicalizeLevelsTest(TestCase):
+	def testUnchanged(self):
+		"""
+		Canonical levels are passed through as they are.
+		"""
+
+		energies = N.array([1., 2., 3.])
+		degeneracies = N.array([1, 2, 3])
+
+		for chunk_size in [None, 1, 2]:
+			Es, gs, report = canonicalize_levels(energies, degeneracies, sort=True,
+					merge_tolerance=0.5, chunk_size=chunk_size)
+
+			self.assertIs(Es, energies)
+			self.assertIs(gs, degeneracies)
+			self.assertFalse(report.changed)
+			eq_(report.num_input, 3)
+
+	def testSort(self):
+		"""
+		Levels out of order are sorted, keeping energies with their
+		degeneracies.
+		"""
+
+		Es, gs, report = canonicalize_levels([3, 1, 2, 5], [30, 10, 20, 50], sort=True)
+
+		eq_(Es.tolist(), [1, 2, 3, 5])
+		eq_(gs.tolist(), [10, 20, 30, 50])
+		eq_(report.num_moved, 3)
+		eq_(report.num_merged, 0)
+
+		with self.assertRaises(NonIncreasingEnergies):
+			canonicalize_levels([3, 1, 2, 5], [1] * 4)
+
+		# Equal energies still need merging.
+		with self.assertRaises(NonIncreasingEnergies):
+			canonicalize_levels([3, 1, 3], [1] * 3, sort=True)
+
+	def testMerge(self):
+		"""
+		Runs of close levels become single levels.
+		"""
+
+		Es, gs, report = canonicalize_levels([1, 1.001, 1.002, 2, 3, 3], [1, 2, 1, 4, 1, 1],
+				merge_tolerance=0.0015)
+
+		# The last of the first three is too far from the first.
+		eq_(len(Es), 4)
+		assert_almost_equal(Es[0], (1 + 2 * 1.001) / 3)
+		eq_(Es[1:].tolist(), [1.002, 2, 3])
+		eq_(gs.tolist(), [3, 1, 4, 2])
+		eq_(report.num_merged, 2)
+		assert_almost_equal(report.max_spread, 0.001)
+
+		# Merging doesn't sort.
+		with self.assertRaises(NonIncreasingEnergies):
+			canonicalize_levels([1, 1, 0], [1] * 3, merge_tolerance=0)
+
+		Es, gs, report = canonicalize_levels([2, 1, 1, 2], [1, 1, 1, 1], sort=True, merge_tolerance=0)
+
+		eq_(Es.tolist(), [1, 2])
+		eq_(gs.tolist(), [2, 2])
+
+	def testChain(self):
+		"""
+		A long chain of close levels isn't merged into one.
+		"""
+
+		energies = N.arange(1001) * 0.5
+
+		Es, gs, report = canonicalize_levels(energies, N.ones(1001, dtype=int), merge_tolerance=1)
+
+		# Each run is anchored to its first level: [0, 0.5, 1], [1.5, 2, 2.5], ...
+		eq_(len(Es), 334)
+		assert_array_almost_equal(Es[:3], [0.5, 2, 3.5])
+		eq_(gs[:-1].tolist(), [3] * 333)
+		eq_(gs.sum(), 1001)
+		eq_(report.max_spread, 1)
+
+	def testLargeDegeneracies(self):
+		"""
+		Degeneracies too large for floating point numbers are summed exactly.
+		"""
+
+		Es, gs, _ = canonicalize_levels([1, 1, 2], N.array([10 ** 400, 1, 1], dtype=object),
+				merge_tolerance=0)
+
+		eq_(gs.tolist(), [10 ** 400 + 1, 1])
+		eq_(Es.tolist(), [1, 2])
+
+
+class BinLevelsTest(TestCase):
+	def testBins(self):
+		"""
+		Levels in the same bin are merged, even across chunks.
+		"""
+
+		energies = [0, 0.5, 1.2, 1.9, 2.1, 5]
+		degeneracies = [1, 1, 2, 2, 1, 1]
+
+		for chunk_size in [None, 1, 2, 4]:
+			Es, gs = bin_levels(energies, degeneracies, 0, 1, chunk_size=chunk_size)
+
+			assert_array_almost_equal(Es, [0.25, 1.55, 2.1, 5])
+			eq_(gs.tolist(), [2, 4, 1, 1])
+
+		Es, gs = bin_levels([], [], 0, 1)
+
+		eq_(len(Es), 0)
+		eq_(len(gs), 0)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,121 @@
+from nose.tools import eq_
+from unittest2 import main, TestCase
+
+import numpy as N
+from numpy.testing import assert_array_equal
+
+from boltzmannizer.science.decimation import decimate, min_max_indices
+
+
+class DecimationTest(TestCase):
+	def testFew(self):
+		"""
+		Curves which are already sparse enough are left alone.
+		"""
+
+		xs = N.arange(10)
+
+		assert_array_equal(min_max_indices(xs, xs ** 2, 4), N.arange(10))
+
+	def testExtremes(self):
+		"""
+		Narrow features survive, and the ends are kept.
+		"""
+
+		xs = N.linspace(0, 1, 10001)
+		ys = N.sin(10 * xs)
+		ys[1234] = 5
+		ys[5678] = -5
+
+		dxs, dys = decimate(xs, ys, 100)
+
+		assert len(dxs) <= 2 * 100 + 2
+		eq_(dys.max(), 5)
+		eq_(dys.min(), -5)
+		eq_(dxs[0], 0)
+		eq_(dxs[-1], 1)
+
+		# Every bin has its extremes.
+		bins = N.minimum((xs * 100).astype(int), 99)
+
+		for b in [0, 12, 56, 99]:
+			in_bin = bins == b
+			chosen = N.in1d(xs, dxs) & in_bin
+
+			eq_(ys[chosen].max(), ys[in_bin].max())
+			eq_(ys[chosen].min(), ys[in_bin].min())
+
+	def testMultiple(self):
+		"""
+		Several curves share the points kept for each.
+		"""
+
+		xs = N.linspace(0, 1, 1001)
+		ys = N.array([xs, -xs ** 2, N.zeros(1001)])
+		ys[2, 500] = 1
+
+		dxs, dys = decimate(xs, ys, 10)
+
+		eq_(dys.shape, (3, len(dxs)))
+		eq_(dys[2].max(), 1)
+
+	def testView(self):
+		"""
+		Only the view is decimated, with one point beyond it on each side.
+		"""
+
+		xs = N.linspace(0, 1, 10001)
+		ys = N.cos(50 * xs)
+
+		indices = min_max_indices(xs, ys, 10, x_range=(0.25, 0.5))
+
+		eq_(xs[indices[0]], xs[2499])
+		eq_(xs[indices[-1]], xs[5001])
+		assert len(indices) <= 2 * 10 + 4
+
+	def testGaps(self):
+		"""
+		Runs of NaN stay in the curve.
+		"""
+
+		xs = N.linspace(0, 1, 1001)
+		ys = N.sin(xs)
+		ys[100:200] = N.nan
+
+		dxs, dys = decimate(xs, ys, 10)
+
+		gap = dxs[N.isnan(dys)]
+
+		eq_(gap[0], xs[100])
+		assert gap[-1] <= xs[199]
+		eq_(N.count_nonzero((dxs > xs[100]) & (dxs < gap[-1]) & ~N.isnan(dys)), 0)
+
+	def testGapEdges(self):
+		"""
+		The points on either side of a gap are kept, so it doesn't widen.
+		"""
+
+		xs = N.linspace(0, 1, 1001)
+		ys = N.sin(10 * xs)
+		ys[505:507] = N.nan
+
+		indices = min_max_indices(xs, ys, 10)
+
+		assert set([504, 505, 507]) <= set(indices.tolist())
+		assert 506 not in indices
+
+	def testEmptyCurve(self):
+		"""
+		Nothing to decimate.
+		"""
+
+		eq_(min_max_indices([], [], 10).tolist(), [])
+
+		dxs, dys = decimate([], [], 10)
+
+		eq_(len(dxs), 0)
+		eq_(len(dys), 0)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,106 @@
+from nose.tools import eq_
+from unittest2 import main, TestCase
+
+import numpy as N
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+
+from boltzmannizer.science.boltzmann_distribution import BoltzmannDistribution
+from boltzmannizer.science.ensemble import BoltzmannEnsemble
+from boltzmannizer.science.moments import MOMENTS_DTYPE
+
+
+class BoltzmannEnsembleTest(TestCase):
+	def setUp(self):
+		self.bds = [
+				BoltzmannDistribution(0.5, [1, 2, 3], [3, 2, 1]),
+				BoltzmannDistribution(1, [], []),
+				BoltzmannDistribution(0.695031, [1234, 2341, 3412], [5, 3, 1]),
+				BoltzmannDistribution(2, [-7], [4]),
+				]
+
+	def testMatchesMembers(self):
+		"""
+		The quantities agree with those of the individual distributions.
+		"""
+
+		ensemble = BoltzmannEnsemble(self.bds)
+		Ts = N.array([0, 0.1, 2, 300, 5000])
+
+		eq_(len(ensemble), 4)
+		assert_array_equal(ensemble.offsets, [0, 3, 3, 6, 7])
+
+		moments = ensemble.moments(Ts)
+
+		eq_(moments.shape, (4, 5))
+
+		for i, bd in enumerate(self.bds):
+			expected = bd.moments(Ts)
+
+			for name in MOMENTS_DTYPE.names:
+				assert_array_almost_equal(moments[name][i], expected[name])
+
+		for ps, bd in zip(ensemble.ps(Ts), self.bds):
+			assert_array_almost_equal(ps, bd.ps(Ts))
+
+		assert_array_almost_equal(ensemble.energy(2), [bd.energy(2) for bd in self.bds])
+
+	def testBlocks(self):
+		"""
+		Small blocks give the same answer as one big block.
+		"""
+
+		ensemble = BoltzmannEnsemble(self.bds)
+		Ts = N.linspace(0, 1000, 11)
+
+		expected = ensemble.heat_capacity(Ts)
+
+		ensemble = BoltzmannEnsemble(self.bds)
+		ensemble.MAX_BLOCK_ELEMENTS = 1
+
+		assert_array_almost_equal(ensemble.heat_capacity(Ts), expected)
+
+	def testGroups(self):
+		"""
+		Members are packed within the bound, and big or out-of-core members are
+		evaluated on their own.
+		"""
+
+		bds = self.bds + [BoltzmannDistribution(1, N.arange(10), N.ones(10)),
+				BoltzmannDistribution(1, N.arange(3), [1, 2, 3], chunk_size=2)]
+		Ts = N.linspace(0, 10, 7)
+
+		ensemble = BoltzmannEnsemble(bds)
+		ensemble.MAX_BLOCK_ELEMENTS = 4
+
+		packs, separate, empty = ensemble._groups()
+
+		eq_([indices.tolist() for indices, _ in packs], [[0], [2, 3]])
+		eq_(separate, [4, 5])
+		eq_(empty.tolist(), [1])
+
+		for _, pack in packs:
+			assert pack.num_levels <= 4
+
+		moments = ensemble.moments(Ts)
+
+		for i, bd in enumerate(bds):
+			assert_array_almost_equal(moments['C_V'][i], bd.heat_capacity(Ts))
+
+		for ps, bd in zip(ensemble.ps(Ts), bds):
+			assert_array_almost_equal(ps, bd.ps(Ts))
+
+	def testEmpty(self):
+		"""
+		No members, or no levels at all.
+		"""
+
+		eq_(BoltzmannEnsemble([]).energy(N.arange(3)).shape, (0, 3))
+
+		ensemble = BoltzmannEnsemble(self.bds[1:2])
+
+		assert_array_equal(ensemble.Z(N.arange(3)), [[0, 0, 0]])
+		eq_(ensemble.ps(1)[0].shape, (0,))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,307 @@
+from nose.tools import eq_
+import os
+from os import listdir
+from os.path import join
+from shutil import rmtree
+from subprocess import PIPE, Popen
+from sys import executable
+from tempfile import mkdtemp
+from unittest2 import main, TestCase
+
+import numpy as N
+from numpy.testing import assert_array_equal
+
+from boltzmannizer.science.boltzmann_distribution import BoltzmannDistribution, NonIncreasingEnergies
+from boltzmannizer.science.level_files import (_JSONStream, BINARY_ALIGNMENT, BinaryLevelWriter, convert, InvalidFormat,
+		is_binary, JSONLevelWriter, read_binary, read_columns, read_json, write_binary, write_json)
+
+
+TEST_DATA = join('tests', 'data')
+
+
+class LevelFilesTest(TestCase):
+	def setUp(self):
+		self.tmp_dir = mkdtemp()
+
+	def tearDown(self):
+		rmtree(self.tmp_dir)
+
+	def testRoundTrip(self):
+		"""
+		JSON to binary and back again.
+		"""
+
+		path_json = join(TEST_DATA, 'test1.json')
+		path_bin = join(self.tmp_dir, 'test1.bin')
+		path_json2 = join(self.tmp_dir, 'test1.json')
+
+		convert(path_json, path_bin, binary=True)
+
+		self.assertTrue(is_binary(path_bin))
+		self.assertFalse(is_binary(path_json))
+
+		data = read_binary(path_bin)
+
+		eq_(data.k_B, 0.695031)
+		eq_(data.units, {'energy': 'cm^-1', 'temperature': 'K'})
+		assert_array_equal(data.energies, [1234, 2341, 3412])
+		assert_array_equal(data.degeneracies, [5, 3, 1])
+		self.assertIsInstance(data.energies, N.memmap)
+		eq_(data.energies.offset % BINARY_ALIGNMENT, 0)
+		eq_(data.degeneracies.offset % BINARY_ALIGNMENT, 0)
+
+		convert(path_bin, path_json2, binary=False)
+
+		data, expected = read_json(path_json2), read_json(path_json)
+
+		eq_((data.k_B, data.units), (expected.k_B, expected.units))
+		assert_array_equal(data.energies, expected.energies)
+		assert_array_equal(data.degeneracies, expected.degeneracies)
+
+	def testFromFile(self):
+		"""
+		Binary files are memory-mapped and evaluated out of core.
+		"""
+
+		path = join(self.tmp_dir, 'levels.bin')
+		energies = N.linspace(0, 10, 1000)
+
+		write_binary(path, 2, energies, N.ones(1000, dtype=int), None)
+
+		bd = BoltzmannDistribution.from_file(path, chunk_size=64)
+		bd_memory = BoltzmannDistribution(2, energies, N.ones(1000, dtype=int))
+
+		eq_(bd.filename, 'levels')
+		eq_(bd.chunk_size, 64)
+		self.assertIsNone(bd.units)
+		self.assertAlmostEqual(bd.energy(3), bd_memory.energy(3))
+
+		eq_(BoltzmannDistribution.from_file(path).chunk_size, BoltzmannDistribution.DEFAULT_CHUNK_SIZE)
+
+	def testEmpty(self):
+		"""
+		No levels in either format.
+		"""
+
+		path_bin = join(self.tmp_dir, 'empty.bin')
+		path_json = join(self.tmp_dir, 'empty.json')
+
+		write_binary(path_bin, 1, [], N.zeros(0, dtype=int))
+		write_json(path_json, 1, [], [])
+
+		eq_(len(read_binary(path_bin).energies), 0)
+		eq_(len(read_json(path_json).energies), 0)
+
+	def testStreaming(self):
+		"""
+		Parse JSON through a tiny window.
+		"""
+
+		path = join(self.tmp_dir, 'levels.json')
+
+		with open(path, 'w') as f:
+			f.write('{"levels":[[0,2],\n[1.5],  [2.25 , 3.0] ,[3e1,10000000000000000000000]\n] ,')
+			f.write('"format_version":1, "units": {"energy": "eV", "temperature": "K"}, "k_B" : 8.6173e-5}\n')
+
+		for read_size in [1, 2, 3, 5, 8, 13, 2 ** 16]:
+			_JSONStream.READ_SIZE = read_size
+
+			try:
+				data = read_json(path)
+			finally:
+				_JSONStream.READ_SIZE = 2 ** 16
+
+			eq_(data.k_B, 8.6173e-5)
+			eq_(data.units, {'energy': 'eV', 'temperature': 'K'})
+			assert_array_equal(data.energies, [0, 1.5, 2.25, 30])
+			eq_(list(data.degeneracies), [2, 1, 3, 10 ** 22])
+
+		# Brackets after the levels don't stop them being decoded in bulk.
+		with open(path, 'w') as f:
+			f.write('{"levels": [' + ', '.join('[{0}, 1]'.format(i) for i in xrange(1000)) + '],')
+			f.write(' "extra": [1, [2, 3]], "note": "a]", "format_version": 1, "k_B": 1}')
+
+		value = _JSONStream.value
+		calls = []
+
+		def counted(stream):
+			calls.append(None)
+
+			return value(stream)
+
+		_JSONStream.value = counted
+
+		try:
+			data = read_json(path)
+		finally:
+			_JSONStream.value = value
+
+		assert_array_equal(data.energies, N.arange(1000))
+		# Only the five keys and the four other values.
+		eq_(len(calls), 9)
+
+		# All ordinary levels give ordinary arrays.
+		data = read_json(join(TEST_DATA, 'test1.json'))
+
+		eq_(data.energies.dtype, N.dtype(float))
+		eq_(data.degeneracies.dtype, N.dtype(int))
+		assert_array_equal(data.degeneracies, [5, 3, 1])
+
+	def testWriters(self):
+		"""
+		Levels written a chunk at a time come back whole.
+		"""
+
+		chunks = [([1, 2], [1, 2]), ([], []), ([3], [3]), ([4, 5], [4.5, 5])]
+		units = {'energy': 'eV', 'temperature': 'K'}
+
+		path_json = join(self.tmp_dir, 'levels.json')
+		path_bin = join(self.tmp_dir, 'levels.bin')
+
+		with JSONLevelWriter(path_json, 0.5, units) as json_writer:
+			with BinaryLevelWriter(path_bin, 0.5, units) as binary_writer:
+				for energies, degeneracies in chunks:
+					json_writer.write(energies, degeneracies)
+					binary_writer.write(energies, degeneracies)
+
+		eq_(binary_writer.num_levels, 5)
+
+		for data in [read_json(path_json), read_binary(path_bin)]:
+			eq_(data.k_B, 0.5)
+			eq_(data.units, units)
+			eq_(data.energies.tolist(), [1, 2, 3, 4, 5])
+			# The integers become floating point after the fact.
+			eq_(data.degeneracies.tolist(), [1, 2, 3, 4.5, 5])
+
+		eq_(read_binary(path_bin).degeneracies.dtype, N.dtype('<f8'))
+
+		with BinaryLevelWriter(path_bin, 1) as binary_writer:
+			pass
+
+		data = read_binary(path_bin)
+
+		eq_(len(data.energies), 0)
+		eq_(data.units, None)
+
+	def testAbort(self):
+		"""
+		Writers interrupted by an exception leave nothing behind.
+		"""
+
+		for writer_class in [JSONLevelWriter, BinaryLevelWriter]:
+			path = join(self.tmp_dir, 'levels')
+
+			with self.assertRaises(NonIncreasingEnergies):
+				with writer_class(path, 1) as writer:
+					for energies, degeneracies in read_columns(['1 1', '2 1', '1 1'], 0, 1, chunk_size=1):
+						writer.write(energies, degeneracies)
+
+			eq_(listdir(self.tmp_dir), [])
+
+	def testCol2JSON(self):
+		"""
+		col2json.py doesn't leave a truncated file for bad input.
+		"""
+
+		env = dict(os.environ, PYTHONPATH=os.getcwd())
+
+		for extra in [[], ['--binary']]:
+			path = join(self.tmp_dir, 'levels')
+			process = Popen([executable, join('bin', 'col2json.py'), '1', '2', '-o', path] + extra,
+					stdin=PIPE, stdout=PIPE, stderr=PIPE, env=env)
+			process.communicate('1 1\n2 1\n1 1\n')
+
+			self.assertNotEqual(process.returncode, 0)
+			eq_(listdir(self.tmp_dir), [])
+
+		process = Popen([executable, join('bin', 'col2json.py'), '1', '2', '-o', path],
+				stdin=PIPE, stdout=PIPE, stderr=PIPE, env=env)
+		process.communicate('1 1\n2 1\n')
+
+		eq_(process.returncode, 0)
+		eq_(read_json(path).energies.tolist(), [1, 2])
+
+	def testColumns(self):
+		"""
+		Column data is merged by value, across chunks.
+		"""
+
+		lines = ['# not data', '1.0 x 2', '1.00 x 3', '', '2 x 1', '3e0 x 4', '3 x 1', '4 x 1']
+
+		for chunk_size in [1, 2, 3, 100]:
+			chunks = list(read_columns(lines[1:], 0, 2, chunk_size=chunk_size))
+
+			eq_(N.concatenate([c[0] for c in chunks]).tolist(), [1, 2, 3, 4])
+			eq_(N.concatenate([c[1] for c in chunks]).tolist(), [5, 1, 5, 1])
+
+		chunks = list(read_columns(['1', '2'], 0))
+
+		eq_(N.concatenate([c[1] for c in chunks]).tolist(), [1, 1])
+
+		with self.assertRaises(NonIncreasingEnergies):
+			list(read_columns(['2 1', '1 1'], 0, 1, chunk_size=1))
+
+	def testInvalidJSON(self):
+		"""
+		Broken JSON files.
+		"""
+
+		path = join(self.tmp_dir, 'broken.json')
+
+		def check(contents, exc, message=None):
+			with open(path, 'w') as f:
+				f.write(contents)
+
+			for read_size in [1, 4, 2 ** 16]:
+				_JSONStream.READ_SIZE = read_size
+
+				try:
+					with self.assertRaises(exc) as cm:
+						read_json(path)
+				finally:
+					_JSONStream.READ_SIZE = 2 ** 16
+
+				if message is not None:
+					eq_(str(cm.exception), message)
+
+		check('{"format_version": 1, "k_B": 1, "levels": [[1, 2], [], [3]]}', InvalidFormat, 'Missing energy in level 1')
+		check('{"format_version": 1, "k_B": 1, "levels": [[1, 2], 5]}', InvalidFormat, 'Level 1 is not a list')
+		check('{"format_version": 2, "k_B": 1, "levels": []}', InvalidFormat)
+		check('{"format_version": 1, "levels": []}', InvalidFormat)
+		check('{"format_version": 1, "k_B": 1}', InvalidFormat)
+		check('{"format_version": 1, "k_B": 1, "levels": [[1, 2],, [3]]}', ValueError)
+		check('{"format_version": 1, "k_B": 1, "levels": [[1, 2]]', ValueError)
+		check('{"format_version": 1, "k_B": 1, "levels": []} []', ValueError)
+
+	def testInvalid(self):
+		"""
+		Broken binary files.
+		"""
+
+		path = join(self.tmp_dir, 'broken.bin')
+
+		with open(path, 'wb') as f:
+			f.write(b'BOLTZLVL\x05\0\0\0\0\0\0\0{"a":')
+
+		with self.assertRaises(InvalidFormat):
+			read_binary(path)
+
+		with self.assertRaises(InvalidFormat):
+			read_binary(join(TEST_DATA, 'test1.json'))
+
+		with self.assertRaises(ValueError):
+			write_binary(path, 1, [1], [10 ** 400])
+
+		# Cut off partway through the last column.
+		write_binary(path, 1, [1, 2, 3], [1, 1, 1])
+
+		with open(path, 'r+b') as f:
+			f.seek(-1, os.SEEK_END)
+			f.truncate()
+
+		with self.assertRaises(InvalidFormat):
+			read_binary(path)
+
+
+if __name__ == '__main__':
+	main()
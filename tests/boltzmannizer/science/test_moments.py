@@ -0,0 +1,127 @@
+from __future__ import division
+
+from math import exp, log
+from nose.tools import assert_almost_equal, eq_
+from unittest2 import main, TestCase
+
+import numpy as N
+from numpy.testing import assert_array_almost_equal
+
+from boltzmannizer.science.boltzmann_distribution import BoltzmannDistribution
+from boltzmannizer.science.moments import MOMENTS_DTYPE, thermodynamic_moments
+
+
+def _chunker(shifted_energies, log_degeneracies, size):
+	def chunks(Ts):
+		for start in xrange(0, len(shifted_energies), size):
+			chunk = slice(start, start + size)
+
+			yield chunk, shifted_energies[chunk], log_degeneracies[chunk]
+
+	return chunks
+
+
+class ThermodynamicMomentsTest(TestCase):
+	def testChunks(self):
+		"""
+		Splitting the levels into chunks doesn't change the result.
+		"""
+
+		N.random.seed(0)
+
+		shifted_energies = N.concatenate([[0], N.cumsum(N.random.uniform(0.1, 2, 99))])
+		log_degeneracies = N.log(N.random.randint(1, 10, 100))
+		Ts = N.array([0, 0.01, 0.5, 3, 40, 1e4])
+
+		whole = thermodynamic_moments(0.5, 7, _chunker(shifted_energies, log_degeneracies, 100), Ts, 100)
+
+		for size in [1, 7, 30]:
+			for temperature_step in [1, 4]:
+				chunked = thermodynamic_moments(0.5, 7, _chunker(shifted_energies, log_degeneracies, size), Ts, temperature_step)
+
+				for name in MOMENTS_DTYPE.names:
+					assert_array_almost_equal(chunked[name], whole[name])
+
+	def testPairwise(self):
+		"""
+		Merging many chunks doesn't accumulate much rounding error.
+		"""
+
+		num_levels = 2 ** 12
+		# Equally spaced levels, so that infinite temperature gives a known
+		# mean.
+		shifted_energies = N.arange(num_levels) * 0.1
+		log_degeneracies = N.zeros(num_levels)
+
+		result = thermodynamic_moments(1, 0, _chunker(shifted_energies, log_degeneracies, 1), N.array([N.inf]), 1)
+
+		self.assertLess(abs(result['U'][0] / (0.1 * (num_levels - 1) / 2) - 1), 1e-14)
+		self.assertLess(abs(result['log_Z'][0] - log(num_levels)), 1e-12)
+
+	def testZeroTemperature(self):
+		"""
+		Everything is in the ground state.
+		"""
+
+		bd = BoltzmannDistribution(1, [2, 3, 4], [2, 1, 1])
+
+		m = bd.moments(0)
+
+		eq_(m['log_Z'], -N.inf)
+		eq_(m['U'], 2)
+		eq_(m['E_sq'], 4)
+		eq_(m['var'], 0)
+		eq_(m['C_V'], 0)
+		# The ground state has all the probability, degenerate or not.
+		eq_(m['S'], 0)
+
+	def testVariancePrecision(self):
+		"""
+		The heat capacity survives a large energy offset.
+		"""
+
+		offset = 1e9
+		bd = BoltzmannDistribution(1, [offset, offset + 1], [1, 1])
+
+		p = 1 / (1 + exp(1))
+
+		m = bd.moments(1)
+
+		assert_almost_equal(m['U'], offset + p)
+		assert_almost_equal(m['var'], p * (1 - p))
+		assert_almost_equal(bd.heat_capacity(1), p * (1 - p))
+
+	def testCovariance(self):
+		"""
+		The covariance of the energy and log-degeneracy matches the
+		probabilities.
+		"""
+
+		bd = BoltzmannDistribution(0.5, [1, 2, 3, 5], [3, 1, 4, 1])
+
+		for T in [0.3, 2, 50]:
+			ps = bd.ps(T)
+			log_gs = N.log(bd.degeneracies)
+
+			mean = N.dot(ps, bd.energies)
+			mean_log_g = N.dot(ps, log_gs)
+
+			assert_almost_equal(bd.moments(T)['cov_E_log_g'], N.dot(ps, (bd.energies - mean) * (log_gs - mean_log_g)))
+
+	def testArrays(self):
+		"""
+		Records come back in the shape of the temperatures.
+		"""
+
+		bd = BoltzmannDistribution(0.5, [1, 2, 3], [3, 2, 1])
+
+		m = bd.moments(N.array([[1, 2], [3, 4]]))
+
+		eq_(m.shape, (2, 2))
+		assert_almost_equal(m['U'][0, 1], 1.259985783287049)
+		assert_almost_equal(m['S'][0, 1], 0.315191678445456)
+		assert_almost_equal(m['C_V'][0, 1], 0.131157060934439)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,61 @@
+from nose.tools import eq_
+from unittest2 import main, TestCase
+
+import numpy as N
+from numpy.testing import assert_array_almost_equal
+
+from boltzmannizer.science.boltzmann_distribution import BoltzmannDistribution
+from boltzmannizer.science.population_map import population_map
+
+
+class PopulationMapTest(TestCase):
+	def testIndividual(self):
+		"""
+		Few levels get a row each.
+		"""
+
+		populations = N.array([[0.5, 1], [0.5, 0], [0, 1e-9]])
+		edges, rows, num_dropped = population_map([0, 2, 3], populations)
+
+		assert_array_almost_equal(edges, [-1, 1, 3])
+		assert_array_almost_equal(rows, populations[:2])
+		eq_(num_dropped, 1)
+
+		edges, rows, num_dropped = population_map([5], [[1]])
+
+		assert_array_almost_equal(edges, [4.5, 5.5])
+
+		edges, rows, num_dropped = population_map([5], [[0]])
+
+		eq_(len(edges), 0)
+		eq_(rows.shape, (0, 1))
+
+	def testMerged(self):
+		"""
+		Many levels are merged into rows, conserving the population.
+		"""
+
+		bd = BoltzmannDistribution(1, N.linspace(0, 100, 1000), N.ones(1000))
+		Ts = N.linspace(1, 1000, 20)
+		populations = bd.ps(Ts)
+
+		edges, rows, num_dropped = population_map(bd.energies, populations, max_rows=50, tolerance=0)
+
+		eq_(num_dropped, 0)
+		eq_(len(edges), 51)
+		eq_(rows.shape, (50, 20))
+		assert_array_almost_equal(edges[[0, -1]], [0, 100])
+		assert_array_almost_equal(rows.sum(axis=0), N.ones(20))
+		# 20 levels per row.
+		assert_array_almost_equal(rows[0], populations[:20].sum(axis=0))
+		assert_array_almost_equal(rows[-1], populations[-20:].sum(axis=0))
+
+		# Levels that are never populated don't take up rows.
+		edges, rows, num_dropped = population_map(bd.energies, bd.ps(N.linspace(0.1, 1, 20)), max_rows=50)
+
+		assert num_dropped > 800
+		assert edges[-1] < 20
+
+
+if __name__ == '__main__':
+	main()
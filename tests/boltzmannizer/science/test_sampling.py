@@ -0,0 +1,58 @@
+from nose.tools import eq_
+from unittest2 import main, TestCase
+
+import numpy as N
+
+from boltzmannizer.science.boltzmann_distribution import BoltzmannDistribution
+from boltzmannizer.science.ensemble import BoltzmannEnsemble
+from boltzmannizer.science.sampling import adaptive_temperatures
+
+
+class AdaptiveTemperaturesTest(TestCase):
+	def testSchottkyPeak(self):
+		"""
+		A sharp peak is resolved better than by even spacing.
+		"""
+
+		bds = [BoltzmannDistribution(1, [0, 10], [1, 3]), BoltzmannDistribution(1, N.arange(50), N.ones(50))]
+		ensemble = BoltzmannEnsemble(bds)
+
+		calls = []
+
+		def f(Ts):
+			calls.append(len(Ts))
+
+			return ensemble.heat_capacity(Ts)
+
+		Ts, yss = adaptive_temperatures(f, 0, 100, max_evaluations=200)
+
+		eq_(len(Ts), 200)
+		eq_(sum(calls), 200)
+		eq_(yss.shape, (2, 200))
+		self.assertTrue((N.diff(Ts) > 0).all())
+		eq_((Ts[0], Ts[-1]), (0, 100))
+
+		reference_Ts = N.linspace(0, 100, 10001)
+		reference = ensemble.heat_capacity(reference_Ts)
+		even_Ts = N.linspace(0, 100, 200)
+		even = ensemble.heat_capacity(even_Ts)
+
+		for i in xrange(len(bds)):
+			adaptive_error = abs(N.interp(reference_Ts, Ts, yss[i]) - reference[i]).max()
+			even_error = abs(N.interp(reference_Ts, even_Ts, even[i]) - reference[i]).max()
+
+			self.assertLess(adaptive_error, even_error / 10)
+
+	def testFlat(self):
+		"""
+		Straight lines need no refinement beyond checking the midpoints.
+		"""
+
+		Ts, ys = adaptive_temperatures(lambda Ts: 2 * Ts + 1, 0, 10, num_initial=5)
+
+		eq_(Ts.tolist(), [0, 1.25, 2.5, 3.75, 5, 6.25, 7.5, 8.75, 10])
+		eq_(ys.tolist(), (2 * Ts + 1).tolist())
+
+
+if __name__ == '__main__':
+	main()
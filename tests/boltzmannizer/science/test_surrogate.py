@@ -0,0 +1,82 @@
+from nose.tools import eq_
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest2 import main, TestCase
+
+import numpy as N
+from numpy.testing import assert_array_equal
+
+from boltzmannizer.science.boltzmann_distribution import BoltzmannDistribution
+from boltzmannizer.science.surrogate import ChebyshevSurrogate
+
+
+class ChebyshevSurrogateTest(TestCase):
+	def setUp(self):
+		N.random.seed(0)
+
+		self.bd = BoltzmannDistribution(0.5, N.cumsum(N.random.uniform(1, 20, 200)), N.random.randint(1, 5, 200))
+
+	def testAccuracy(self):
+		"""
+		The surrogates are as accurate as requested, and know it.
+		"""
+
+		Ts = N.random.uniform(0, 500, 1000)
+
+		for name in ['energy', 'entropy', 'heat_capacity']:
+			f = getattr(self.bd, name)
+			surrogate = ChebyshevSurrogate.fit(f, 0, 500, rtol=1e-9)
+
+			expected = f(Ts)
+			scale = abs(expected).max()
+			error = abs(surrogate(Ts) - expected).max()
+
+			self.assertLess(error, 1e-8 * scale)
+			self.assertLess(surrogate.max_error, 1e-8 * scale)
+
+			eq_(surrogate.domain, (0, 500))
+
+	def testShapes(self):
+		"""
+		Scalars and arrays of any shape are accepted, and temperatures out of
+		range give NaN.
+		"""
+
+		surrogate = ChebyshevSurrogate.fit(self.bd.energy, 10, 20)
+
+		self.assertAlmostEqual(surrogate(15), self.bd.energy(15))
+
+		result = surrogate(N.array([[10, 20], [5, 25]]))
+
+		eq_(result.shape, (2, 2))
+		self.assertAlmostEqual(result[0, 1], self.bd.energy(20))
+		self.assertTrue(N.isnan(result[1]).all())
+
+	def testSerialization(self):
+		"""
+		Surrogates survive a round trip through a file.
+		"""
+
+		surrogate = ChebyshevSurrogate.fit(self.bd.heat_capacity, 0, 100)
+		Ts = N.linspace(0, 100, 50)
+
+		tmp_dir = mkdtemp()
+
+		try:
+			path = join(tmp_dir, 'surrogate.json')
+
+			surrogate.save(path)
+			loaded = ChebyshevSurrogate.load(path)
+		finally:
+			rmtree(tmp_dir)
+
+		assert_array_equal(loaded(Ts), surrogate(Ts))
+		assert_array_equal(loaded.errors, surrogate.errors)
+
+		with self.assertRaises(ValueError):
+			ChebyshevSurrogate.from_dict({'format_version': 2})
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,113 @@
+from nose.tools import eq_
+from os.path import join
+from shutil import rmtree
+from subprocess import check_output
+from sys import executable
+from tempfile import mkdtemp
+from unittest2 import main, TestCase
+
+import csv
+import numpy as N
+from numpy.testing import assert_array_almost_equal
+
+from boltzmannizer.compute import main as compute_main, temperature_grid
+from boltzmannizer.science.boltzmann_distribution import BoltzmannDistribution
+
+
+TEST_DATA = join('tests', 'data')
+
+
+class ComputeTest(TestCase):
+	def setUp(self):
+		self.tmp_dir = mkdtemp()
+
+	def tearDown(self):
+		rmtree(self.tmp_dir)
+
+	def testGrids(self):
+		"""
+		Temperature grids come in several kinds.
+		"""
+
+		assert_array_almost_equal(temperature_grid(linear=(0, 10, 3)), [0, 5, 10])
+		assert_array_almost_equal(temperature_grid(log=(1, 100, 3)), [1, 10, 100])
+		assert_array_almost_equal(temperature_grid(explicit=[3, 1]), [3, 1])
+
+		with self.assertRaises(ValueError):
+			temperature_grid(log=(0, 100, 3))
+
+		with self.assertRaises(ValueError):
+			temperature_grid(linear=(0, 10, 3), explicit=[1])
+
+	def testOutput(self):
+		"""
+		Tables are written in both formats, skipping bad files.
+		"""
+
+		path = join(TEST_DATA, 'test1.json')
+		missing = join(self.tmp_dir, 'missing.json')
+		bd = BoltzmannDistribution.from_file(path)
+
+		csv_path = join(self.tmp_dir, 'out.csv')
+		status = compute_main([path, missing, '--temperatures', '100', '1000', '--quantities', 'energy', 'Z',
+				'-o', csv_path, '--processes', '1'])
+
+		eq_(status, 1)
+
+		with open(csv_path) as f:
+			rows = list(csv.reader(f))
+
+		eq_(rows[0], ['file', 'T', 'energy', 'Z'])
+		eq_(len(rows), 3)
+		eq_([row[0] for row in rows[1:]], [path, path])
+		assert_array_almost_equal([float(row[2]) for row in rows[1:]], bd.energy(N.array([100, 1000])))
+
+		npz_path = join(self.tmp_dir, 'out.npz')
+		status = compute_main([path, '--log', '1', '1000', '4', '-o', npz_path, '--processes', '1'])
+
+		eq_(status, 0)
+
+		data = N.load(npz_path)
+
+		assert_array_almost_equal(data['T'], [1, 10, 100, 1000])
+		eq_(data['files'].tolist(), [path])
+		assert_array_almost_equal(data['heat_capacity'][0], bd.heat_capacity(data['T']))
+
+	def testDecimate(self):
+		"""
+		Decimated tables keep the extremes of every curve.
+		"""
+
+		path = join(TEST_DATA, 'test1.json')
+		bd = BoltzmannDistribution.from_file(path)
+
+		npz_path = join(self.tmp_dir, 'out.npz')
+		status = compute_main([path, '--linear', '1', '1000', '10000', '--quantities', 'heat_capacity',
+				'--decimate', '20', '-o', npz_path, '--processes', '1'])
+
+		eq_(status, 0)
+
+		data = N.load(npz_path)
+		Ts = N.linspace(1, 1000, 10000)
+
+		assert len(data['T']) <= 2 * 20 + 2
+		eq_(data['T'][0], 1)
+		eq_(data['T'][-1], 1000)
+		assert_array_almost_equal(data['heat_capacity'][0].max(), bd.heat_capacity(Ts).max())
+
+		with self.assertRaises(SystemExit):
+			compute_main([path, '--temperatures', '2', '1', '--decimate', '20', '-o', npz_path])
+
+	def testHeadless(self):
+		"""
+		Nothing from the GUI is imported.
+		"""
+
+		output = check_output([executable, '-c',
+				'import sys, boltzmannizer.compute; print sorted(m for m in sys.modules if m.startswith("boltzmannizer.gui") or m in ["wx", "matplotlib"])'])
+
+		eq_(output.strip(), '[]')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,79 @@
+from json import loads
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_
+from subprocess import check_output
+from sys import executable
+from unittest2 import main, TestCase
+
+
+# Seconds allowed for importing the modules, beyond the time taken by their
+# dependencies.
+IMPORT_BUDGET = 1.0
+
+# Modules which must not be imported along with the given ones.
+HEAVY_MODULES = ['matplotlib', 'mpl_toolkits', 'scipy', 'wx']
+
+SCRIPT = '''
+import json, sys, time
+
+start = time.time()
+{setup}
+setup_time = time.time() - start
+
+start = time.time()
+{imports}
+import_time = time.time() - start
+
+heavy = sorted(m for m in sys.modules if m.split('.')[0] in {heavy!r})
+
+print json.dumps({{'time': import_time, 'setup_time': setup_time, 'heavy': heavy}})
+'''
+
+
+def _measure(setup, imports):
+	"""
+	Import some modules in a fresh interpreter, after setup, and report how
+	long that took and which heavy modules came along.
+	"""
+
+	script = SCRIPT.format(setup=setup, imports=imports, heavy=HEAVY_MODULES)
+
+	return loads(check_output([executable, '-c', script]))
+
+
+class ImportTest(TestCase):
+	def testScience(self):
+		"""
+		The library needs nothing but NumPy, and imports quickly.
+		"""
+
+		result = _measure('import numpy', '\n'.join([
+				'import boltzmannizer.science.batch',
+				'import boltzmannizer.science.boltzmann_distribution',
+				'import boltzmannizer.science.ensemble',
+				'import boltzmannizer.science.sampling',
+				'import boltzmannizer.science.surrogate',
+				'import boltzmannizer.compute',
+				]))
+
+		eq_(result['heavy'], [])
+		self.assertLess(result['time'], IMPORT_BUDGET)
+
+	def testGUI(self):
+		"""
+		matplotlib waits for the first plot.
+		"""
+
+		try:
+			import wx
+		except ImportError:
+			raise SkipTest('wxPython is not available')
+
+		result = _measure('import numpy, wx', 'import boltzmannizer.gui.app')
+
+		eq_([m for m in result['heavy'] if m.split('.')[0] != 'wx'], [])
+		self.assertLess(result['time'], IMPORT_BUDGET)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,125 @@
+from nose.tools import eq_
+from os import listdir, makedirs
+from os.path import isdir, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest2 import main, TestCase
+
+from boltzmannizer.ingest import content_hash, ingest_files, load_manifest, main as ingest_main
+from boltzmannizer.science.level_files import read_binary, read_json
+
+
+class IngestTest(TestCase):
+	def setUp(self):
+		self.tmp_dir = mkdtemp()
+		self.in_dir = join(self.tmp_dir, 'in')
+		self.out_dir = join(self.tmp_dir, 'out')
+
+		self.write('a.dat', '0.0 1\n1.0 2\n1.00 3\n2.5 4\n')
+		self.write('b.dat', '\n\n')
+		self.write('c.dat', '1.0 1\n0.0 1\n')
+
+	def tearDown(self):
+		rmtree(self.tmp_dir)
+
+	def write(self, name, content):
+		if not isdir(self.in_dir):
+			makedirs(self.in_dir)
+
+		with open(join(self.in_dir, name), 'w') as f:
+			f.write(content)
+
+	def ingest(self, names, **kwargs):
+		kwargs.setdefault('processes', 1)
+
+		results = ingest_files([join(self.in_dir, name) for name in names], self.out_dir, 0, 1, **kwargs)
+
+		return dict((result.name, result) for result in results)
+
+	def testIngest(self):
+		"""
+		Files are converted and described in the manifest.
+		"""
+
+		results = self.ingest(['a.dat', 'c.dat'], k_B=0.5, units=None)
+
+		eq_(results['a.json'].error, None)
+		assert results['c.json'].error is not None
+		eq_(sorted(listdir(self.out_dir)), ['a.json', 'manifest.json'])
+
+		data = read_json(join(self.out_dir, 'a.json'))
+
+		eq_(data.energies.tolist(), [0, 1, 2.5])
+		eq_(data.degeneracies.tolist(), [1, 5, 4])
+
+		entries = load_manifest(self.out_dir)
+
+		eq_(sorted(entries), ['a.json'])
+		eq_(entries['a.json']['num_levels'], 3)
+		eq_(entries['a.json']['num_states'], 10)
+		eq_(entries['a.json']['energy_range'], [0, 2.5])
+		eq_(entries['a.json']['k_B'], 0.5)
+		eq_(entries['a.json']['units'], None)
+		eq_(entries['a.json']['hash'], content_hash(join(self.in_dir, 'a.dat')))
+
+	def testRerun(self):
+		"""
+		Only changed files are converted again.
+		"""
+
+		self.ingest(['a.dat', 'b.dat'], binary=True)
+
+		results = self.ingest(['a.dat', 'b.dat'], binary=True)
+
+		assert results['a.bin'].skipped
+		assert results['b.bin'].skipped
+
+		self.write('a.dat', '0.0 1\n')
+		results = self.ingest(['a.dat', 'b.dat'], binary=True)
+
+		assert not results['a.bin'].skipped
+		assert results['b.bin'].skipped
+		eq_(read_binary(join(self.out_dir, 'a.bin')).energies.tolist(), [0])
+		eq_(load_manifest(self.out_dir)['b.bin']['energy_range'], None)
+
+		# Different settings or forcing also convert again.
+		assert not self.ingest(['b.dat'], binary=True, k_B=2)['b.bin'].skipped
+		assert not self.ingest(['b.dat'], binary=True, k_B=2, force=True)['b.bin'].skipped
+
+	def testParallel(self):
+		"""
+		Several processes give the same results.
+		"""
+
+		results = self.ingest(['a.dat', 'b.dat', 'c.dat'], processes=3)
+
+		eq_(sorted(results), ['a.json', 'b.json', 'c.json'])
+		eq_(sorted(load_manifest(self.out_dir)), ['a.json', 'b.json'])
+
+	def testDuplicates(self):
+		"""
+		Clashing output names are rejected on the call, before anything is
+		written.
+		"""
+
+		with self.assertRaises(ValueError):
+			ingest_files([join(self.in_dir, 'a.dat'), join(self.tmp_dir, 'a.txt')], self.out_dir, 0, 1)
+
+		self.assertFalse(isdir(self.out_dir))
+
+	def testMain(self):
+		"""
+		The command line takes one-based columns and directories.
+		"""
+
+		status = ingest_main(['1', '2', self.in_dir, '-o', self.out_dir, '--processes', '1'])
+
+		eq_(status, 1)
+		eq_(sorted(load_manifest(self.out_dir)), ['a.json', 'b.json'])
+
+		with self.assertRaises(SystemExit):
+			ingest_main(['1', '2', join(self.in_dir, 'a.dat'), join(self.tmp_dir, 'a.txt'), '-o', self.out_dir])
+
+
+if __name__ == '__main__':
+	main()
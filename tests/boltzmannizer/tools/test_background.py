@@ -0,0 +1,88 @@
+from nose.tools import eq_
+from Queue import Queue
+from threading import Event
+from unittest2 import main, TestCase
+
+from boltzmannizer.tools.background import BackgroundRunner
+
+
+class BackgroundRunnerTest(TestCase):
+	def setUp(self):
+		# Stand-in for an event loop: callbacks are queued up, and only run
+		# when the test says so.
+		self.dispatched = Queue()
+		self.runner = BackgroundRunner(2, dispatch=lambda f, *args: self.dispatched.put((f, args)))
+
+	def tearDown(self):
+		self.runner.close()
+
+	def dispatch(self, num=1):
+		"""
+		Run the next num dispatched callbacks.
+		"""
+
+		for _ in xrange(num):
+			f, args = self.dispatched.get(timeout=10)
+			f(*args)
+
+	def testCallbacks(self):
+		"""
+		Outcomes are handed to the right callbacks, through dispatch.
+		"""
+
+		results = []
+		errors = []
+
+		def fail():
+			raise ValueError('bad')
+
+		task1 = self.runner.submit(lambda x: 2 * x, (3,), on_success=results.append, on_error=errors.append)
+		task2 = self.runner.submit(fail, on_success=results.append, on_error=errors.append)
+
+		eq_(self.runner.num_pending, 2)
+
+		self.dispatch(2)
+
+		eq_(results, [6])
+		eq_([str(e) for e in errors], ['bad'])
+		assert task1.done and task2.done
+		eq_(self.runner.num_pending, 0)
+
+	def testCancel(self):
+		"""
+		Cancelled tasks never call back.
+		"""
+
+		started = Event()
+		release = Event()
+
+		def block():
+			started.set()
+			release.wait(10)
+
+			return 'late'
+
+		results = []
+
+		running = self.runner.submit(block, on_success=results.append)
+		started.wait(10)
+		# This one has finished by the time it is cancelled.
+		finished = self.runner.submit(lambda: 'early', on_success=results.append)
+		f, args = self.dispatched.get(timeout=10)
+
+		self.runner.cancel_all()
+		release.set()
+
+		f(*args)
+		self.runner.close()
+		self.runner._pool.join()
+
+		eq_(results, [])
+		assert running.cancelled and finished.cancelled
+		assert not running.done and not finished.done
+		assert self.dispatched.empty()
+		eq_(self.runner.num_pending, 0)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,160 @@
+from gc import collect
+from nose.tools import eq_
+from unittest2 import main, TestCase
+
+import numpy as N
+
+from boltzmannizer.tools.cache import CacheBudget, cached_method, ResultCache
+
+
+class ResultCacheTest(TestCase):
+	def testEviction(self):
+		"""
+		The least recently used values go first, across all caches.
+		"""
+
+		size = N.zeros(100).nbytes
+		budget = CacheBudget(3 * size + 1000)
+
+		c1 = ResultCache(budget)
+		c2 = ResultCache(budget)
+
+		c1['a'] = N.zeros(100)
+		c2['b'] = N.zeros(100)
+		c1['c'] = N.zeros(100)
+
+		eq_(budget.num_entries, 3)
+
+		# Refresh 'a', so that 'b' is the oldest.
+		c1['a']
+
+		c2['d'] = N.zeros(100)
+
+		eq_(budget.num_entries, 3)
+		eq_(sorted(c1._values), ['a', 'c'])
+		eq_(sorted(c2._values), ['d'])
+
+		# Shrinking the budget evicts immediately.
+		budget.max_bytes = size + 500
+
+		eq_(budget.num_entries, 1)
+		eq_(sorted(c2._values), ['d'])
+
+		# Too big to ever fit.
+		c1['e'] = N.zeros(1000)
+
+		self.assertFalse('e' in c1)
+		eq_(budget.num_entries, 1)
+
+	def testOwnership(self):
+		"""
+		Values are freed along with their cache.
+		"""
+
+		budget = CacheBudget(10 ** 6)
+
+		c1 = ResultCache(budget)
+		c2 = ResultCache(budget)
+
+		c1['a'] = N.zeros(100)
+		c2['a'] = N.zeros(100)
+
+		num_bytes = budget.num_bytes
+
+		del c1
+		collect()
+
+		eq_(budget.num_entries, 1)
+		eq_(budget.num_bytes, num_bytes // 2)
+
+	def testInvalidate(self):
+		"""
+		Values can be dropped by name or all at once.
+		"""
+
+		budget = CacheBudget(10 ** 6)
+		c = ResultCache(budget)
+
+		c['f', 1] = 1
+		c['f', 2] = 2
+		c['g', 1] = 3
+
+		c.invalidate('f')
+
+		eq_(c._values.keys(), [('g', 1)])
+
+		c.invalidate()
+
+		eq_(len(c), 0)
+		eq_(budget.num_entries, 0)
+		eq_(budget.num_bytes, 0)
+
+	def testSizes(self):
+		"""
+		Views are counted with the arrays they keep alive, and keys are counted
+		too.
+		"""
+
+		budget = CacheBudget(10 ** 6)
+		c = ResultCache(budget)
+
+		whole = N.zeros((8, 1000))
+		c['view'] = whole[0]
+
+		self.assertGreaterEqual(budget.num_bytes, whole.nbytes)
+
+		c.invalidate()
+		c[N.ndarray, N.zeros(1000).tobytes()] = 1
+
+		self.assertGreaterEqual(budget.num_bytes, N.zeros(1000).nbytes)
+
+
+class CachedMethodTest(TestCase):
+	def testPerInstance(self):
+		"""
+		Results are cached per instance, and unhashable arguments bypass the
+		cache.
+		"""
+
+		class Recorder(object):
+			def __init__(self, factor):
+				self.factor = factor
+				self.calls = 0
+
+			@cached_method
+			def f(self, x):
+				self.calls += 1
+
+				return self.factor * sum(x) if isinstance(x, list) else self.factor * x
+
+		r1 = Recorder(2)
+		r2 = Recorder(3)
+
+		for _ in xrange(5):
+			eq_(r1.f(1), 2)
+			eq_(r2.f(1), 3)
+
+		eq_((r1.calls, r2.calls), (1, 1))
+
+		for _ in xrange(5):
+			eq_(r1.f([1, 2]), 6)
+
+		eq_(r1.calls, 6)
+
+		# Arrays are cached by value.
+		for _ in xrange(5):
+			eq_(r1.f(N.arange(4)).tolist(), [0, 2, 4, 6])
+
+		eq_(r1.calls, 7)
+
+		eq_(r1.f(N.arange(5)).tolist(), [0, 2, 4, 6, 8])
+		eq_(r1.calls, 8)
+
+		r1._result_cache.invalidate()
+
+		eq_(r1.f(1), 2)
+		eq_(r1.calls, 9)
+
+
+if __name__ == '__main__':
+	main()